@@ -0,0 +1,207 @@
+from helper import document_index, match_sentences
+from diagnostics import (
+    Diagnostic,
+    deduplicate_and_clean,
+    from_improvements,
+    has_conflicts,
+    to_dict,
+)
+from conflicts import count_conflict_path, resolve_conflicts_locally
+from budget import estimate_messages_tokens
+import metrics
+
+
+def analyze_stage(
+    llm,
+    review_text,
+    component_input,
+    base_input,
+    trait_definitions,
+    component_name,
+    on_improvement=None,
+    conflict_resolver="local",
+    match_text=None,
+):
+    """
+    The purpose of this function is to take the text, and use the
+    LLM to generate diagnostics (sentences that need to be improved,
+    improved sentences, comments)
+
+    Args:
+        llm (ResponseGenerator): The language model instance.
+        review_text (str): The text to be analyzed.
+        component_input (dict): The component input specific to the stage. (each tab is specific to a component)
+        base_input (dict): The base input for the LLM (see response_gen)
+        ##--##
+        Sometimes sentences are assigned to two traits - conflict is resolved locally
+        or using LLM2 (see conflict_resolver)
+        ##--##
+        trait_definitions (dict): Trait definitions for conflict resolution.
+        component_name (str): The component name (e.g., "e_component").
+        on_improvement (callable): If given, the response is streamed and this is
+            called with each improvement (trait, comment, sentences, suggestions)
+            as soon as the LLM has generated it.
+        conflict_resolver (str): "local" (default) keeps each sentence under the
+            trait whose definition fits best, "llm" asks the LLM, "auto" asks the
+            LLM only if the local resolver finds a tie (see conflicts).
+        match_text (str): Text the flagged sentences are located in, when
+            review_text is only an excerpt of it (see incremental). Defaults to
+            review_text.
+
+    Returns:
+        dict: Diagnostics (traits_list, comments_list, suggestions_list, sent_list).
+    """
+    with metrics.timer("analyze_stage", component=component_name):
+        # size of the static part of the prompt (base and component inputs)
+        metrics.set_gauge(
+            "prompt_static_tokens",
+            estimate_messages_tokens(base_input + component_input),
+            component=component_name,
+        )
+        with metrics.timer("generate", component=component_name):
+            if on_improvement is None:
+                diagnostics = llm.generate_response(
+                    review_text=review_text,
+                    component_input=component_input,
+                    base_input=base_input,
+                )
+            else:
+                diagnostics = []
+                for improvement in llm.stream_response(
+                    review_text=review_text,
+                    component_input=component_input,
+                    base_input=base_input,
+                ):
+                    on_improvement(improvement)
+                    diagnostics.append(improvement)
+        return diagnose(
+            llm=llm,
+            improvements=diagnostics,
+            review_text=review_text if match_text is None else match_text,
+            trait_definitions=trait_definitions,
+            component_name=component_name,
+            conflict_resolver=conflict_resolver,
+        )
+
+
+def analyze_components(
+    llm,
+    review_text,
+    component_inputs,
+    base_input,
+    trait_definitions,
+    conflict_resolver="local",
+    single_request=True,
+):
+    """
+    Same as analyze_stage for several components at once, with a single LLM
+    request covering all of them (see ResponseGenerator.generate_multi_response)
+    or, with single_request=False, one request per component sent to the
+    backend as one batch (see ResponseGenerator.generate_responses).
+
+    Args:
+        llm (ResponseGenerator): The language model instance.
+        review_text (str): The text to be analyzed.
+        component_inputs (dict): The component inputs keyed by component name.
+        base_input (dict): The base input for the LLM (see response_gen)
+        trait_definitions (dict): Trait definitions for conflict resolution.
+        conflict_resolver (str): See analyze_stage.
+        single_request (bool): One request for all components.
+
+    Returns:
+        dict: Diagnostics (see analyze_stage) keyed by component name.
+    """
+    generate = llm.generate_multi_response if single_request else llm.generate_responses
+    with metrics.timer("generate", component="+".join(component_inputs)):
+        improvements = generate(
+            review_text=review_text,
+            component_inputs=component_inputs,
+            base_input=base_input,
+        )
+    return {
+        component_name: diagnose(
+            llm=llm,
+            improvements=improvements[component_name],
+            review_text=review_text,
+            trait_definitions=trait_definitions,
+            component_name=component_name,
+            conflict_resolver=conflict_resolver,
+        )
+        for component_name in component_inputs
+    }
+
+
+def diagnose(
+    llm,
+    improvements,
+    review_text,
+    trait_definitions,
+    component_name,
+    conflict_resolver="local",
+):
+    """
+    Turn the improvements generated for a component into diagnostics: conflicts
+    between traits are resolved and the flagged sentences are located in the text.
+
+    Args:
+        llm (ResponseGenerator): The language model instance.
+        improvements (list): Improvements as returned by ResponseGenerator.
+        review_text (str): The analyzed text.
+        trait_definitions (dict): Trait definitions for conflict resolution.
+        component_name (str): The component name (e.g., "e_component").
+        conflict_resolver (str): See analyze_stage.
+
+    Returns:
+        dict: Diagnostics (see analyze_stage).
+    """
+    diagnostics = from_improvements(improvements)
+    # check if there are duplicates of sentences identified -- these duplicates need to be resolved
+    # run resolve diagnostics
+    if not has_conflicts(diagnostics):
+        count_conflict_path("none")
+    else:
+        with metrics.timer("resolve_conflicts", component=component_name):
+            resolved_improvements, ambiguous = resolve_conflicts_locally(
+                improvements=improvements,
+                definitions=trait_definitions[component_name],
+            )
+            if conflict_resolver == "llm" or (
+                conflict_resolver == "auto" and ambiguous
+            ):
+                count_conflict_path("llm")
+                resolved_improvements = llm.resolve_conflicts(
+                    gpt_response=improvements,
+                    trait_definitions=trait_definitions,
+                    component=component_name,
+                )
+            else:
+                count_conflict_path("local")
+        diagnostics = from_improvements(resolved_improvements)
+    # the LLM does not always return the exact sentence (partial matches returned) -- find
+    # out the sentence from the text
+    text_sentences = document_index(
+        review_text.replace("<<", "").replace(">>", "")
+    ).sentences
+    with metrics.timer("match_sentences", component=component_name):
+        best_sents, _, matched = match_sentences(
+            sentences=[diagnostic.sentence for diagnostic in diagnostics],
+            text_sentences=text_sentences,
+        )
+    # sentences that could not be found in the text cannot be highlighted or
+    # replaced -- drop them instead of attaching them to an unrelated sentence,
+    # and count them so that a prompt or model returning such sentences shows up
+    found_diagnostics = [
+        Diagnostic(
+            diagnostic.trait, diagnostic.comment, sentence, diagnostic.suggestion
+        )
+        for diagnostic, sentence, found in zip(diagnostics, best_sents, matched)
+        if found
+    ]
+    metrics.count(
+        "unmatched_sentences",
+        len(diagnostics) - len(found_diagnostics),
+        component=component_name,
+    )
+    diagnostics = found_diagnostics
+    # for safety purposes resolve conflicts again -- naively (keep last)
+    return to_dict(deduplicate_and_clean(diagnostics))
@@ -0,0 +1,420 @@
+import os
+import json
+import time
+import asyncio
+import weakref
+import threading
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, OpenAI, DefaultHttpxClient
+import httpx
+from budget import estimate_messages_tokens
+from scheduler import INTERACTIVE, get_shared_scheduler
+
+# size of the keep-alive connection pool shared by all generators
+MAX_CONNECTIONS = 20
+# maximum number of requests of a batch sent concurrently to a remote backend
+MAX_BATCH_WORKERS = 8
+
+# one pooled client per (api key, endpoint) for the whole process -- streamlit
+# sessions and batch jobs reuse the same keep-alive connections instead of
+# paying a TLS handshake per session
+_shared_clients = {}
+_shared_clients_lock = threading.Lock()
+# the async clients are shared per event loop as well: their connections belong
+# to the loop that opened them
+_shared_async_clients = weakref.WeakKeyDictionary()
+
+
+def _pooled_http_limits(max_connections):
+    return httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_connections,
+    )
+
+
+def get_shared_client(api_key, base_url=None, max_connections=MAX_CONNECTIONS):
+    """
+    Return the process-wide OpenAI client for the given key and endpoint.
+    Parameters:
+        api_key (str): OpenAI API key.
+        base_url (str): Endpoint of the chat completions API (None for OpenAI).
+        max_connections (int): Size of the connection pool.
+    Returns:
+        OpenAI: A thread-safe client backed by a pooled, keep-alive HTTP client.
+    """
+    key = (api_key, base_url)
+    with _shared_clients_lock:
+        if key not in _shared_clients:
+            _shared_clients[key] = OpenAI(
+                api_key=api_key,
+                base_url=base_url,
+                http_client=DefaultHttpxClient(
+                    limits=_pooled_http_limits(max_connections)
+                ),
+            )
+        return _shared_clients[key]
+
+
+def get_shared_async_client(api_key, base_url=None, max_connections=MAX_CONNECTIONS):
+    """
+    Return the AsyncOpenAI client of the running event loop for the given key
+    and endpoint (see get_shared_client). Must be called from a coroutine.
+    """
+    loop = asyncio.get_running_loop()
+    key = (api_key, base_url)
+    with _shared_clients_lock:
+        clients = _shared_async_clients.setdefault(loop, {})
+        if key not in clients:
+            clients[key] = AsyncOpenAI(
+                api_key=api_key,
+                base_url=base_url,
+                http_client=DefaultAsyncHttpxClient(
+                    limits=_pooled_http_limits(max_connections)
+                ),
+            )
+        return clients[key]
+
+
+@dataclass
+class Completion:
+    __slots__ = ("content", "usage")
+    # text generated by the model (a piece of it when streamed)
+    content: str
+    # token counts (prompt_tokens, completion_tokens...) or None, see TokenUsage
+    usage: object
+
+
+@dataclass
+class Usage:
+    __slots__ = ("prompt_tokens", "completion_tokens")
+    prompt_tokens: int
+    completion_tokens: int
+
+
+class ChatBackend:
+    """
+    Where ResponseGenerator sends its chat messages. A backend returns the text
+    generated for a list of messages, following the JSON schema of a
+    json_schema response format (see feedback_schema.RESPONSE_FORMAT):
+        complete: one request.
+        stream: one request, the text yielded as it is generated.
+        complete_batch: several requests, e.g., the stages of one document.
+    acomplete, astream and acomplete_batch are their coroutine counterparts
+    (for AsyncResponseGenerator); by default they run the blocking methods in
+    a worker thread.
+    model names the model in the cache keys, so that responses of different
+    backends are never mixed up. batched tells whether the backend serves a
+    batch better than concurrent requests (see pipeline.analyze_all_stages).
+    """
+
+    model = None
+    batched = False
+
+    def complete(self, messages, response_format, max_tokens):
+        """
+        Parameters:
+            messages (list): Chat messages.
+            response_format (dict): The json_schema response format.
+            max_tokens (int): Maximum number of tokens generated.
+        Returns:
+            Completion: The generated text and the token counts.
+        """
+        raise NotImplementedError
+
+    def stream(self, messages, response_format, max_tokens):
+        # yields Completion pieces; the default sends the request at once
+        yield self.complete(messages, response_format, max_tokens)
+
+    def complete_batch(self, requests):
+        """
+        Parameters:
+            requests (list): (messages, response_format, max_tokens) of each request.
+        Returns:
+            list: Completion of each request, in order.
+        """
+        if len(requests) <= 1:
+            return [self.complete(*request) for request in requests]
+        with ThreadPoolExecutor(
+            max_workers=min(len(requests), MAX_BATCH_WORKERS)
+        ) as executor:
+            return list(executor.map(lambda request: self.complete(*request), requests))
+
+    async def acomplete(self, messages, response_format, max_tokens):
+        return await asyncio.to_thread(
+            self.complete, messages, response_format, max_tokens
+        )
+
+    async def astream(self, messages, response_format, max_tokens):
+        yield await self.acomplete(messages, response_format, max_tokens)
+
+    async def acomplete_batch(self, requests):
+        return await asyncio.to_thread(self.complete_batch, requests)
+
+    def stats(self):
+        return {}
+
+
+class OpenAIBackend(ChatBackend):
+    def __init__(
+        self,
+        api_key,
+        base_url=None,
+        openai_client=None,
+        scheduler=None,
+        priority=INTERACTIVE,
+        model="gpt-4o",
+        async_openai_client=None,
+    ):
+        """
+        The chat completions API of OpenAI (or a compatible server).
+        Parameters:
+            api_key (str): OpenAI API key.
+            base_url (str): Endpoint of the chat completions API. Defaults to
+                OpenAI; point it to a local server for testing.
+            openai_client (OpenAI): Client to use instead of the shared pooled one.
+            scheduler (RateLimitScheduler): Rate limits and retries of the calls.
+                Defaults to the scheduler shared by all users of the API key.
+            priority (int): scheduler.INTERACTIVE or scheduler.BATCH.
+            model (str): The model.
+            async_openai_client (AsyncOpenAI): Client of the coroutine methods to
+                use instead of the shared pooled one of the running event loop.
+        """
+        # retries are left to the scheduler (same connection pool)
+        self.openai_client = (
+            openai_client or get_shared_client(api_key=api_key, base_url=base_url)
+        ).with_options(max_retries=0)
+        self.api_key = api_key
+        self.base_url = base_url
+        self.async_openai_client = async_openai_client
+        self.model = model
+        self.scheduler = scheduler or get_shared_scheduler(api_key)
+        self.priority = priority
+
+    def _send(self, messages, response_format, max_tokens, **options):
+        def request(timeout):
+            return self.openai_client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                max_tokens=max_tokens,
+                response_format=response_format,
+                timeout=timeout,
+                **options,
+            )
+
+        return self.scheduler.call(
+            request,
+            tokens=estimate_messages_tokens(messages) + max_tokens,
+            priority=self.priority,
+        )
+
+    def complete(self, messages, response_format, max_tokens):
+        completion = self._send(messages, response_format, max_tokens)
+        return Completion(completion.choices[0].message.content, completion.usage)
+
+    def stream(self, messages, response_format, max_tokens):
+        # the usage of a streamed response comes in a last chunk without choices
+        for chunk in self._send(
+            messages,
+            response_format,
+            max_tokens,
+            stream=True,
+            stream_options={"include_usage": True},
+        ):
+            content = chunk.choices[0].delta.content if chunk.choices else None
+            yield Completion(content or "", getattr(chunk, "usage", None))
+
+    def _async_client(self):
+        client = self.async_openai_client or get_shared_async_client(
+            api_key=self.api_key, base_url=self.base_url
+        )
+        return client.with_options(max_retries=0)
+
+    async def _asend(self, messages, response_format, max_tokens, **options):
+        client = self._async_client()
+
+        async def request(timeout):
+            return await client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                max_tokens=max_tokens,
+                response_format=response_format,
+                timeout=timeout,
+                **options,
+            )
+
+        return await self.scheduler.acall(
+            request,
+            tokens=estimate_messages_tokens(messages) + max_tokens,
+            priority=self.priority,
+        )
+
+    async def acomplete(self, messages, response_format, max_tokens):
+        completion = await self._asend(messages, response_format, max_tokens)
+        return Completion(completion.choices[0].message.content, completion.usage)
+
+    async def astream(self, messages, response_format, max_tokens):
+        async for chunk in await self._asend(
+            messages,
+            response_format,
+            max_tokens,
+            stream=True,
+            stream_options={"include_usage": True},
+        ):
+            content = chunk.choices[0].delta.content if chunk.choices else None
+            yield Completion(content or "", getattr(chunk, "usage", None))
+
+    def stats(self):
+        # queue depth, waiting times, retries and throttled calls
+        return self.scheduler.stats()
+
+
+class LlamaCppBackend(ChatBackend):
+    batched = True
+
+    def __init__(
+        self,
+        model_path,
+        n_ctx=16384,
+        n_threads=None,
+        n_batch=512,
+        chat_format=None,
+        verbose=False,
+    ):
+        """
+        Local inference on the CPU with llama.cpp (llama-cpp-python), for reviews
+        that may not leave the machine. Any instruction-tuned GGUF model will do,
+        e.g., a 4-bit quantization of a 7-8B model.
+
+        The response schema is enforced while decoding: a grammar compiled from
+        the JSON schema masks every token that would break it, so the output is
+        always valid JSON of the expected shape. Requests are decoded one at a
+        time; the requests of a batch (e.g., the stages of one document) are
+        decoded back to back so that llama.cpp reuses the evaluated prompt
+        prefix they share (the base prompt) instead of evaluating it again.
+        Parameters:
+            model_path (str): The GGUF model file.
+            n_ctx (int): Context size in tokens (prompt and output).
+            n_threads (int): CPU threads (None for llama.cpp's default).
+            n_batch (int): Prompt tokens evaluated per forward pass.
+            chat_format (str): Chat template (None for the one of the model).
+            verbose (bool): Log of llama.cpp.
+        """
+        try:
+            from llama_cpp import Llama
+        except ImportError as error:
+            raise ImportError(
+                "The local backend needs llama-cpp-python: pip install llama-cpp-python"
+            ) from error
+
+        self.llama = Llama(
+            model_path=model_path,
+            n_ctx=n_ctx,
+            n_threads=n_threads,
+            n_batch=n_batch,
+            chat_format=chat_format,
+            verbose=verbose,
+        )
+        self.model = os.path.basename(model_path)
+        # one sequence is decoded at a time
+        self._lock = threading.Lock()
+        self._grammars = {}
+        self._metrics = {
+            "requests": 0,
+            "batches": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "seconds": 0.0,
+        }
+
+    def _grammar(self, response_format):
+        # grammars are compiled once per schema
+        from llama_cpp import LlamaGrammar
+
+        schema = json.dumps(response_format["json_schema"]["schema"], sort_keys=True)
+        if schema not in self._grammars:
+            self._grammars[schema] = LlamaGrammar.from_json_schema(
+                schema, verbose=False
+            )
+        return self._grammars[schema]
+
+    def _max_tokens(self, messages, max_tokens):
+        # what is left of the context after the prompt
+        available = self.llama.n_ctx() - estimate_messages_tokens(messages)
+        return max(1, min(max_tokens, available))
+
+    def _generate(self, messages, response_format, max_tokens, stream=False):
+        return self.llama.create_chat_completion(
+            messages=messages,
+            grammar=self._grammar(response_format),
+            max_tokens=self._max_tokens(messages, max_tokens),
+            temperature=0.0,
+            stream=stream,
+        )
+
+    def _complete(self, messages, response_format, max_tokens):
+        # with self._lock held
+        start = time.perf_counter()
+        result = self._generate(messages, response_format, max_tokens)
+        usage = Usage(
+            result["usage"]["prompt_tokens"], result["usage"]["completion_tokens"]
+        )
+        self._metrics["requests"] += 1
+        self._metrics["prompt_tokens"] += usage.prompt_tokens
+        self._metrics["completion_tokens"] += usage.completion_tokens
+        self._metrics["seconds"] += time.perf_counter() - start
+        return Completion(result["choices"][0]["message"]["content"], usage)
+
+    def complete(self, messages, response_format, max_tokens):
+        with self._lock:
+            return self._complete(messages, response_format, max_tokens)
+
+    def stream(self, messages, response_format, max_tokens):
+        # the usage comes last, in a piece without content (as OpenAIBackend). It
+        # is read from the last chunk when llama.cpp reports it; otherwise every
+        # chunk is one generated token and the prompt is estimated
+        with self._lock:
+            start = time.perf_counter()
+            chunks, reported = 0, None
+            for chunk in self._generate(
+                messages, response_format, max_tokens, stream=True
+            ):
+                chunks += 1
+                reported = chunk.get("usage") or reported
+                content = chunk["choices"][0]["delta"].get("content")
+                if content:
+                    yield Completion(content, None)
+            if reported is not None:
+                usage = Usage(reported["prompt_tokens"], reported["completion_tokens"])
+            else:
+                usage = Usage(estimate_messages_tokens(messages), chunks)
+            self._metrics["requests"] += 1
+            self._metrics["prompt_tokens"] += usage.prompt_tokens
+            self._metrics["completion_tokens"] += usage.completion_tokens
+            self._metrics["seconds"] += time.perf_counter() - start
+        yield Completion("", usage)
+
+    def complete_batch(self, requests):
+        # requests sorted by their messages follow each other when they share a
+        # prefix; the lock is held for the whole batch so that no other request
+        # evicts the prefix in between
+        order = sorted(
+            range(len(requests)), key=lambda idx: json.dumps(requests[idx][0])
+        )
+        completions = [None] * len(requests)
+        with self._lock:
+            self._metrics["batches"] += 1
+            for idx in order:
+                completions[idx] = self._complete(*requests[idx])
+        return completions
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._metrics)
+        stats["seconds"] = round(stats["seconds"], 3)
+        stats["completion_tokens_per_second"] = (
+            round(self._metrics["completion_tokens"] / self._metrics["seconds"], 2)
+            if self._metrics["seconds"]
+            else 0.0
+        )
+        return stats
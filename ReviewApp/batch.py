@@ -0,0 +1,289 @@
+"""
+Analyze a folder of review documents without the UI.
+
+    python batch.py reviews/ results/ --documents 4 --stages 7
+
+Every .docx file in the input folder is read with docx_io.read_docx and
+analysed for all seven EMPATHY components. The diagnostics of each document are
+written to <output>/<name>.json as soon as it is done and all documents are
+collected in <output>/diagnostics.jsonl at the end of the run. Documents whose
+JSON output already exists (for the same file content) are skipped, so an
+interrupted run resumes where it stopped.
+
+The API key is read from secretkey.txt (API_KEY=...) like the app does, or
+from the OPENAI_API_KEY environment variable. With --local-model the documents
+are analysed on this machine instead (see backends.LlamaCppBackend).
+
+With --metrics-jsonl the timers and counters of the run (see metrics) are
+appended to a JSON lines file every minute and at the end; --metrics-port
+serves them for Prometheus while the run lasts.
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from docx_io import read_docx
+from helper import read_secrets
+from pipeline import analyze_all_stages
+from backends import LlamaCppBackend, OpenAIBackend, get_shared_client
+from response_gen import ResponseGenerator
+from scheduler import (
+    BATCH,
+    REQUESTS_PER_MINUTE,
+    TOKENS_PER_MINUTE,
+    get_shared_scheduler,
+)
+from llm_cache import DiagnosticsCache
+import metrics
+from conflicts import CONFLICT_RESOLVERS, conflict_stats
+from app_data import trait_definitions, base_input
+
+
+# API_KEY of the secrets file, else the OPENAI_API_KEY environment variable
+def read_api_key(secrets_path):
+    return read_secrets(secrets_path).get("API_KEY")
+
+
+# output of a document is only trusted if it was produced from the same file content
+def is_done(output_path, digest):
+    if not os.path.exists(output_path):
+        return False
+    try:
+        with open(output_path, "r") as f:
+            return json.load(f).get("sha256") == digest
+    except (OSError, ValueError):
+        return False
+
+
+# write to a temporary file first so an interrupted run never leaves half a result
+def write_json(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def analyze_document(
+    llm,
+    path,
+    output_path,
+    digest,
+    stage_workers,
+    conflict_resolver="local",
+    grouped=False,
+):
+    start = time.perf_counter()
+    # streamed from the file, paragraph by paragraph
+    text = read_docx(path).text
+    diagnostics = analyze_all_stages(
+        llm=llm,
+        review_text=text,
+        base_input=base_input,
+        trait_definitions=trait_definitions,
+        max_workers=stage_workers,
+        conflict_resolver=conflict_resolver,
+        grouped=grouped,
+        # a local backend decodes the stages of a document as one batch
+        batched=llm.backend.batched,
+    )
+    write_json(
+        output_path,
+        {
+            "document": os.path.basename(path),
+            "sha256": digest,
+            "text": text,
+            "diagnostics": diagnostics,
+            "seconds": round(time.perf_counter() - start, 3),
+        },
+    )
+
+
+# one line per analysed document, rebuilt from the per-document outputs
+def collect_jsonl(output_dir, output_paths):
+    with open(os.path.join(output_dir, "diagnostics.jsonl"), "w") as out:
+        for output_path in output_paths:
+            if os.path.exists(output_path):
+                with open(output_path, "r") as f:
+                    out.write(json.dumps(json.load(f), ensure_ascii=False) + "\n")
+
+
+def run_batch(
+    llm,
+    input_dir,
+    output_dir,
+    document_workers=4,
+    stage_workers=7,
+    conflict_resolver="local",
+    grouped=False,
+):
+    """
+    Analyze every .docx file of input_dir, documents and stages in parallel.
+
+    Args:
+        llm (ResponseGenerator): The language model instance (thread-safe).
+        input_dir (str): Folder with the review documents.
+        output_dir (str): Folder for the diagnostics.
+        document_workers (int): Number of documents analysed concurrently.
+        stage_workers (int): Number of concurrent stage analyses per document.
+        conflict_resolver (str): See analysis.analyze_stage.
+        grouped (bool): One request per group of components instead of per stage
+            (see pipeline.analyze_all_stages).
+
+    Returns:
+        dict: Number of analysed, skipped and failed documents, the throughput,
+            the token usage, how conflicts between traits were resolved and the
+            scheduler (or local backend) metrics.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    paths = sorted(
+        os.path.join(input_dir, name)
+        for name in os.listdir(input_dir)
+        if name.lower().endswith(".docx") and not name.startswith("~$")
+    )
+    output_paths = [
+        os.path.join(output_dir, os.path.splitext(os.path.basename(path))[0] + ".json")
+        for path in paths
+    ]
+
+    todo = []
+    for path, output_path in zip(paths, output_paths):
+        with open(path, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        if not is_done(output_path, digest):
+            todo.append((path, output_path, digest))
+    summary = {"analyzed": 0, "skipped": len(paths) - len(todo), "failed": 0}
+    print(f"{len(paths)} documents, {summary['skipped']} already done", file=sys.stderr)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=document_workers) as executor:
+        futures = {
+            executor.submit(
+                analyze_document,
+                llm,
+                path,
+                output_path,
+                digest,
+                stage_workers,
+                conflict_resolver,
+                grouped,
+            ): path
+            for path, output_path, digest in todo
+        }
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                future.result()
+                summary["analyzed"] += 1
+                print(f"done   {path}", file=sys.stderr)
+            except Exception as error:
+                # leave it without output so that the next run retries it
+                summary["failed"] += 1
+                print(f"failed {path}: {error!r}", file=sys.stderr)
+    minutes = (time.perf_counter() - start) / 60
+    summary["documents_per_minute"] = (
+        round(summary["analyzed"] / minutes, 2) if minutes > 0 else 0.0
+    )
+
+    # prompt / cached / completion tokens reported by the API for this run
+    summary["usage"] = llm.usage.stats()
+    summary["conflicts"] = conflict_stats()
+    # queue depth, waiting times, retries and throttled calls
+    if llm.scheduler is not None:
+        summary["scheduler"] = llm.scheduler.stats()
+    else:
+        summary["backend"] = llm.backend.stats()
+
+    collect_jsonl(output_dir, output_paths)
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip().splitlines()[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__,
+    )
+    parser.add_argument("input_dir", help="folder with .docx review documents")
+    parser.add_argument("output_dir", help="folder for the diagnostics")
+    parser.add_argument(
+        "--documents", type=int, default=4, help="documents analysed concurrently"
+    )
+    parser.add_argument(
+        "--stages", type=int, default=7, help="concurrent stages per document"
+    )
+    parser.add_argument("--secrets", default="secretkey.txt")
+    parser.add_argument("--base-url", default=None, help="chat completions endpoint")
+    parser.add_argument(
+        "--no-cache", action="store_true", help="do not use the response cache"
+    )
+    parser.add_argument(
+        "--conflicts",
+        choices=CONFLICT_RESOLVERS,
+        default="local",
+        help="resolve sentences flagged under several traits locally or with the LLM",
+    )
+    parser.add_argument(
+        "--rpm", type=int, default=REQUESTS_PER_MINUTE, help="requests per minute"
+    )
+    parser.add_argument(
+        "--tpm", type=int, default=TOKENS_PER_MINUTE, help="tokens per minute"
+    )
+    parser.add_argument(
+        "--grouped",
+        action="store_true",
+        help="analyze E/M/P and A/T/H/Y in one request each",
+    )
+    parser.add_argument("--local-model", help="GGUF model analysing on this machine")
+    parser.add_argument(
+        "--threads", type=int, default=None, help="local model: CPU threads"
+    )
+    parser.add_argument("--metrics-jsonl", help="append the metrics to this file")
+    parser.add_argument(
+        "--metrics-port", type=int, default=None, help="serve /metrics on this port"
+    )
+    args = parser.parse_args()
+
+    if args.metrics_port:
+        metrics.serve_prometheus(args.metrics_port)
+    if args.metrics_jsonl:
+        stop_export = metrics.start_jsonl_export(args.metrics_jsonl)
+
+    if args.local_model:
+        backend = LlamaCppBackend(model_path=args.local_model, n_threads=args.threads)
+    else:
+        api_key = read_api_key(args.secrets)
+        backend = OpenAIBackend(
+            api_key=api_key,
+            # one pooled connection per concurrent request
+            openai_client=get_shared_client(
+                api_key=api_key,
+                base_url=args.base_url,
+                max_connections=args.documents * args.stages,
+            ),
+            # stays below the rate limits of the key and yields to interactive users
+            scheduler=get_shared_scheduler(
+                api_key, requests_per_minute=args.rpm, tokens_per_minute=args.tpm
+            ),
+            priority=BATCH,
+        )
+    llm = ResponseGenerator(
+        cache=None if args.no_cache else DiagnosticsCache(), backend=backend
+    )
+    summary = run_batch(
+        llm=llm,
+        input_dir=args.input_dir,
+        output_dir=args.output_dir,
+        document_workers=args.documents,
+        stage_workers=args.stages,
+        conflict_resolver=args.conflicts,
+        grouped=args.grouped,
+    )
+    if args.metrics_jsonl:
+        stop_export.set()
+        # the metrics of the whole run
+        metrics.write_jsonl(args.metrics_jsonl)
+    print(json.dumps(summary))
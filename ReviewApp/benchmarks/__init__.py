@@ -0,0 +1,7 @@
+"""
+Benchmarks of the analysis, run from the ReviewApp folder:
+
+    python -m benchmarks.call_modes --help
+    python -m benchmarks.local_backend --help
+    python -m benchmarks.offline --help
+"""
@@ -0,0 +1,101 @@
+"""
+Compare the two ways of analysing all stages of a review up front: one request
+per stage (seven short calls) and one request per group of components (two
+long calls, see pipeline.COMPONENT_GROUPS).
+
+    python -m benchmarks.call_modes review.docx --repeat 3
+    python -m benchmarks.call_modes --mock --latency 0.5 --token-latency 0.01
+
+Both modes analyse the same text without the response cache. Reported per mode:
+end-to-end seconds (median over the repeats), number of requests and the tokens
+reported by the API (prompt, cached, completion). With --mock the requests go to
+a local mock_server, whose latencies should be set to mimic the provider.
+"""
+
+import json
+import argparse
+import threading
+import statistics
+import time
+from docx_io import read_docx
+from pipeline import analyze_all_stages
+from backends import get_shared_client
+from response_gen import ResponseGenerator
+from batch import read_api_key
+from app_data import trait_definitions, base_input
+
+SAMPLE_REVIEW = (
+    "The paper is nice. The discussion is weak. The authors should reject the "
+    "null model. I do not understand why this journal would publish this. The "
+    "data are interesting but the method section is unclear. The writing needs "
+    "work."
+)
+
+
+def run_mode(llm, text, grouped, repeat):
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        analyze_all_stages(
+            llm=llm,
+            review_text=text,
+            base_input=base_input,
+            trait_definitions=trait_definitions,
+            grouped=grouped,
+        )
+        seconds.append(time.perf_counter() - start)
+    usage = llm.usage.stats()
+    return {
+        "seconds": round(statistics.median(seconds), 3),
+        "requests": usage["calls"] // repeat,
+        "prompt_tokens": usage["prompt_tokens"] // repeat,
+        "cached_tokens": usage["cached_tokens"] // repeat,
+        "completion_tokens": usage["completion_tokens"] // repeat,
+    }
+
+
+def compare_modes(api_key, base_url, text, repeat=1):
+    results = {}
+    for mode, grouped in [("per_stage", False), ("grouped", True)]:
+        # a fresh generator per mode so that the usage counters are separate
+        llm = ResponseGenerator(
+            api_key=api_key,
+            openai_client=get_shared_client(api_key=api_key, base_url=base_url),
+        )
+        results[mode] = run_mode(llm, text, grouped, repeat)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip().splitlines()[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__,
+    )
+    parser.add_argument("document", nargs="?", help=".docx review (default: sample)")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--secrets", default="secretkey.txt")
+    parser.add_argument("--base-url", default=None, help="chat completions endpoint")
+    parser.add_argument("--mock", action="store_true", help="use a local mock server")
+    parser.add_argument("--latency", type=float, default=0.5, help="mock: s per call")
+    parser.add_argument(
+        "--token-latency", type=float, default=0.01, help="mock: s per output token"
+    )
+    args = parser.parse_args()
+
+    text = SAMPLE_REVIEW
+    if args.document:
+        text = read_docx(args.document).text
+
+    api_key, base_url = read_api_key(args.secrets), args.base_url
+    if args.mock:
+        from mock_server import make_server
+
+        server = make_server(
+            port=0, latency=args.latency, token_latency=args.token_latency
+        )
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        api_key = "mock"
+        base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+    print(json.dumps(compare_modes(api_key, base_url, text, args.repeat), indent=2))
@@ -0,0 +1,64 @@
+"""
+Time the import of the app modules in a fresh interpreter (cold start of a
+container, first run of a page).
+
+    python -m benchmarks.import_time --repeat 5
+
+Each module is imported in its own subprocess; reported is the median wall
+time of the import in seconds, and which heavy dependencies it loaded.
+"""
+
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = ["helper", "analysis", "pipeline", "response_gen", "budget", "batch"]
+HEAVY_DEPENDENCIES = ["pandas", "numpy", "nltk", "docx2txt", "openai"]
+
+_PROBE = """
+import sys, time, json
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps([seconds, [name for name in {heavy!r} if name in sys.modules]]))
+"""
+
+
+def time_import(module, repeat):
+    seconds = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                _PROBE.format(module=module, heavy=HEAVY_DEPENDENCIES),
+            ],
+            cwd=APP_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        elapsed, loaded = json.loads(output.strip().splitlines()[-1])
+        seconds.append(elapsed)
+    return {"seconds": round(statistics.median(seconds), 3), "loads": loaded}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip().splitlines()[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__,
+    )
+    parser.add_argument("modules", nargs="*", default=MODULES)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    print(
+        json.dumps(
+            {module: time_import(module, args.repeat) for module in args.modules},
+            indent=2,
+        )
+    )
@@ -0,0 +1,85 @@
+"""
+Throughput of the local backend on the CPU: all seven stages of a review
+analysed by a GGUF model with llama.cpp (backends.LlamaCppBackend).
+
+    python -m benchmarks.local_backend model.gguf review.docx --threads 8
+
+Three modes are compared on the same text, without the response cache:
+per_stage (one request per stage, one after the other), batched (the seven
+requests as one batch, decoded back to back so that the base prompt is
+evaluated once) and grouped (one request per group of components). Reported
+per mode: end-to-end seconds (median over the repeats), requests, prompt and
+completion tokens, and completion tokens per second.
+"""
+
+import json
+import argparse
+import statistics
+import time
+from backends import LlamaCppBackend
+from docx_io import read_docx
+from pipeline import analyze_all_stages
+from response_gen import ResponseGenerator
+from benchmarks.call_modes import SAMPLE_REVIEW
+from app_data import trait_definitions, base_input
+
+MODES = {
+    "per_stage": {"max_workers": 1},
+    "batched": {"batched": True},
+    "grouped": {"grouped": True, "max_workers": 1},
+}
+
+
+def run_mode(backend, text, options, repeat):
+    # a fresh generator per mode so that the usage counters are separate
+    llm = ResponseGenerator(backend=backend)
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        analyze_all_stages(
+            llm=llm,
+            review_text=text,
+            base_input=base_input,
+            trait_definitions=trait_definitions,
+            **options,
+        )
+        seconds.append(time.perf_counter() - start)
+    usage = llm.usage.stats()
+    return {
+        "seconds": round(statistics.median(seconds), 3),
+        "requests": usage["calls"] // repeat,
+        "prompt_tokens": usage["prompt_tokens"] // repeat,
+        "completion_tokens": usage["completion_tokens"] // repeat,
+        "completion_tokens_per_second": round(
+            usage["completion_tokens"] / sum(seconds), 2
+        ),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip().splitlines()[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__,
+    )
+    parser.add_argument("model", help="GGUF model file")
+    parser.add_argument("document", nargs="?", help=".docx review (default: sample)")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--threads", type=int, default=None, help="CPU threads")
+    parser.add_argument("--n-ctx", type=int, default=16384, help="context size")
+    parser.add_argument("--modes", nargs="+", choices=list(MODES), default=list(MODES))
+    args = parser.parse_args()
+
+    text = read_docx(args.document).text if args.document else SAMPLE_REVIEW
+    backend = LlamaCppBackend(
+        model_path=args.model, n_ctx=args.n_ctx, n_threads=args.threads
+    )
+    results = {
+        "model": backend.model,
+        "threads": args.threads,
+        **{
+            mode: run_mode(backend, text, MODES[mode], args.repeat)
+            for mode in args.modes
+        },
+    }
+    print(json.dumps(results, indent=2))
@@ -0,0 +1,440 @@
+"""
+Offline benchmark suite: the text helpers and full stage analyses on synthetic
+reviews of increasing size, without an API key or a network connection.
+
+    python -m benchmarks.offline --output before.json
+    python -m benchmarks.offline --baseline before.json --tolerance 0.25
+
+The LLM is replaced by a replay backend (ReplayBackend): ResponseGenerator runs
+unchanged (prompt, parsing, usage) but every request is answered with a
+recorded model output, after a configurable latency (--latency, seconds per
+request, and --token-latency, seconds per output token; both 0 by default so
+that only the app's own work is timed). Outputs are looked up by the digest of
+the request in --recordings, a JSON file written by --record with a live key
+(the synthetic reviews are deterministic, so recorded requests are sent again
+exactly); requests without a recording get DEFAULT_RESPONSE, which flags
+sentences of the synthetic reviews.
+
+Each case is run --repeat times after one warm-up run, with the caches of the
+helpers cleared before every run. Reported per case: median and minimum
+seconds, with the commit, Python version and machine, so that results of two
+commits can be compared. With --baseline the medians are compared with a
+previous result; the exit status is 1 if a case is slower by more than
+--tolerance (a fraction).
+"""
+
+import gc
+import os
+import sys
+import json
+import time
+import random
+import hashlib
+import zipfile
+import argparse
+import platform
+import statistics
+import subprocess
+from io import BytesIO
+from xml.sax.saxutils import escape
+import helper
+from helper import (
+    process_docx_file,
+    decompose_join,
+    match_sentences_with_similarity,
+    dict_to_df,
+    apply_accepted_changes,
+)
+from analysis import analyze_stage
+from backends import ChatBackend, Completion, Usage
+from budget import estimate_messages_tokens
+from response_gen import ResponseGenerator
+from app_data import trait_definitions, base_input, e_component_input
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# number of sentences of the synthetic reviews
+SIZES = [50, 200, 800]
+# sentences per paragraph
+PARAGRAPH_SENTENCES = 5
+# one sentence in FLAGGED_EVERY is flagged by the synthetic improvements
+FLAGGED_EVERY = 4
+
+SENTENCES = [
+    "The paper is nice.",
+    "The discussion is weak.",
+    "The authors should reject the null model.",
+    "I do not understand why this journal would publish this.",
+    "The data are interesting but the method section is unclear.",
+    "The writing needs work.",
+    "The theoretical contribution is not clear to me.",
+    "The sample is small and the results may not generalize.",
+    "The literature review misses recent work on the topic.",
+    "The hypotheses follow from the arguments in the introduction.",
+    "The measures are well established in the field.",
+    "The robustness checks are convincing.",
+    "The limitations section is too short.",
+    "The figures are hard to read.",
+    "The authors overstate the practical implications of the findings.",
+    "The paper would fit better in another journal.",
+]
+
+# recorded output of the e_component prompt for the synthetic reviews: two
+# traits flag the same sentence, so conflicts between traits are resolved too
+DEFAULT_RESPONSE = {
+    "improvements": [
+        {
+            "trait": "Appreciate the Journal’s Mission",
+            "comment": "The following sentence(s) does not relate the manuscript to the goals of the journal.",
+            "sentences_needing_improvement": [
+                "I do not understand why this journal would publish this.",
+                "The paper would fit better in another journal.",
+            ],
+            "suggested_improvement": [
+                "It would help to explain how the study advances the journal's mission.",
+                "The authors could clarify how the paper speaks to the readers of this journal.",
+            ],
+        },
+        {
+            "trait": "Tailor the Review to Journal Expectations",
+            "comment": "The following sentence(s) offers vague criticism without the standards of the journal.",
+            "sentences_needing_improvement": [
+                "The discussion is weak.",
+                "The paper would fit better in another journal.",
+            ],
+            "suggested_improvement": [
+                "The discussion would be stronger by adding practical implications of the findings.",
+                "The contribution could be framed against the journal's standards for rigor.",
+            ],
+        },
+    ]
+}
+
+
+def synthetic_review(sentences, seed=0):
+    # the same review for the same size and seed: SENTENCES in a shuffled order,
+    # PARAGRAPH_SENTENCES per paragraph
+    rng = random.Random(seed)
+    picked = [rng.choice(SENTENCES) for _ in range(sentences)]
+    return "\n\n".join(
+        " ".join(picked[start : start + PARAGRAPH_SENTENCES])
+        for start in range(0, sentences, PARAGRAPH_SENTENCES)
+    )
+
+
+def synthetic_docx(text):
+    # a minimal .docx with one paragraph per paragraph of text
+    paragraphs = "".join(
+        f"<w:p><w:r><w:t>{escape(paragraph)}</w:t></w:r></w:p>"
+        for paragraph in text.split("\n\n")
+    )
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr(
+            "[Content_Types].xml",
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/word/document.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+            "</Types>",
+        )
+        archive.writestr(
+            "_rels/.rels",
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="word/document.xml"/>'
+            "</Relationships>",
+        )
+        archive.writestr(
+            "word/document.xml",
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+            f"<w:body>{paragraphs}</w:body></w:document>",
+        )
+    return buffer.getvalue()
+
+
+def synthetic_improvements(text):
+    # improvements (see ResponseGenerator.generate_response) flagging one
+    # sentence in FLAGGED_EVERY of the text
+    sentences = " ".join(text.split("\n\n")).split(". ")
+    flagged = [sentence.rstrip(".") + "." for sentence in sentences[::FLAGGED_EVERY]]
+    return [
+        {
+            "trait": "Be Specific and Creative",
+            "comment": "The following sentence(s) offers vague criticism.",
+            "sentences_needing_improvement": flagged,
+            "suggested_improvement": [
+                f"{sentence[:-1]}, which could be addressed by a concrete change."
+                for sentence in flagged
+            ],
+        }
+    ]
+
+
+def request_key(messages, response_format):
+    # digest of a request, the key of its recorded output
+    return hashlib.sha256(
+        json.dumps([messages, response_format], sort_keys=True).encode("utf-8")
+    ).hexdigest()
+
+
+def _default_content(response_format):
+    # DEFAULT_RESPONSE under every key of a multi-component schema
+    keys = list(response_format["json_schema"]["schema"]["properties"])
+    if keys == ["improvements"]:
+        return json.dumps(DEFAULT_RESPONSE)
+    return json.dumps({key: DEFAULT_RESPONSE["improvements"] for key in keys})
+
+
+class ReplayBackend(ChatBackend):
+    model = "replay"
+
+    def __init__(self, recordings=None, latency=0.0, token_latency=0.0):
+        """
+        Answers every request with a recorded model output, deterministically.
+        Parameters:
+            recordings (dict): Model output by request digest (see request_key).
+            latency (float): Seconds per request.
+            token_latency (float): Seconds per output token.
+        """
+        self.recordings = recordings or {}
+        self.latency = latency
+        self.token_latency = token_latency
+        self.replayed = 0
+        self.defaulted = 0
+
+    def _content(self, messages, response_format):
+        content = self.recordings.get(request_key(messages, response_format))
+        if content is None:
+            self.defaulted += 1
+            return _default_content(response_format)
+        self.replayed += 1
+        return content
+
+    def complete(self, messages, response_format, max_tokens):
+        content = self._content(messages, response_format)
+        # 4 characters per token, like the mock server
+        completion_tokens = len(content) // 4
+        time.sleep(self.latency + self.token_latency * completion_tokens)
+        return Completion(
+            content, Usage(estimate_messages_tokens(messages), completion_tokens)
+        )
+
+    def stream(self, messages, response_format, max_tokens, pieces=20):
+        completion = self.complete(messages, response_format, max_tokens)
+        size = max(1, len(completion.content) // pieces)
+        for start in range(0, len(completion.content), size):
+            yield Completion(completion.content[start : start + size], None)
+        yield Completion("", completion.usage)
+
+    def stats(self):
+        return {"replayed": self.replayed, "defaulted": self.defaulted}
+
+
+class RecordingBackend(ChatBackend):
+    def __init__(self, backend):
+        # sends the requests to backend and keeps its outputs (see ReplayBackend)
+        self.backend = backend
+        self.model = backend.model
+        self.recordings = {}
+
+    def complete(self, messages, response_format, max_tokens):
+        completion = self.backend.complete(messages, response_format, max_tokens)
+        self.recordings[request_key(messages, response_format)] = completion.content
+        return completion
+
+
+def replay_generator(recordings=None, latency=0.0, token_latency=0.0):
+    # a ResponseGenerator answering from recordings, without the response cache
+    return ResponseGenerator(
+        backend=ReplayBackend(recordings, latency=latency, token_latency=token_latency)
+    )
+
+
+def time_case(run, repeat):
+    # one warm-up run, then repeat timed runs with cold helper caches
+    seconds = []
+    for idx in range(repeat + 1):
+        helper.document_index.cache_clear()
+        helper.card_markup.cache_clear()
+        gc.collect()
+        start = time.perf_counter()
+        run()
+        if idx:
+            seconds.append(time.perf_counter() - start)
+    return {
+        "median": round(statistics.median(seconds), 6),
+        "min": round(min(seconds), 6),
+    }
+
+
+def cases(size, llm):
+    # (name, function) of the cases for a review of size sentences
+    text = synthetic_review(size)
+    docx = synthetic_docx(text)
+    improvements = synthetic_improvements(text)
+    decisions = [
+        {"sentence": sentence, "suggestion": suggestion, "decision": "accept"}
+        for improvement in improvements
+        for sentence, suggestion in zip(
+            improvement["sentences_needing_improvement"],
+            improvement["suggested_improvement"],
+        )
+    ]
+
+    def analyze():
+        analyze_stage(
+            llm=llm,
+            review_text=text,
+            component_input=e_component_input,
+            base_input=base_input,
+            trait_definitions=trait_definitions,
+            component_name="e_component",
+        )
+
+    return [
+        ("process_docx_file", lambda: process_docx_file(BytesIO(docx))),
+        ("decompose_join", lambda: decompose_join(text)),
+        (
+            "match_sentences_with_similarity",
+            lambda: match_sentences_with_similarity(dict_to_df(improvements), text),
+        ),
+        ("dict_to_df", lambda: dict_to_df(improvements)),
+        ("apply_accepted_changes", lambda: apply_accepted_changes(text, decisions)),
+        ("analyze_stage", analyze),
+    ]
+
+
+def run_suite(llm, sizes=SIZES, repeat=5, only=None):
+    """
+    Time every case for every size of review.
+
+    Args:
+        llm (ResponseGenerator): Generator of the analyze_stage cases.
+        sizes (list): Numbers of sentences of the synthetic reviews.
+        repeat (int): Timed runs per case.
+        only (list): Names of the cases to run (default: all).
+
+    Returns:
+        list: One record per case and size (name, sentences, median, min).
+    """
+    results = []
+    for size in sizes:
+        for name, run in cases(size, llm):
+            if only and name not in only:
+                continue
+            results.append({"name": name, "sentences": size, **time_case(run, repeat)})
+    return results
+
+
+def environment():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=APP_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def compare(results, baseline, tolerance):
+    # (name, sentences, baseline median, median, ratio, regressed) of the cases
+    # of results that are in baseline
+    before = {
+        (record["name"], record["sentences"]): record["median"]
+        for record in baseline["results"]
+    }
+    comparison = []
+    for record in results:
+        key = (record["name"], record["sentences"])
+        if key in before and before[key] > 0:
+            ratio = record["median"] / before[key]
+            comparison.append((*key, before[key], record["median"], ratio))
+    return [(*row, row[-1] > 1 + tolerance) for row in comparison]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip().splitlines()[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__,
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--cases", nargs="+", help="names of the cases to run")
+    parser.add_argument("--latency", type=float, default=0.0, help="s per request")
+    parser.add_argument(
+        "--token-latency", type=float, default=0.0, help="s per output token"
+    )
+    parser.add_argument("--recordings", help="recorded model outputs (JSON)")
+    parser.add_argument(
+        "--record",
+        help="send the requests to the API and write their outputs to this file",
+    )
+    parser.add_argument("--secrets", default="secretkey.txt")
+    parser.add_argument("--base-url", default=None, help="chat completions endpoint")
+    parser.add_argument("--output", help="write the results to this file")
+    parser.add_argument("--baseline", help="results of a previous run to compare")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    if args.record:
+        from backends import OpenAIBackend
+        from batch import read_api_key
+
+        backend = RecordingBackend(
+            OpenAIBackend(api_key=read_api_key(args.secrets), base_url=args.base_url)
+        )
+        llm = ResponseGenerator(backend=backend)
+        # one run per size is enough to record every request
+        for size in args.sizes:
+            dict(cases(size, llm))["analyze_stage"]()
+        with open(args.record, "w") as f:
+            json.dump(backend.recordings, f, indent=1)
+        print(f"{len(backend.recordings)} responses recorded", file=sys.stderr)
+        sys.exit(0)
+
+    recordings = None
+    if args.recordings:
+        with open(args.recordings, "r") as f:
+            recordings = json.load(f)
+    llm = replay_generator(recordings, args.latency, args.token_latency)
+    report = {
+        **environment(),
+        "repeat": args.repeat,
+        "latency": args.latency,
+        "token_latency": args.token_latency,
+        "results": run_suite(llm, args.sizes, args.repeat, args.cases),
+        "replay": llm.backend.stats(),
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        regressions = 0
+        print(f"compared with {baseline.get('commit')}:", file=sys.stderr)
+        for name, size, before, after, ratio, regressed in compare(
+            report["results"], baseline, args.tolerance
+        ):
+            regressions += regressed
+            print(
+                f"{'SLOWER' if regressed else 'ok':6} {name:32} {size:5} "
+                f"{before:10.6f} -> {after:10.6f} ({ratio:.2f}x)",
+                file=sys.stderr,
+            )
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,108 @@
+"""
+Time the reruns of the review page with many suggestion cards on screen.
+
+    python -m benchmarks.render_rerun --cards 40 --repeat 5
+
+The page is run headless (streamlit AppTest) with a synthetic review and
+stage 1 diagnostics of --cards suggestions, without any LLM call. Reported:
+the first run (nothing cached), the median rerun of the whole page after a
+decision click and the same per card. A click on a card reruns only that
+card (a fragment) in the browser; AppTest always reruns the whole page, so
+the per-card time approximates the cost of a click.
+
+--page runs another version of the page (e.g., an older commit checked out
+elsewhere) for comparison.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import tempfile
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def synthetic_review(cards):
+    sentences = [
+        f"Point {idx}: the analysis in section {idx} is weak and the authors should justify it."
+        for idx in range(cards)
+    ]
+    return " ".join(sentences), sentences
+
+
+def synthetic_diagnostics(sentences):
+    return {
+        "traits_list": ["Be Specific and Creative"] * len(sentences),
+        "comments_list": [
+            "The following sentence(s) does not provide actionable suggestions instead it offers vague criticism."
+        ]
+        * len(sentences),
+        "suggestions_list": [
+            sentence.replace("is weak", "could be strengthened")
+            for sentence in sentences
+        ],
+        "sent_list": sentences,
+    }
+
+
+def time_reruns(page, cards, repeat):
+    from streamlit.testing.v1 import AppTest
+
+    text, sentences = synthetic_review(cards)
+    at = AppTest.from_file(page, default_timeout=120)
+    at.session_state["rtext"] = text
+    at.session_state["diagnostics"] = {"stage1": synthetic_diagnostics(sentences)}
+    at.session_state["analyzed_text"] = {"stage1": text}
+    at.session_state["stage1_pill"] = "Run this stage"
+
+    start = time.perf_counter()
+    at.run()
+    first_run = time.perf_counter() - start
+    if at.exception:
+        raise RuntimeError(at.exception[0].value)
+
+    reruns = []
+    for idx in range(repeat):
+        # a decision on one card, as a user would click (the cards in order, the
+        # keys of their pills differ between versions of the page)
+        pills = [
+            element
+            for element in at.get("button_group")
+            if element.key.startswith("dec_stage1_")
+        ]
+        pill = pills[idx % cards]
+        pill.set_value("Accept" if idx % 2 == 0 else "Reject")
+        start = time.perf_counter()
+        pill.run()
+        reruns.append(time.perf_counter() - start)
+    rerun = statistics.median(reruns)
+    return {
+        "cards": cards,
+        "first_run_seconds": round(first_run, 3),
+        "rerun_seconds": round(rerun, 3),
+        "rerun_seconds_per_card": round(rerun / cards, 4),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip().splitlines()[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__,
+    )
+    parser.add_argument("--cards", type=int, default=40)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--page", default=os.path.join(APP_DIR, "pages", "1_Review.py"))
+    args = parser.parse_args()
+
+    # the page reads its API key from secretkey.txt in the working directory;
+    # no request is sent, so a placeholder key in a scratch directory will do
+    sys.path.insert(0, APP_DIR)
+    with tempfile.TemporaryDirectory() as scratch:
+        with open(os.path.join(scratch, "secretkey.txt"), "w") as f:
+            f.write("API_KEY=benchmark\n")
+        os.chdir(scratch)
+        print(json.dumps(time_reruns(args.page, args.cards, args.repeat), indent=2))
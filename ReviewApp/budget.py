@@ -0,0 +1,110 @@
+import re
+from helper import sent_tokenize
+
+# limits of the model (gpt-4o)
+CONTEXT_WINDOW = 128000
+MAX_OUTPUT_TOKENS = 16384
+# reviews longer than this (in tokens) are analysed in chunks
+MAX_CHUNK_TOKENS = 2500
+# sentences repeated at the start of the next chunk so that none loses its context
+CHUNK_OVERLAP_SENTENCES = 2
+# output budget: a fixed part for the structure and comments plus a share of the
+# review (flagged sentences are repeated and rewritten in the response)
+MIN_OUTPUT_TOKENS = 1500
+OUTPUT_TOKENS_PER_REVIEW_TOKEN = 2.0
+
+# words, numbers and single punctuation marks -- roughly the pieces a BPE
+# tokenizer splits English text into
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text):
+    """
+    Estimate the number of tokens of a text without a tokenizer download (and
+    without network access). Long words are split in several tokens by the
+    model's tokenizer, hence the character-based lower bound.
+    """
+    pieces = len(_TOKEN_PATTERN.findall(text))
+    return max(pieces, len(text) // 4)
+
+
+def estimate_messages_tokens(messages):
+    # a few tokens of overhead per message for the role and separators
+    return sum(estimate_tokens(message["content"]) + 4 for message in messages)
+
+
+def output_token_budget(review_tokens):
+    # max_tokens of a request analysing review_tokens tokens of review
+    budget = MIN_OUTPUT_TOKENS + int(OUTPUT_TOKENS_PER_REVIEW_TOKEN * review_tokens)
+    return min(budget, MAX_OUTPUT_TOKENS)
+
+
+def split_into_chunks(
+    text, max_tokens=MAX_CHUNK_TOKENS, overlap=CHUNK_OVERLAP_SENTENCES
+):
+    """
+    Split a review on sentence boundaries into chunks of at most max_tokens
+    tokens (a single longer sentence makes a chunk of its own). Consecutive
+    chunks share `overlap` sentences.
+
+    Args:
+        text (str): The review text (see helper.decompose_join).
+        max_tokens (int): Maximum size of a chunk.
+        overlap (int): Number of sentences repeated from the previous chunk.
+
+    Returns:
+        list: The chunks (the text itself if it fits in one chunk).
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return [text]
+    sentences = sent_tokenize(text)
+    sizes = [estimate_tokens(sentence) for sentence in sentences]
+    chunks = []
+    start = 0
+    while start < len(sentences):
+        end, size = start, 0
+        while end < len(sentences) and (
+            end == start or size + sizes[end] <= max_tokens
+        ):
+            size += sizes[end]
+            end += 1
+        chunks.append(" ".join(sentences[start:end]))
+        if end == len(sentences):
+            break
+        # always move forward, even if the overlap is as long as the chunk
+        start = max(start + 1, end - overlap)
+    return chunks
+
+
+def merge_improvements(responses):
+    """
+    Merge the improvements generated for the chunks of a review: entries of the
+    same trait are combined and sentences seen in an overlapping chunk before
+    are dropped.
+
+    Args:
+        responses (list): Improvements of each chunk (see ResponseGenerator).
+
+    Returns:
+        list: The merged improvements.
+    """
+    merged = {}
+    for improvements in responses:
+        for improvement in improvements:
+            entry = merged.setdefault(
+                improvement["trait"],
+                {
+                    "trait": improvement["trait"],
+                    "comment": improvement["comment"],
+                    "sentences_needing_improvement": [],
+                    "suggested_improvement": [],
+                },
+            )
+            for sentence, suggestion in zip(
+                improvement["sentences_needing_improvement"],
+                improvement["suggested_improvement"],
+            ):
+                if sentence not in entry["sentences_needing_improvement"]:
+                    entry["sentences_needing_improvement"].append(sentence)
+                    entry["suggested_improvement"].append(suggestion)
+    return list(merged.values())
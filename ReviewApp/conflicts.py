@@ -0,0 +1,114 @@
+import re
+import threading
+from collections import Counter
+from rapidfuzz import fuzz, process
+import metrics
+
+# how conflicts are resolved: "local" never calls the LLM, "llm" sends every
+# conflicting response to the LLM, "auto" only the ones "local" cannot decide
+CONFLICT_RESOLVERS = ["local", "auto", "llm"]
+# two traits scoring closer than this are considered a tie
+AMBIGUOUS_MARGIN = 2.0
+
+# how often each path was taken since start up ("none" when nothing conflicted)
+_counts = Counter()
+_counts_lock = threading.Lock()
+
+
+def count_conflict_path(path):
+    with _counts_lock:
+        _counts[path] += 1
+    metrics.count("conflicts", path=path)
+
+
+def conflict_stats():
+    with _counts_lock:
+        return {path: _counts[path] for path in ["none", "local", "llm"]}
+
+
+def parse_trait_definitions(definitions):
+    # "1. Name: description" lines of app_data.trait_definitions -> {name: description}
+    traits = {}
+    for line in definitions.splitlines():
+        found = re.match(r"\s*\d+\.\s*([^:]+):\s*(.+)", line)
+        if found:
+            traits[found.group(1).strip()] = found.group(2).strip()
+    return traits
+
+
+def _trait_name(trait, traits):
+    # the LLM does not always return the trait name verbatim
+    found = process.extractOne(trait, list(traits), scorer=fuzz.WRatio)
+    return found[0] if found and found[1] >= 80 else None
+
+
+def _fit(text, trait, traits):
+    # similarity of the text to the definition of the trait, relative to its
+    # average similarity to all traits of the component (long or generic texts
+    # are similar to every definition)
+    name = _trait_name(trait, traits)
+    if name is None:
+        return 0.0
+    scores = {
+        other: fuzz.token_set_ratio(text, f"{other}: {description}")
+        for other, description in traits.items()
+    }
+    return scores[name] - sum(scores.values()) / len(scores)
+
+
+def resolve_conflicts_locally(improvements, definitions):
+    """
+    Assign each sentence flagged under more than one trait to a single trait
+    without calling the LLM. The candidates are scored by the similarity of
+    their comment and suggestion to the definition of their trait compared to
+    the other traits (the comments paraphrase the definition by construction of
+    the prompt); ties go to the trait listed first in the response.
+
+    Args:
+        improvements (list): Improvements as returned by ResponseGenerator.
+        definitions (str): Definitions of the traits of the component
+            (trait_definitions[component]).
+
+    Returns:
+        tuple: The improvements with every sentence kept under one trait only,
+            and whether any conflict was a tie.
+    """
+    traits = parse_trait_definitions(definitions)
+    best = {}
+    ambiguous = False
+    for idx, improvement in enumerate(improvements):
+        for sentence, suggestion in zip(
+            improvement["sentences_needing_improvement"],
+            improvement["suggested_improvement"],
+        ):
+            score = _fit(
+                f"{improvement['comment']} {suggestion}", improvement["trait"], traits
+            )
+            if sentence not in best:
+                best[sentence] = (score, idx)
+                continue
+            if abs(score - best[sentence][0]) < AMBIGUOUS_MARGIN:
+                ambiguous = True
+            if score > best[sentence][0]:
+                best[sentence] = (score, idx)
+
+    resolved = []
+    for idx, improvement in enumerate(improvements):
+        pairs = [
+            (sentence, suggestion)
+            for sentence, suggestion in zip(
+                improvement["sentences_needing_improvement"],
+                improvement["suggested_improvement"],
+            )
+            if best[sentence][1] == idx
+        ]
+        if pairs:
+            resolved.append(
+                {
+                    "trait": improvement["trait"],
+                    "comment": improvement["comment"],
+                    "sentences_needing_improvement": [pair[0] for pair in pairs],
+                    "suggested_improvement": [pair[1] for pair in pairs],
+                }
+            )
+    return resolved, ambiguous
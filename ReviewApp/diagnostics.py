@@ -0,0 +1,94 @@
+from dataclasses import dataclass
+
+
+@dataclass
+class Diagnostic:
+    """
+    One suggestion of the LLM: a sentence of the text flagged under a trait,
+    with the comment on it and the suggested improvement.
+    """
+
+    __slots__ = ("trait", "comment", "sentence", "suggestion")
+    trait: str
+    comment: str
+    # the sentence as returned by the LLM, or as found in the text once matched
+    sentence: str
+    suggestion: str
+
+
+def from_improvements(improvements):
+    # one record per (sentence, suggestion) pair of the improvements of the LLM
+    return [
+        Diagnostic(improvement["trait"], improvement["comment"], sentence, suggestion)
+        for improvement in improvements
+        for sentence, suggestion in zip(
+            improvement["sentences_needing_improvement"],
+            improvement["suggested_improvement"],
+        )
+    ]
+
+
+def has_conflicts(diagnostics):
+    # whether a sentence was flagged more than once (e.g., under two traits)
+    sentences = [diagnostic.sentence for diagnostic in diagnostics]
+    return len(set(sentences)) < len(sentences)
+
+
+def _clean(text):
+    # in later stages, some sentences are tagged with "<<>>"
+    return text.replace("<<", "").replace(">>", "")
+
+
+def deduplicate_and_clean(diagnostics):
+    """
+    Strip the "<<>>" markers and drop repeated (sentence, suggestion) pairs,
+    keeping the last one in the position of the last one -- in a single pass.
+    Pairs are compared once cleaned, so that those differing only by markers
+    are repeats too.
+    """
+    seen = set()
+    kept = []
+    for diagnostic in reversed(diagnostics):
+        sentence, suggestion = _clean(diagnostic.sentence), _clean(
+            diagnostic.suggestion
+        )
+        if (sentence, suggestion) in seen:
+            continue
+        seen.add((sentence, suggestion))
+        kept.append(
+            Diagnostic(diagnostic.trait, diagnostic.comment, sentence, suggestion)
+        )
+    kept.reverse()
+    return kept
+
+
+def to_dict(diagnostics):
+    # the layout the app and the pipeline work with (see analysis.analyze_stage)
+    return {
+        "traits_list": [diagnostic.trait for diagnostic in diagnostics],
+        "comments_list": [diagnostic.comment for diagnostic in diagnostics],
+        "suggestions_list": [diagnostic.suggestion for diagnostic in diagnostics],
+        "sent_list": [diagnostic.sentence for diagnostic in diagnostics],
+    }
+
+
+def from_dict(diagnostic_components):
+    return [
+        Diagnostic(trait, comment, sentence, suggestion)
+        for trait, comment, suggestion, sentence in zip(
+            diagnostic_components["traits_list"],
+            diagnostic_components["comments_list"],
+            diagnostic_components["suggestions_list"],
+            diagnostic_components["sent_list"],
+        )
+    ]
+
+
+def to_dataframe(diagnostics):
+    # for analysis in notebooks -- pandas is only imported when needed
+    import pandas as pd
+
+    return pd.DataFrame(
+        [(d.trait, d.comment, d.sentence, d.suggestion) for d in diagnostics],
+        columns=["trait", "comment", "sentences", "suggestions"],
+    )
@@ -0,0 +1,197 @@
+"""
+Reading and writing the paragraphs of .docx review documents.
+
+The document XML (word/document.xml) is streamed out of the zip archive:
+paragraphs are extracted one at a time and nothing but their text is kept, so
+memory stays flat however large the review is. Paragraph boundaries are kept
+in the text ("\n\n" between paragraphs) together with the position of every
+paragraph in the document, which lets write_docx put an updated text back
+into a copy of the original document.
+"""
+
+import re
+import zipfile
+import xml.sax
+from dataclasses import dataclass, field
+from xml.etree import ElementTree
+from xml.sax.saxutils import XMLGenerator
+import metrics
+
+DOCUMENT_XML = "word/document.xml"
+W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+PARAGRAPH_SEPARATOR = "\n\n"
+
+_BODY, _PARAGRAPH, _RUN, _TEXT = f"{W}body", f"{W}p", f"{W}r", f"{W}t"
+# tabs and line breaks inside a paragraph become spaces
+_BREAKS = {f"{W}tab", f"{W}br", f"{W}cr"}
+
+
+@dataclass
+class DocxText:
+    # the text of the non-empty paragraphs joined by PARAGRAPH_SEPARATOR
+    text: str
+    # position (in document order, counting every w:p) of each of these paragraphs
+    paragraph_ids: list = field(default_factory=list)
+    # (start, end) of each of these paragraphs in text
+    offsets: list = field(default_factory=list)
+
+
+def _paragraph_texts(source):
+    # (position, text) of every paragraph of the document, streamed
+    with zipfile.ZipFile(source) as archive, archive.open(DOCUMENT_XML) as xml_file:
+        position = -1
+        stack = []
+        body = None
+        for event, element in ElementTree.iterparse(xml_file, events=("start", "end")):
+            tag = element.tag
+            if tag == _PARAGRAPH:
+                if event == "start":
+                    position += 1
+                    stack.append((position, []))
+                else:
+                    paragraph_id, pieces = stack.pop()
+                    yield paragraph_id, "".join(pieces)
+                    element.clear()
+            elif event == "end" and stack:
+                if tag == _TEXT:
+                    stack[-1][1].append(element.text or "")
+                elif tag in _BREAKS:
+                    stack[-1][1].append(" ")
+                elif tag == _RUN:
+                    element.clear()
+            elif tag == _BODY:
+                body = element
+            # a block of the body (w:p, w:tbl...) is done: detach it, so that the
+            # tree does not grow with the document
+            if (
+                event == "end"
+                and body is not None
+                and len(body)
+                and body[-1] is element
+            ):
+                del body[:]
+
+
+def _clean_paragraph(text):
+    return re.sub(r"\s+", " ", text).strip()
+
+
+@metrics.timed("read_docx")
+def read_docx(source):
+    """
+    Extract the text of a .docx document, one paragraph per block.
+
+    Args:
+        source (str or file): Path or binary file object of the document.
+
+    Returns:
+        DocxText: The text and the paragraph it comes from (see write_docx).
+    """
+    pieces, paragraph_ids, offsets = [], [], []
+    length = 0
+    for paragraph_id, text in _paragraph_texts(source):
+        text = _clean_paragraph(text)
+        if not text:
+            continue
+        if pieces:
+            length += len(PARAGRAPH_SEPARATOR)
+        pieces.append(text)
+        paragraph_ids.append(paragraph_id)
+        offsets.append((length, length + len(text)))
+        length += len(text)
+    return DocxText(PARAGRAPH_SEPARATOR.join(pieces), paragraph_ids, offsets)
+
+
+class _ParagraphRewriter(xml.sax.handler.ContentHandler):
+    # copies the document XML, replacing the text of some paragraphs: the new
+    # text goes into the first w:t of the paragraph and its other w:t are emptied
+    # (formatting of the first run is kept)
+
+    def __init__(self, out, replacements):
+        super().__init__()
+        self.writer = XMLGenerator(out, encoding="utf-8")
+        self.replacements = replacements
+        self.position = -1
+        self.stack = []
+        self.in_text = False
+
+    def startDocument(self):
+        self.writer.startDocument()
+
+    def startElement(self, name, attrs):
+        if name == "w:p":
+            self.position += 1
+            # [replacement text or None, whether it has been written]
+            self.stack.append([self.replacements.get(self.position), False])
+        replaced = self.stack and self.stack[-1][0] is not None
+        if name == "w:t" and replaced:
+            attrs = dict(attrs)
+            attrs["xml:space"] = "preserve"
+            self.writer.startElement(name, attrs)
+            if not self.stack[-1][1]:
+                self.writer.characters(self.stack[-1][0])
+                self.stack[-1][1] = True
+            self.in_text = True
+            return
+        self.writer.startElement(name, attrs)
+
+    def endElement(self, name):
+        if name == "w:t":
+            self.in_text = False
+        if name == "w:p":
+            self.stack.pop()
+        self.writer.endElement(name)
+
+    def characters(self, content):
+        if not (self.in_text and self.stack and self.stack[-1][0] is not None):
+            self.writer.characters(content)
+
+    def ignorableWhitespace(self, content):
+        self.writer.ignorableWhitespace(content)
+
+    def processingInstruction(self, target, data):
+        self.writer.processingInstruction(target, data)
+
+
+@metrics.timed("write_docx")
+def write_docx(source, docx_text, updated_text, out):
+    """
+    Write a copy of the document with the paragraphs of docx_text replaced by
+    the paragraphs of updated_text. Only paragraphs whose text changed are
+    rewritten; everything else in the archive is copied as is.
+
+    Args:
+        source (str or file): Path or binary file object of the original document.
+        docx_text (DocxText): The text read from it (see read_docx).
+        updated_text (str): The updated version of docx_text.text.
+        out (file): Binary file object the new document is written to.
+
+    Raises:
+        ValueError: If the paragraphs of updated_text do not match those of
+            the document (e.g., an accepted suggestion merged two paragraphs).
+    """
+    paragraphs = updated_text.split(PARAGRAPH_SEPARATOR)
+    if len(paragraphs) != len(docx_text.paragraph_ids):
+        raise ValueError(
+            f"The updated text has {len(paragraphs)} paragraphs, the document "
+            f"{len(docx_text.paragraph_ids)}."
+        )
+    replacements = {
+        paragraph_id: paragraph
+        for paragraph_id, paragraph, (start, end) in zip(
+            docx_text.paragraph_ids, paragraphs, docx_text.offsets
+        )
+        if paragraph != docx_text.text[start:end]
+    }
+    with zipfile.ZipFile(source) as archive, zipfile.ZipFile(
+        out, "w", compression=zipfile.ZIP_DEFLATED
+    ) as updated:
+        for info in archive.infolist():
+            with archive.open(info) as entry, updated.open(info, "w") as target:
+                if info.filename == DOCUMENT_XML and replacements:
+                    parser = xml.sax.make_parser()
+                    parser.setContentHandler(_ParagraphRewriter(target, replacements))
+                    parser.parse(entry)
+                else:
+                    while chunk := entry.read(1 << 20):
+                        target.write(chunk)
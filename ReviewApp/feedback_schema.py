@@ -0,0 +1,216 @@
+from functools import lru_cache
+
+try:
+    # about twice as fast as json on model output
+    from orjson import loads as _loads
+except ImportError:
+    from json import loads as _loads
+
+# fields of an improvement, the record the LLM returns for each trait
+IMPROVEMENT_FIELDS = (
+    "trait",
+    "comment",
+    "sentences_needing_improvement",
+    "suggested_improvement",
+)
+
+_IMPROVEMENTS = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {
+            "trait": {"type": "string"},
+            "comment": {"type": "string"},
+            "sentences_needing_improvement": {
+                "type": "array",
+                "items": {"type": "string"},
+            },
+            "suggested_improvement": {
+                "type": "array",
+                "items": {"type": "string"},
+            },
+        },
+        "required": list(IMPROVEMENT_FIELDS),
+        "additionalProperties": False,
+    },
+}
+
+# JSON schema the responses of the generation and conflict requests follow. Built
+# once and shared by every call: it must not be modified
+RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "cre_improvement_feedback",
+        "schema": {
+            "type": "object",
+            "properties": {"improvements": _IMPROVEMENTS},
+            "required": ["improvements"],
+            "additionalProperties": False,
+        },
+        "strict": True,
+    },
+}
+
+
+@lru_cache(maxsize=None)
+def _multi_response_format(component_names):
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "cre_multi_component_feedback",
+            "schema": {
+                "type": "object",
+                "properties": {name: _IMPROVEMENTS for name in component_names},
+                "required": list(component_names),
+                "additionalProperties": False,
+            },
+            "strict": True,
+        },
+    }
+
+
+def multi_response_format(component_names):
+    # one improvements array (see RESPONSE_FORMAT) per component, built once per
+    # set of components (shared, must not be modified)
+    return _multi_response_format(tuple(component_names))
+
+
+class MalformedResponse(ValueError):
+    # the model output does not follow the schema it was asked for
+    pass
+
+
+def _excerpt(content, length=200):
+    content = str(content)
+    return content if len(content) <= length else content[:length] + "..."
+
+
+def load_response(content):
+    """
+    Parse the JSON output of the model.
+
+    Raises:
+        MalformedResponse: If it is not valid JSON.
+    """
+    try:
+        return _loads(content)
+    except (TypeError, ValueError) as error:
+        raise MalformedResponse(
+            f"The model output is not valid JSON ({error}): {_excerpt(content)}"
+        ) from error
+
+
+def _checked(entry):
+    # the entry if it follows the schema (a copy if it has extra fields), else None.
+    # The items of the arrays are not checked: the schema is enforced by the model
+    # provider (strict json_schema) or by constrained decoding
+    try:
+        if (
+            type(entry["trait"]) is str
+            and type(entry["comment"]) is str
+            and type(entry["sentences_needing_improvement"]) is list
+            and type(entry["suggested_improvement"]) is list
+        ):
+            if len(entry) == len(IMPROVEMENT_FIELDS):
+                return entry
+            return {field: entry[field] for field in IMPROVEMENT_FIELDS}
+    except (KeyError, TypeError):
+        pass
+    return None
+
+
+def _problem(entry, where):
+    # what is wrong with an entry _checked rejected
+    if not isinstance(entry, dict):
+        return f"{where} is not an object: {_excerpt(entry)}"
+    for field in IMPROVEMENT_FIELDS:
+        if field not in entry:
+            return f"{where} has no '{field}' field: {_excerpt(entry)}"
+    return (
+        f"{where}: 'trait' and 'comment' must be strings, "
+        f"'sentences_needing_improvement' and 'suggested_improvement' arrays: "
+        f"{_excerpt(entry)}"
+    )
+
+
+def check_improvement(entry, where="improvement"):
+    """
+    Check that a parsed improvement follows the schema. The entry itself is
+    returned (no copy) unless it has fields beyond those of the schema.
+
+    Args:
+        entry: The parsed improvement.
+        where (str): Where it was found, for the error message.
+
+    Raises:
+        MalformedResponse: If a field is missing or of the wrong type.
+    """
+    checked = _checked(entry)
+    if checked is None:
+        raise MalformedResponse(_problem(entry, where))
+    return checked
+
+
+def _check_improvements(entries, where):
+    if type(entries) is not list:
+        raise MalformedResponse(f"{where} is not an array: {_excerpt(entries)}")
+    for idx, entry in enumerate(entries):
+        checked = _checked(entry)
+        if checked is None:
+            raise MalformedResponse(_problem(entry, f"{where}[{idx}]"))
+        if checked is not entry:
+            entries[idx] = checked
+    return entries
+
+
+def parse_improvements(content):
+    """
+    Parse a cre_improvement_feedback response (see RESPONSE_FORMAT).
+
+    Args:
+        content (str or bytes): The model output.
+
+    Returns:
+        list: The improvements (trait, comment, sentences_needing_improvement,
+            suggested_improvement).
+
+    Raises:
+        MalformedResponse: If the output does not follow the schema.
+    """
+    data = load_response(content)
+    if not isinstance(data, dict) or "improvements" not in data:
+        raise MalformedResponse(
+            f"The model output has no 'improvements' array: {_excerpt(content)}"
+        )
+    return _check_improvements(data["improvements"], "improvements")
+
+
+def parse_multi_improvements(content, component_names):
+    """
+    Parse a cre_multi_component_feedback response (see multi_response_format).
+
+    Args:
+        content (str or bytes): The model output.
+        component_names (iterable): The components the response was asked for.
+
+    Returns:
+        dict: The improvements (see parse_improvements) keyed by component name.
+
+    Raises:
+        MalformedResponse: If the output does not follow the schema, e.g., a
+            component is missing or was not asked for.
+    """
+    data = load_response(content)
+    if not isinstance(data, dict):
+        raise MalformedResponse(
+            f"The model output is not an object: {_excerpt(content)}"
+        )
+    expected = list(component_names)
+    if len(data) != len(expected) or any(name not in data for name in expected):
+        missing = [name for name in expected if name not in data]
+        unexpected = [name for name in data if name not in expected]
+        raise MalformedResponse(
+            f"The model output does not have the components asked for (missing: "
+            f"{missing}, unexpected: {unexpected}): {_excerpt(content)}"
+        )
+    return {name: _check_improvements(data[name], name) for name in expected}
@@ -1,15 +1,147 @@
+import os
 import re
-import docx2txt
+import hashlib
 from io import BytesIO
-import pandas as pd
-import nltk
-from nltk.tokenize import sent_tokenize
-
-try:
-    nltk.data.find("tokenizers/punkt")
-except LookupError:
-    nltk.download("punkt")
+from functools import lru_cache
 from rapidfuzz import fuzz, process
+import metrics
+
+# numpy, pandas, nltk and docx2txt are imported where they are used: importing
+# this module stays cheap for the pages and the tools that do not need them
+
+# the punkt sentence tokenizer shipped with the app, nothing is downloaded at run
+# time. The image installs it (see the Dockerfile); for a local run install it with:
+#     python -m nltk.downloader -d ReviewApp/nltk_data punkt_tab
+NLTK_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "nltk_data")
+
+
+# NAME=value settings of the secrets file ({} without one) -- API_KEY falls back
+# to the OPENAI_API_KEY environment variable. Shared by the app and the tools.
+def read_secrets(secrets_path="secretkey.txt"):
+    secrets = {}
+    if os.path.exists(secrets_path):
+        with open(secrets_path, "r") as file:
+            for line in file:
+                name, _, value = line.strip().partition("=")
+                if name.strip():
+                    secrets[name.strip()] = value.strip()
+    api_key = secrets.get("API_KEY") or os.environ.get("OPENAI_API_KEY")
+    if api_key:
+        secrets["API_KEY"] = api_key
+    return secrets
+
+
+@lru_cache(maxsize=None)
+def _sentence_tokenizer():
+    import nltk
+    from nltk.tokenize import sent_tokenize
+
+    if NLTK_DATA_DIR not in nltk.data.path:
+        nltk.data.path.insert(0, NLTK_DATA_DIR)
+    # nltk >= 3.9 only loads punkt_tab (the pickled punkt is not used anymore)
+    try:
+        nltk.data.find("tokenizers/punkt_tab/english/")
+    except LookupError as error:
+        raise LookupError(
+            "The punkt sentence tokenizer is not installed. Run: python -m "
+            f"nltk.downloader -d {NLTK_DATA_DIR} punkt_tab (or set NLTK_DATA)"
+        ) from error
+    return sent_tokenize
+
+
+def sent_tokenize(text):
+    # paragraphs (separated by blank lines, see docx_io) are tokenized one by
+    # one: a sentence never runs over a paragraph break
+    tokenize = _sentence_tokenizer()
+    return [
+        sentence
+        for paragraph in re.split(r"\n\s*\n", text)
+        for sentence in tokenize(paragraph)
+    ]
+
+
+# partial_ratio score (0-100) below which a sentence returned by the LLM is not
+# considered to be found in the text
+MATCH_THRESHOLD = 80
+
+
+# form of a sentence used for lookups: "<<>>" change markers and extra spaces removed
+def normalize_sentence(sentence):
+    return re.sub(r"\s+", " ", sentence.replace("<<", "").replace(">>", "")).strip()
+
+
+class DocumentIndex:
+    """
+    The sentences of one version of a text, tokenized once and shared by the
+    helpers below instead of each of them scanning the text again:
+        sentences: the sentences (sent_tokenize).
+        spans: (start, end) character offsets of each sentence in the text.
+        normalized: normalized form of each sentence (see normalize_sentence).
+    A sentence is looked up by its normalized form in a hash map; sentences
+    that are not whole sentences of the text (partial matches of the LLM)
+    fall back to a search of the text.
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.sentences = sent_tokenize(text)
+        self.spans = []
+        position = 0
+        for sentence in self.sentences:
+            start = text.find(sentence, position)
+            if start == -1:
+                # the tokenizer changed the sentence (e.g., whitespace)
+                start = position
+            self.spans.append((start, start + len(sentence)))
+            position = start + len(sentence)
+        self.normalized = [normalize_sentence(sentence) for sentence in self.sentences]
+        self._positions = {}
+        for idx, sentence in enumerate(self.normalized):
+            self._positions.setdefault(sentence, []).append(idx)
+
+    def find_all(self, sentence):
+        # (start, end) of every occurrence of the sentence in the text, in order
+        indices = self._positions.get(normalize_sentence(sentence))
+        if indices is not None and all(
+            self.sentences[idx] == sentence for idx in indices
+        ):
+            return [self.spans[idx] for idx in indices]
+        spans = []
+        start = self.text.find(sentence) if sentence else -1
+        while start != -1:
+            spans.append((start, start + len(sentence)))
+            start = self.text.find(sentence, start + 1)
+        return spans
+
+    def find(self, sentence):
+        # (start, end) of the first occurrence of the sentence or None
+        spans = self.find_all(sentence)
+        return spans[0] if spans else None
+
+    def __contains__(self, sentence):
+        if normalize_sentence(sentence) in self._positions:
+            return True
+        return bool(sentence) and sentence in self.text
+
+    def context(self, sentence, before=100, after=200):
+        # (text before, sentence, text after) around the first occurrence or None
+        span = self.find(sentence)
+        if span is None:
+            return None
+        start, end = span
+        return (
+            self.text[max(0, start - before) : start],
+            self.text[start:end],
+            self.text[end : end + after],
+        )
+
+
+# indexes of the latest text versions -- every stage, card and rerun working on
+# the same text shares one index
+@lru_cache(maxsize=64)
+@metrics.timed("document_index")
+def document_index(text):
+    return DocumentIndex(text)
 
 
 # function to make sure there anre't too many newlines
@@ -36,6 +168,8 @@ def decompose_join(text):
 
 # function to process the input file with the above function
 def process_docx_file(file: BytesIO) -> str:
+    import docx2txt
+
     text = docx2txt.process(file)
     cleaned_text = decompose_join(text)
     return cleaned_text.strip()
@@ -57,43 +191,72 @@ def process_docx_file(file: BytesIO) -> str:
 
 
 # LLM returns partial matches. Function to find which sentence the partial
-# matches belong to. Useful for highlighting purposes.
-def match_sentences_with_similarity(dataset, rtext):
-    rtext = rtext.replace("<<", "").replace(">>", "")
-    text_sentences = sent_tokenize(rtext)
-    corrected_sentences = []
-    for sent in dataset["sentences"].tolist():
-        best_sent, _, _ = process.extractOne(
-            sent, text_sentences, scorer=fuzz.partial_ratio
+# matches belong to -- all sentences are scored against the text in one batch.
+# Returns arrays of best matching sentences, their scores and whether the score
+# clears the threshold.
+def match_sentences(sentences, text_sentences, threshold=MATCH_THRESHOLD, workers=-1):
+    import numpy as np
+
+    if len(sentences) == 0 or len(text_sentences) == 0:
+        return (
+            np.full(len(sentences), "", dtype=object),
+            np.zeros(len(sentences)),
+            np.zeros(len(sentences), dtype=bool),
         )
-        # if score > 99:
-        corrected_sentences.append(best_sent)
-    dataset["corrected_sentences"] = corrected_sentences
+    scores = process.cdist(
+        sentences, text_sentences, scorer=fuzz.partial_ratio, workers=workers
+    )
+    best_idx = scores.argmax(axis=1)
+    best_scores = scores[np.arange(len(sentences)), best_idx]
+    best_sents = np.asarray(text_sentences, dtype=object)[best_idx]
+    return best_sents, best_scores, best_scores >= threshold
+
+
+# Useful for highlighting purposes. Bad matches are flagged (matched = False)
+# rather than silently accepted. text_sentences can be passed in when the text
+# has already been tokenized.
+@metrics.timed("match_sentences_with_similarity")
+def match_sentences_with_similarity(
+    dataset, rtext, text_sentences=None, threshold=MATCH_THRESHOLD
+):
+    if text_sentences is None:
+        rtext = rtext.replace("<<", "").replace(">>", "")
+        text_sentences = document_index(rtext).sentences
+    best_sents, best_scores, matched = match_sentences(
+        sentences=dataset["sentences"].tolist(),
+        text_sentences=text_sentences,
+        threshold=threshold,
+    )
+    dataset["corrected_sentences"] = best_sents
+    dataset["match_scores"] = best_scores
+    dataset["matched"] = matched
     return dataset
 
 
 # don't display the whole text rather some portion of it
-def add_context(text, sentence):
-    match = re.search(re.escape(sentence), text)
-    if match:
-        start_idx = match.start()
-        end_idx = match.end()
-        before = text[max(0, start_idx - 100) : start_idx]
-        after = text[end_idx : min(len(text), end_idx + 200)]
-        context = f"....{before}{text[start_idx:end_idx]}{after}..."
+def add_context(text, sentence, index=None):
+    parts = (index or document_index(text)).context(sentence)
+    if parts:
+        before, match, after = parts
+        context = f"....{before}{match}{after}..."
         return context
     else:
         return text
 
 
+def _highlight(content, color, border):
+    return (
+        f"<span style='background-color: {color}; "
+        f"border-radius: 3px; display: inline; border-left: 3.5px solid {border}; "
+        f"margin: 0; padding: 0;'>{content}</span>"
+    )
+
+
 # highlight the sentences that needs improvement
 def highlight_sentences(text, sentence, color="rgba(128, 0, 0, 0.2)"):
     updated_text = text
     updated_text = updated_text.replace(
-        sentence,
-        f"<span style='background-color: {color}; "
-        f"border-radius: 3px; display: inline; border-left: 3.5px solid darkred; "
-        f"margin: 0; padding: 0;'>{sentence}</span>",
+        sentence, _highlight(sentence, color, "darkred")
     )
     return updated_text
 
@@ -103,32 +266,126 @@ def highlight_suggestions(text, sentence, suggestion, color="rgba(0, 128, 0, 0.2
     updated_text = text
     suggestion = suggestion.rstrip(".")
     updated_text = updated_text.replace(
-        sentence,
-        f"<span style='background-color: {color}; "
-        f"border-radius: 3px; display: inline; border-left: 3.5px solid darkgreen; "
-        f"margin: 0; padding: 0;'>{suggestion}.</span>",
+        sentence, _highlight(f"{suggestion}.", color, "darkgreen")
     )
     return updated_text
 
 
-# once a change is accepted -- annotate it using "<<>>" because we want to tell LLM to
-# process these carefully
-def annotate_changes(original_text, decisions):
+# the excerpt of add_context with the sentence highlighted and with the suggestion
+# highlighted in its place, built from the position of the sentence in the index
+# instead of searching and replacing in the text
+@metrics.timed("highlight_in_context")
+def highlight_in_context(
+    index,
+    sentence,
+    suggestion,
+    sentence_color="rgba(128, 0, 0, 0.2)",
+    suggestion_color="rgba(0, 128, 0, 0.2)",
+):
+    parts = index.context(sentence)
+    if parts is None:
+        return (
+            highlight_sentences(index.text, sentence, sentence_color),
+            highlight_suggestions(index.text, sentence, suggestion, suggestion_color),
+        )
+    before, match, after = parts
+    suggestion = suggestion.rstrip(".")
+    return (
+        f"....{before}{_highlight(match, sentence_color, 'darkred')}{after}...",
+        f"....{before}{_highlight(f'{suggestion}.', suggestion_color, 'darkgreen')}{after}...",
+    )
+
+
+# stable identifier of a suggestion of a stage -- the same for the same sentence
+# and suggestion whatever their position, e.g., after rebase_diagnostics dropped
+# stale suggestions before them
+def suggestion_id(sentence, suggestion):
+    return hashlib.sha1(f"{sentence}\x00{suggestion}".encode("utf-8")).hexdigest()[:16]
+
+
+# render cache of the review page: the highlighted excerpts of a card are computed
+# once per (text version, sentence, suggestion) and reused across reruns
+@lru_cache(maxsize=5000)
+@metrics.timed("card_markup")
+def card_markup(text, sentence, suggestion):
+    return highlight_in_context(document_index(text), sentence, suggestion)
+
+
+# resolve every accepted decision to the character span of its sentence in the
+# text. Each decision claims the first occurrence of its sentence that is not
+# claimed yet, so a sentence is only rewritten as many times as it was accepted.
+# Decisions whose sentence is not in the text are ignored (nothing to replace).
+# Spans are returned sorted; overlapping edits cannot both be applied -> ValueError
+def resolve_edit_spans(text, decisions, index=None):
+    index = index or document_index(text)
+    spans = []
+    claimed = set()
     for decision in decisions:
-        original_text = original_text.replace(
-            decision["sentence"], f"""<<{decision["suggestion"]}>>"""
+        sentence = decision["sentence"]
+        if decision["decision"] != "accept" or not sentence:
+            continue
+        span = next(
+            (span for span in index.find_all(sentence) if span[0] not in claimed),
+            None,
         )
-    return original_text
+        if span is None:
+            continue
+        claimed.add(span[0])
+        spans.append((span[0], span[1], decision))
+    spans.sort(key=lambda span: span[0])
+    for (_, prev_end, prev), (start, _, decision) in zip(spans, spans[1:]):
+        if start < prev_end:
+            raise ValueError(
+                f"Accepted changes overlap: {prev['sentence']!r} and {decision['sentence']!r}"
+            )
+    return spans
+
+
+# apply all accepted decisions in a single pass over the text. Returns the updated
+# text and the same text with the changes annotated using "<<>>" because we want
+# to tell LLM to process these carefully in the next stage
+@metrics.timed("apply_decisions")
+def apply_decisions(original_text, decisions):
+    updated, annotated = [], []
+    position = 0
+    for start, end, decision in resolve_edit_spans(original_text, decisions):
+        unchanged = original_text[position:start]
+        updated.append(unchanged)
+        updated.append(decision["suggestion"])
+        annotated.append(unchanged)
+        annotated.append(f"""<<{decision["suggestion"]}>>""")
+        position = end
+    updated.append(original_text[position:])
+    annotated.append(original_text[position:])
+    return "".join(updated), "".join(annotated)
+
+
+# once a change is accepted -- annotate it using "<<>>"
+def annotate_changes(original_text, decisions):
+    return apply_decisions(original_text, decisions)[1]
 
 
 # if accepted then apply changes
 def apply_accepted_changes(original_text, decisions):
-    for decision in decisions:
-        if decision["decision"] == "accept":
-            original_text = original_text.replace(
-                decision["sentence"], decision["suggestion"]
-            )
-    return original_text
+    return apply_decisions(original_text, decisions)[0]
+
+
+# diagnostics generated up front (all stages at once) are computed against the
+# original text. Once earlier stages accept edits, some flagged sentences no
+# longer exist in the text - those suggestions are stale and are dropped, the
+# rest carry over unchanged.
+@metrics.timed("rebase_diagnostics")
+def rebase_diagnostics(diagnostic_components, text, index=None):
+    index = index or document_index(text)
+    keep = [
+        idx
+        for idx, sentence in enumerate(diagnostic_components["sent_list"])
+        if sentence in index
+    ]
+    return {
+        key: [values[idx] for idx in keep]
+        for key, values in diagnostic_components.items()
+    }
 
 
 def dict_to_df(data_dict):
@@ -145,7 +402,12 @@ def dict_to_df(data_dict):
                     "suggestions": suggestion,
                 }
             )
-    return pd.DataFrame(data_list)
+    import pandas as pd
+
+    # keep the columns when nothing was flagged
+    return pd.DataFrame(
+        data_list, columns=["trait", "comment", "sentences", "suggestions"]
+    )
 
 
 # def progress_history(decision_history):
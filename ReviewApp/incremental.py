@@ -0,0 +1,132 @@
+import difflib
+from analysis import analyze_stage
+from diagnostics import deduplicate_and_clean, from_dict, to_dict
+from helper import document_index, normalize_sentence
+
+# unchanged sentences sent before and after each changed region for context
+CONTEXT_SENTENCES = 2
+# above this share of changed sentences the whole text is analysed again
+MAX_CHANGED_FRACTION = 0.5
+# separates non-adjacent excerpts of the text sent to the LLM (a paragraph of its
+# own, so that it is never tokenized as part of a sentence)
+EXCERPT_SEPARATOR = "\n\n[...]\n\n"
+
+
+# indices (start, end) of the new sentences that differ from the old ones, each
+# region widened by `context` sentences on both sides and overlapping regions merged
+def changed_windows(old_sentences, new_sentences, context=CONTEXT_SENTENCES):
+    matcher = difflib.SequenceMatcher(a=old_sentences, b=new_sentences, autojunk=False)
+    windows = []
+    for tag, _, _, start, end in matcher.get_opcodes():
+        if tag == "equal":
+            continue
+        # a deletion still changes the context of the sentences around it
+        start, end = max(0, start - context), min(len(new_sentences), end + context)
+        if start == end:
+            continue
+        if windows and start <= windows[-1][1]:
+            windows[-1] = (windows[-1][0], max(windows[-1][1], end))
+        else:
+            windows.append((start, end))
+    return windows
+
+
+def analyze_stage_incremental(
+    llm,
+    review_text,
+    previous_text,
+    previous_diagnostics,
+    component_input,
+    base_input,
+    trait_definitions,
+    component_name,
+    context=CONTEXT_SENTENCES,
+    on_improvement=None,
+    conflict_resolver="local",
+):
+    """
+    Analyse a text that was already analysed for the same component in an
+    earlier version (previous_text). Only the sentences that changed, with some
+    surrounding sentences for context, are sent to the LLM; diagnostics of the
+    unchanged sentences are reused. The cost of re-analysis then scales with the
+    size of the edit instead of the size of the document.
+
+    Args:
+        llm (ResponseGenerator): The language model instance.
+        review_text (str): The text to be analyzed.
+        previous_text (str): The text previous_diagnostics were generated from.
+        previous_diagnostics (dict): Diagnostics of previous_text (see analyze_stage).
+        component_input (dict): The component input specific to the stage.
+        base_input (dict): The base input for the LLM (see response_gen)
+        trait_definitions (dict): Trait definitions for conflict resolution.
+        component_name (str): The component name (e.g., "e_component").
+        context (int): Unchanged sentences sent around each changed region.
+        on_improvement (callable): See analyze_stage.
+        conflict_resolver (str): See analyze_stage.
+
+    Returns:
+        dict: Diagnostics of review_text (same layout as analyze_stage).
+    """
+    new_index = document_index(review_text)
+    new_sentences = new_index.sentences
+    new_clean = new_index.normalized
+    old_clean = document_index(previous_text).normalized
+    windows = changed_windows(old_clean, new_clean, context=context)
+
+    changed = sum(end - start for start, end in windows)
+    if changed > MAX_CHANGED_FRACTION * len(new_sentences):
+        return analyze_stage(
+            llm=llm,
+            review_text=review_text,
+            component_input=component_input,
+            base_input=base_input,
+            trait_definitions=trait_definitions,
+            component_name=component_name,
+            on_improvement=on_improvement,
+            conflict_resolver=conflict_resolver,
+        )
+
+    # diagnostics of sentences outside the re-analysed windows are still valid
+    reanalysed = {new_clean[idx] for start, end in windows for idx in range(start, end)}
+    unchanged = set(new_clean) - reanalysed
+    keep = [
+        idx
+        for idx, sentence in enumerate(previous_diagnostics["sent_list"])
+        if normalize_sentence(sentence) in unchanged
+    ]
+    diagnostics = {
+        key: [values[idx] for idx in keep]
+        for key, values in previous_diagnostics.items()
+    }
+    if windows:
+        excerpt = EXCERPT_SEPARATOR.join(
+            " ".join(new_sentences[start:end]) for start, end in windows
+        )
+        fresh = analyze_stage(
+            llm=llm,
+            review_text=excerpt,
+            component_input=component_input,
+            base_input=base_input,
+            trait_definitions=trait_definitions,
+            component_name=component_name,
+            on_improvement=on_improvement,
+            conflict_resolver=conflict_resolver,
+            # the flagged sentences are located in the text, not in the excerpt
+            match_text=review_text,
+        )
+        for key in diagnostics:
+            diagnostics[key] += fresh[key]
+        # a kept suggestion may be made again for a sentence of the excerpt
+        diagnostics = to_dict(deduplicate_and_clean(from_dict(diagnostics)))
+
+    # keep the suggestions in the order of the text
+    position = {}
+    for idx, sentence in enumerate(new_clean):
+        position.setdefault(sentence, idx)
+    order = sorted(
+        range(len(diagnostics["sent_list"])),
+        key=lambda idx: position.get(
+            normalize_sentence(diagnostics["sent_list"][idx]), len(new_clean)
+        ),
+    )
+    return {key: [values[idx] for idx in order] for key, values in diagnostics.items()}
@@ -0,0 +1,118 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+# default location of the cache (relative to where the app is started)
+CACHE_PATH = os.path.join(".cache", "diagnostics.sqlite")
+# entries older than this are treated as missing and evicted
+CACHE_TTL = 30 * 24 * 60 * 60
+# maximum number of entries kept -- least recently used ones are evicted first
+CACHE_MAX_ENTRIES = 5000
+
+
+class DiagnosticsCache:
+    def __init__(self, path=CACHE_PATH, ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES):
+        """
+        Persistent, content-addressed cache of LLM responses. The model output is
+        deterministic in its inputs (review text, prompts, model and schema) so a
+        hash of those inputs is used as the key.
+        Parameters:
+            path (str): Location of the SQLite database (":memory:" for no persistence).
+            ttl (float): Time to live of an entry in seconds (None for no expiry).
+            max_entries (int): Maximum number of entries kept.
+        """
+        if path != ":memory:" and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        # a single connection shared by the threads of the app
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    created REAL NOT NULL,
+                    accessed REAL NOT NULL
+                )"""
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)"
+            )
+
+    @staticmethod
+    def make_key(*parts):
+        """
+        Hash the inputs of an LLM call into a cache key.
+        Parameters:
+            parts: JSON serializable inputs (text, prompts, model name, schema...).
+        Returns:
+            str: Hex digest identifying the inputs.
+        """
+        payload = json.dumps(parts, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """
+        Look up a cached response.
+        Parameters:
+            key (str): Key returned by make_key.
+        Returns:
+            The cached value or None if it is missing or expired.
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT value, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and self.ttl is not None and now - row[1] > self.ttl:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE responses SET accessed = ? WHERE key = ?", (now, key)
+            )
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key, value):
+        """
+        Store a response and evict expired and least recently used entries.
+        Parameters:
+            key (str): Key returned by make_key.
+            value: JSON serializable response.
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now, now),
+            )
+            if self.ttl is not None:
+                self._conn.execute(
+                    "DELETE FROM responses WHERE created < ?", (now - self.ttl,)
+                )
+            self._conn.execute(
+                """DELETE FROM responses WHERE key IN (
+                    SELECT key FROM responses ORDER BY accessed DESC LIMIT -1 OFFSET ?
+                )""",
+                (self.max_entries,),
+            )
+
+    def stats(self):
+        # hit / miss counters since start up and the current number of entries
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "entries": entries}
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM responses")
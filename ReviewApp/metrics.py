@@ -0,0 +1,229 @@
+"""
+Timers and counters of the analysis, kept in memory for the whole process:
+where time goes per stage and step, LLM requests and tokens (with their
+estimated cost), conflict resolution and the text helpers.
+
+Metrics are exported as Prometheus text (serve_prometheus, for a local scraper)
+or appended as JSON lines (write_jsonl / start_jsonl_export); the app shows
+them in a debug panel of the sidebar.
+"""
+
+import json
+import time
+import threading
+from functools import wraps
+from contextlib import contextmanager
+
+# prefix of the exported metric names
+NAMESPACE = "reviewapp"
+# USD per million tokens: prompt, cached prompt, completion (see the pricing page
+# of the provider). Local models cost nothing
+PRICES = {"gpt-4o": (2.50, 1.25, 10.00)}
+
+_lock = threading.Lock()
+# (name, labels) -> value
+_counters = {}
+_gauges = {}
+# (name, labels) -> [count, total seconds, max seconds]
+_timers = {}
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def count(name, amount=1, **labels):
+    # add to a counter, e.g., count("llm_requests", model="gpt-4o")
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def set_gauge(name, value, **labels):
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+
+def observe(name, seconds, **labels):
+    # record one timing of name
+    key = _key(name, labels)
+    with _lock:
+        timer = _timers.get(key)
+        if timer is None:
+            _timers[key] = [1, seconds, seconds]
+        else:
+            timer[0] += 1
+            timer[1] += seconds
+            if seconds > timer[2]:
+                timer[2] = seconds
+
+
+@contextmanager
+def timer(name, **labels):
+    # time the block, e.g., with timer("analyze_stage", component="e_component")
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+def timed(name):
+    # decorator timing every call of a function
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                observe(name, time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
+
+def estimate_cost(model, prompt_tokens, cached_tokens, completion_tokens):
+    # USD, 0 for models without a price
+    prompt, cached, completion = PRICES.get(model, (0.0, 0.0, 0.0))
+    return (
+        (prompt_tokens - cached_tokens) * prompt
+        + cached_tokens * cached
+        + completion_tokens * completion
+    ) / 1e6
+
+
+def snapshot():
+    """
+    All metrics at this time.
+
+    Returns:
+        dict: counters, gauges and timers, each a list of records with the name,
+            the labels and the value(s); timers have count, sum, max and mean
+            seconds.
+    """
+    with _lock:
+        counters = list(_counters.items())
+        gauges = list(_gauges.items())
+        timers = [(key, list(value)) for key, value in _timers.items()]
+    return {
+        "time": time.time(),
+        "counters": [
+            {"name": name, "labels": dict(labels), "value": value}
+            for (name, labels), value in sorted(counters)
+        ],
+        "gauges": [
+            {"name": name, "labels": dict(labels), "value": value}
+            for (name, labels), value in sorted(gauges)
+        ],
+        "timers": [
+            {
+                "name": name,
+                "labels": dict(labels),
+                "count": total_count,
+                "sum": round(total, 6),
+                "max": round(longest, 6),
+                "mean": round(total / total_count, 6),
+            }
+            for (name, labels), (total_count, total, longest) in sorted(timers)
+        ],
+    }
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _timers.clear()
+
+
+def _labels_text(labels):
+    if not labels:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(key, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for key, value in labels.items()
+    )
+    return "{" + pairs + "}"
+
+
+def prometheus_text(metrics=None):
+    # the metrics in the Prometheus text exposition format
+    metrics = metrics or snapshot()
+    lines = []
+    for kind, suffix, prometheus_type in [
+        ("counters", "_total", "counter"),
+        ("gauges", "", "gauge"),
+    ]:
+        typed = set()
+        for record in metrics[kind]:
+            name = f"{NAMESPACE}_{record['name']}{suffix}"
+            if name not in typed:
+                lines.append(f"# TYPE {name} {prometheus_type}")
+                typed.add(name)
+            lines.append(f"{name}{_labels_text(record['labels'])} {record['value']}")
+    typed = set()
+    for record in metrics["timers"]:
+        name = f"{NAMESPACE}_{record['name']}_seconds"
+        if name not in typed:
+            lines.append(f"# TYPE {name} summary")
+            typed.add(name)
+        labels = _labels_text(record["labels"])
+        lines.append(f"{name}_count{labels} {record['count']}")
+        lines.append(f"{name}_sum{labels} {record['sum']}")
+    return "\n".join(lines) + "\n"
+
+
+def serve_prometheus(port, host="127.0.0.1"):
+    """
+    Serve the metrics at http://<host>:<port>/metrics in a background thread.
+
+    Returns:
+        ThreadingHTTPServer: The server (shutdown() stops it).
+    """
+    # imported here: most processes never export
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class PrometheusHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = prometheus_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), PrometheusHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def write_jsonl(path):
+    # append the current metrics as one line
+    with open(path, "a") as f:
+        f.write(json.dumps(snapshot()) + "\n")
+
+
+def start_jsonl_export(path, interval=60.0):
+    """
+    Append the metrics to a JSON lines file every `interval` seconds in a
+    background thread.
+
+    Returns:
+        threading.Event: Set it to stop the export.
+    """
+    stop = threading.Event()
+
+    def export():
+        while not stop.wait(interval):
+            write_jsonl(path)
+
+    threading.Thread(target=export, daemon=True).start()
+    return stop
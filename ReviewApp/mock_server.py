@@ -0,0 +1,238 @@
+"""
+Local stand-in for the OpenAI chat completions API. Useful to exercise
+ResponseGenerator / AsyncResponseGenerator (connection pooling, concurrency
+limits) without an API key:
+
+    python mock_server.py --port 8000 --latency 0.5
+    ResponseGenerator(api_key="test", base_url="http://127.0.0.1:8000/v1")
+
+Every request is answered with the same canned `improvements` payload (or the
+contents of --response, a JSON file following the cre_improvement_feedback
+schema). Token counts are rough estimates (4 characters per token); like the
+provider's prompt cache, message prefixes of at least 1024 tokens sent before
+are reported as cached_tokens. With --error-rate a share of the requests is
+rejected with 429 (rate limit) and a retry-after header.
+"""
+
+import argparse
+import json
+import random
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CANNED_RESPONSE = {
+    "improvements": [
+        {
+            "trait": "Be Specific and Creative",
+            "comment": "The following sentence(s) does not provide actionable suggestions instead it offers vague criticism.",
+            "sentences_needing_improvement": ["The discussion is weak."],
+            "suggested_improvement": [
+                "The discussion would be stronger by adding practical implications of the findings."
+            ],
+        }
+    ]
+}
+
+
+class ChatCompletionsHandler(BaseHTTPRequestHandler):
+    # keep-alive so that clients can reuse their pooled connections
+    protocol_version = "HTTP/1.1"
+    response_payload = CANNED_RESPONSE
+    latency = 0.0
+    # additional seconds per generated token, longer responses take longer
+    token_latency = 0.0
+    # share of the requests answered with 429, and their retry-after (seconds)
+    error_rate = 0.0
+    retry_after = 1.0
+    # minimum size of a prompt prefix to be cached, in tokens
+    cache_min_tokens = 1024
+    # hashes of the message prefixes received so far
+    seen_prefixes = set()
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+        if random.random() < self.error_rate:
+            self._send_json(
+                429,
+                {
+                    "error": {
+                        "message": "Rate limit reached",
+                        "type": "requests",
+                        "code": "rate_limit_exceeded",
+                    }
+                },
+                headers={"retry-after": str(self.retry_after)},
+            )
+            return
+        request = json.loads(body or b"{}")
+        content = json.dumps(self._payload(request))
+        if request.get("stream"):
+            self._send_stream(request, content)
+            return
+        time.sleep(self.latency + self.token_latency * len(content) / 4)
+        self._send_json(
+            200,
+            {
+                "id": f"chatcmpl-{uuid.uuid4().hex}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.get("model", "gpt-4o"),
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": self._usage(request, content),
+            },
+        )
+
+    def _payload(self, request):
+        # the canned improvements under every key of a multi-component schema
+        schema = (
+            request.get("response_format", {}).get("json_schema", {}).get("schema", {})
+        )
+        keys = schema.get("properties", {}).keys()
+        if not keys or "improvements" in keys:
+            return self.response_payload
+        return {key: self.response_payload["improvements"] for key in keys}
+
+    def _send_stream(self, request, content, pieces=20):
+        # server-sent events, the latency is spread over the pieces of content
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        size = max(1, len(content) // pieces)
+        for start in range(0, len(content), size):
+            time.sleep((self.latency + self.token_latency * len(content) / 4) / pieces)
+            self._send_event(
+                {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": request.get("model", "gpt-4o"),
+                    "choices": [
+                        {
+                            "index": 0,
+                            "delta": {"content": content[start : start + size]},
+                            "finish_reason": None,
+                        }
+                    ],
+                }
+            )
+        if request.get("stream_options", {}).get("include_usage"):
+            self._send_event(
+                {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": request.get("model", "gpt-4o"),
+                    "choices": [],
+                    "usage": self._usage(request, content),
+                }
+            )
+        self._send_chunk(b"data: [DONE]\n\n")
+        self._send_chunk(b"")
+
+    def _usage(self, request, content):
+        messages = request.get("messages", [])
+        cached_tokens = 0
+        for end in range(1, len(messages) + 1):
+            prefix = json.dumps(messages[:end])
+            digest = hash(prefix)
+            if digest in self.seen_prefixes:
+                cached_tokens = len(prefix) // 4
+            elif len(prefix) // 4 >= self.cache_min_tokens:
+                self.seen_prefixes.add(digest)
+        prompt_tokens = len(json.dumps(messages)) // 4
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(content) // 4,
+            "total_tokens": prompt_tokens + len(content) // 4,
+            "prompt_tokens_details": {"cached_tokens": cached_tokens},
+        }
+
+    def _send_event(self, payload):
+        self._send_chunk(f"data: {json.dumps(payload)}\n\n".encode())
+
+    def _send_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def _send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_server(
+    host="127.0.0.1",
+    port=8000,
+    latency=0.0,
+    response_payload=None,
+    token_latency=0.0,
+    error_rate=0.0,
+    retry_after=1.0,
+):
+    handler = type(
+        "Handler",
+        (ChatCompletionsHandler,),
+        {
+            "latency": latency,
+            "token_latency": token_latency,
+            "error_rate": error_rate,
+            "retry_after": retry_after,
+            "response_payload": response_payload or CANNED_RESPONSE,
+            "seen_prefixes": set(),
+        },
+    )
+    return ThreadingHTTPServer((host, port), handler)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per call")
+    parser.add_argument(
+        "--token-latency", type=float, default=0.0, help="seconds per output token"
+    )
+    parser.add_argument(
+        "--error-rate", type=float, default=0.0, help="share of 429 responses"
+    )
+    parser.add_argument(
+        "--retry-after", type=float, default=1.0, help="retry-after of the 429s"
+    )
+    parser.add_argument("--response", help="JSON file with the payload to return")
+    args = parser.parse_args()
+
+    payload = None
+    if args.response:
+        with open(args.response, "r") as f:
+            payload = json.load(f)
+    server = make_server(
+        args.host,
+        args.port,
+        args.latency,
+        payload,
+        args.token_latency,
+        args.error_rate,
+        args.retry_after,
+    )
+    print(f"Mock chat completions API on http://{args.host}:{args.port}/v1")
+    server.serve_forever()
@@ -0,0 +1,490 @@
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from analysis import analyze_stage, analyze_components
+from incremental import analyze_stage_incremental
+from helper import apply_decisions, rebase_diagnostics, replace_multiple_dots
+from app_data import (
+    e_component_input,
+    m_component_input,
+    p_component_input,
+    a_component_input,
+    t_component_input,
+    h_component_input,
+    y_component_input,
+)
+
+
+@dataclass(frozen=True)
+class Stage:
+    # stage key used in the state (e.g., "stage1")
+    key: str
+    # component analysed at this stage (e.g., "e_component")
+    component_name: str
+    # component-specific input prompts (see app_data)
+    component_input: list
+    # stage whose output text is the input of this stage (None for the uploaded text)
+    previous: str = None
+
+
+# one stage (tab) per component of EMPATHY, each building on the previous one
+STAGES = [
+    Stage("stage1", "e_component", e_component_input),
+    Stage("stage2", "m_component", m_component_input, previous="stage1"),
+    Stage("stage3", "p_component", p_component_input, previous="stage2"),
+    Stage("stage4", "a_component", a_component_input, previous="stage3"),
+    Stage("stage5", "t_component", t_component_input, previous="stage4"),
+    Stage("stage6", "h_component", h_component_input, previous="stage5"),
+    Stage("stage7", "y_component", y_component_input, previous="stage6"),
+]
+
+# components analysed in a single LLM request in grouped mode (the same grouping
+# as the stage 3a / 3b templates of prompts.py)
+COMPONENT_GROUPS = [
+    ["e_component", "m_component", "p_component"],
+    ["a_component", "t_component", "h_component", "y_component"],
+]
+
+# keys of the state holding results of each stage
+STATE_KEYS = [
+    "diagnostics",
+    "analyzed_text",
+    "updated_text",
+    "updated_text_clean",
+    "annotated_text",
+]
+
+
+def analyze_all_stages(
+    llm,
+    review_text,
+    base_input,
+    trait_definitions,
+    max_workers=7,
+    stages=STAGES,
+    conflict_resolver="local",
+    grouped=False,
+    batched=False,
+):
+    """
+    Run the analysis of every stage at once against the original text. Each
+    stage is an independent LLM round trip so they are sent concurrently and
+    the total wait is roughly that of the slowest stage instead of the sum.
+    With grouped=True the stages of each of COMPONENT_GROUPS are analysed in a
+    single request instead: fewer, longer calls sharing one prompt. With
+    batched=True the per-stage requests are handed to the backend as a single
+    batch (for local backends, see backends.LlamaCppBackend).
+
+    Later stages are analysed before earlier edits are accepted, so their
+    diagnostics have to be rebased onto the updated text before display
+    (see helper.rebase_diagnostics).
+
+    Args:
+        llm (ResponseGenerator): The language model instance.
+        review_text (str): The original text of the review.
+        base_input (dict): The base input for the LLM (see response_gen)
+        trait_definitions (dict): Trait definitions for conflict resolution.
+        max_workers (int): Maximum number of concurrent LLM calls.
+        stages (list): The stages to analyse.
+        conflict_resolver (str): See analysis.analyze_stage.
+        grouped (bool): Analyse the components of a group in one request.
+        batched (bool): Send the per-stage requests as one batch (ignored
+            with grouped=True).
+
+    Returns:
+        dict: Diagnostics for each stage keyed by stage (e.g., "stage1").
+    """
+    batches = [[stage] for stage in stages]
+    if batched and not grouped:
+        return _analyze_batch(
+            llm,
+            review_text,
+            base_input,
+            trait_definitions,
+            stages,
+            conflict_resolver,
+            single_request=False,
+        )
+    if grouped:
+        batches = [
+            [stage for stage in stages if stage.component_name in group]
+            for group in COMPONENT_GROUPS
+        ] + [
+            [stage]
+            for stage in stages
+            if not any(stage.component_name in group for group in COMPONENT_GROUPS)
+        ]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(
+                _analyze_batch,
+                llm,
+                review_text,
+                base_input,
+                trait_definitions,
+                batch,
+                conflict_resolver,
+            )
+            for batch in batches
+            if batch
+        ]
+        diagnostics = {}
+        for future in futures:
+            diagnostics.update(future.result())
+        return {stage.key: diagnostics[stage.key] for stage in stages}
+
+
+def _analyze_batch(
+    llm,
+    review_text,
+    base_input,
+    trait_definitions,
+    batch,
+    conflict_resolver,
+    single_request=True,
+):
+    # diagnostics of a list of stages analysed in a single request (or a single
+    # batch of requests, see analysis.analyze_components), keyed by stage
+    if len(batch) == 1:
+        stage = batch[0]
+        return {
+            stage.key: analyze_stage(
+                llm=llm,
+                review_text=review_text,
+                component_input=stage.component_input,
+                base_input=base_input,
+                trait_definitions=trait_definitions,
+                component_name=stage.component_name,
+                conflict_resolver=conflict_resolver,
+            )
+        }
+    diagnostics = analyze_components(
+        llm=llm,
+        review_text=review_text,
+        component_inputs={
+            stage.component_name: stage.component_input for stage in batch
+        },
+        base_input=base_input,
+        trait_definitions=trait_definitions,
+        conflict_resolver=conflict_resolver,
+        single_request=single_request,
+    )
+    return {stage.key: diagnostics[stage.component_name] for stage in batch}
+
+
+class StagePipeline:
+    """
+    The stages of the review as a chain: each stage analyses the (annotated) text
+    produced by the previous stage and produces the updated text the next stage
+    works on.
+
+    All results live in a mapping (st.session_state in the app) so the pipeline
+    itself can be recreated on every rerun:
+        rtext: the uploaded text.
+        diagnostics[stage]: the LLM diagnostics of the stage.
+        analyzed_text[stage]: the text the diagnostics were generated from.
+        updated_text[stage], updated_text_clean[stage]: output text of the stage.
+        annotated_text[stage]: output text with accepted changes marked "<<>>".
+        upfront_stages: stages analysed up front against the uploaded text.
+        choices[widget key]: choices made on the page (run or skip a stage, accept
+            or reject a suggestion).
+        session_id: the session the state is saved to (see below).
+
+    Diagnostics are memoized on the text they were generated from: when the output
+    of a stage changes, the outputs of all stages downstream of it are discarded
+    and their diagnostics are recomputed only if their input text changed. With
+    incremental=True, a stage analysed before for another version of its input
+    text (e.g., a revised review) only sends the changed sentences to the LLM
+    (see incremental.analyze_stage_incremental). conflict_resolver chooses how
+    sentences flagged under several traits are resolved (see analysis.analyze_stage).
+
+    With a store (sessions.SessionStore), every change of the state is written to
+    the session of the state as soon as it is made -- only the entries it touched,
+    e.g., the diagnostics of one stage after its LLM call -- and restore() loads a
+    session back without calling the LLM again.
+    """
+
+    def __init__(
+        self,
+        state,
+        llm,
+        base_input,
+        trait_definitions,
+        stages=STAGES,
+        incremental=True,
+        conflict_resolver="local",
+        store=None,
+    ):
+        self.state = state
+        self.llm = llm
+        self.base_input = base_input
+        self.trait_definitions = trait_definitions
+        self.incremental = incremental
+        self.conflict_resolver = conflict_resolver
+        self.store = store
+        self.stages = {stage.key: stage for stage in stages}
+        self.order = [stage.key for stage in stages]
+        if "rtext" not in state:
+            state["rtext"] = ""
+        for key in STATE_KEYS + ["choices"]:
+            if key not in state:
+                state[key] = {}
+        if "upfront_stages" not in state:
+            state["upfront_stages"] = set()
+
+    def _value(self, name, field):
+        # value of an entry of the state as saved in the store, None if it is unset
+        if name == "rtext":
+            return self.state["rtext"]
+        if field is None:
+            return None
+        if name == "upfront_stages":
+            return True if field in self.state["upfront_stages"] else None
+        return self.state[name].get(field)
+
+    def _save(self, *entries):
+        # write (name, field) entries of the state to the session, a field of None
+        # for all entries of a name that was emptied
+        session_id = self.state.get("session_id")
+        if self.store is None or session_id is None or not entries:
+            return
+        self.store.save(
+            session_id,
+            [(name, field, self._value(name, field)) for name, field in entries],
+        )
+
+    def start_session(self, name=None, document=None):
+        """
+        Save the state of the current document to a new session of the store;
+        from now on every change is saved to it. The session starts without
+        choices, and diagnostics of an earlier document (kept for incremental
+        re-analysis) are not saved to it.
+
+        Args:
+            name (str): Name of the reviewed document.
+            document (bytes): The uploaded document.
+
+        Returns:
+            str: The ID of the session.
+        """
+        self.state["session_id"] = self.store.create(name=name, document=document)
+        self.state["choices"] = {}
+        current = [key for key in self.order if self.has_diagnostics(key)]
+        self._save(
+            ("rtext", ""),
+            *[
+                (key, field)
+                for key in ["diagnostics", "analyzed_text"]
+                for field in current
+            ],
+            *[
+                (key, field)
+                for key in ["updated_text", "updated_text_clean", "annotated_text"]
+                for field in self.state[key]
+            ],
+            *[("upfront_stages", field) for field in self.state["upfront_stages"]],
+        )
+        return self.state["session_id"]
+
+    def restore(self, session_id):
+        """
+        Load a session of the store into the state: the results and choices of
+        every stage are restored as they were saved, no LLM call is made.
+
+        Returns:
+            bool: False if the store has no such session.
+        """
+        saved = self.store.load(session_id)
+        if saved is None:
+            return False
+        self.state["session_id"] = session_id
+        self.state["rtext"] = saved.get("rtext", {}).get("", "")
+        for key in STATE_KEYS + ["choices"]:
+            self.state[key] = saved.get(key, {})
+        self.state["upfront_stages"] = set(saved.get("upfront_stages", {}))
+        return True
+
+    def choose(self, widget_key, value):
+        # a choice made on the page, saved with the session so that the page can
+        # be restored as it was (None removes it)
+        if self.state["choices"].get(widget_key) != value:
+            if value is None:
+                self.state["choices"].pop(widget_key, None)
+            else:
+                self.state["choices"][widget_key] = value
+            self._save(("choices", widget_key))
+
+    def set_document(self, text):
+        # a new document invalidates every stage and the choices made on it. The
+        # diagnostics of the previous document are kept as the base of incremental
+        # re-analysis. It is another review: the session of the previous document
+        # is left as it was (see start_session)
+        if text != self.state["rtext"]:
+            self.state.pop("session_id", None)
+            self.state["rtext"] = text
+            for key in ["updated_text", "updated_text_clean", "annotated_text"]:
+                self.state[key] = {}
+            self.state["choices"] = {}
+            self.state["upfront_stages"] = set()
+
+    def input_text(self, key):
+        # text the suggestions of a stage are displayed against and applied to
+        previous = self.stages[key].previous
+        if previous is None:
+            return self.state["rtext"]
+        return self.state["updated_text"].get(previous)
+
+    def input_annotated_text(self, key):
+        # text sent to the LLM (earlier changes marked with "<<>>")
+        previous = self.stages[key].previous
+        if previous is None:
+            return self.state["rtext"]
+        return self.state["annotated_text"].get(previous)
+
+    def is_ready(self, key):
+        return bool(self.state["rtext"]) and self.input_text(key) is not None
+
+    def is_done(self, key):
+        return key in self.state["updated_text"]
+
+    def has_diagnostics(self, key):
+        if key not in self.state["diagnostics"]:
+            return False
+        if key in self.state["upfront_stages"]:
+            return True
+        return self.state["analyzed_text"].get(key) == self.input_annotated_text(key)
+
+    def run(self, key, on_improvement=None):
+        """
+        Analyse a stage unless it has already been analysed for its current input.
+
+        Args:
+            key (str): The stage (e.g., "stage1").
+            on_improvement (callable): Called with each improvement as it is
+                generated (see analysis.analyze_stage).
+
+        Returns:
+            dict: Diagnostics of the stage.
+        """
+        if not self.has_diagnostics(key):
+            stage = self.stages[key]
+            review_text = self.input_annotated_text(key)
+            previous_text = self.state["analyzed_text"].get(key)
+            if self.incremental and previous_text is not None:
+                self.state["diagnostics"][key] = analyze_stage_incremental(
+                    llm=self.llm,
+                    review_text=review_text,
+                    previous_text=previous_text,
+                    previous_diagnostics=self.state["diagnostics"][key],
+                    component_input=stage.component_input,
+                    base_input=self.base_input,
+                    trait_definitions=self.trait_definitions,
+                    component_name=stage.component_name,
+                    on_improvement=on_improvement,
+                    conflict_resolver=self.conflict_resolver,
+                )
+            else:
+                self.state["diagnostics"][key] = analyze_stage(
+                    llm=self.llm,
+                    review_text=review_text,
+                    component_input=stage.component_input,
+                    base_input=self.base_input,
+                    trait_definitions=self.trait_definitions,
+                    component_name=stage.component_name,
+                    on_improvement=on_improvement,
+                    conflict_resolver=self.conflict_resolver,
+                )
+            self.state["analyzed_text"][key] = review_text
+            self.state["upfront_stages"].discard(key)
+            self._save(
+                ("diagnostics", key), ("analyzed_text", key), ("upfront_stages", key)
+            )
+        return self.state["diagnostics"][key]
+
+    def run_upfront(self, max_workers=7, grouped=False, batched=False):
+        # analyse every stage not analysed yet concurrently against the uploaded
+        # text, one request per stage or per group of components (grouped=True),
+        # or as one batch of requests (batched=True, see analyze_all_stages)
+        pending = [
+            self.stages[key] for key in self.order if not self.has_diagnostics(key)
+        ]
+        diagnostics = analyze_all_stages(
+            llm=self.llm,
+            review_text=self.state["rtext"],
+            base_input=self.base_input,
+            trait_definitions=self.trait_definitions,
+            max_workers=max_workers,
+            stages=pending,
+            conflict_resolver=self.conflict_resolver,
+            grouped=grouped,
+            batched=batched,
+        )
+        for key, stage_diagnostics in diagnostics.items():
+            self.state["diagnostics"][key] = stage_diagnostics
+            self.state["analyzed_text"][key] = self.state["rtext"]
+            self.state["upfront_stages"].add(key)
+        self._save(
+            *[
+                (name, key)
+                for key in diagnostics
+                for name in ["diagnostics", "analyzed_text", "upfront_stages"]
+            ]
+        )
+
+    def diagnostics(self, key):
+        # diagnostics as they should be displayed against the input text of the stage
+        diagnostics = self.state["diagnostics"][key]
+        if key in self.state["upfront_stages"]:
+            return rebase_diagnostics(
+                diagnostic_components=diagnostics, text=self.input_text(key)
+            )
+        return diagnostics
+
+    def skip(self, key):
+        # pass the input of the stage on unchanged
+        self._set_output(
+            key,
+            updated_text=self.input_text(key),
+            annotated_text=self.input_annotated_text(key),
+        )
+
+    def complete(self, key, decisions):
+        """
+        Apply the decisions made on the suggestions of a stage.
+
+        Args:
+            key (str): The stage (e.g., "stage1").
+            decisions (list): Accept / reject decisions (decision, sentence, suggestion).
+
+        Returns:
+            str: The updated text of the stage.
+        """
+        updated_text, annotated_text = apply_decisions(self.input_text(key), decisions)
+        ut_clean = replace_multiple_dots(text=updated_text)
+        self.state["updated_text_clean"][key] = ut_clean
+        self._save(("updated_text_clean", key))
+        self._set_output(key, updated_text=ut_clean, annotated_text=annotated_text)
+        return ut_clean
+
+    def _set_output(self, key, updated_text, annotated_text):
+        previous_output = (
+            self.state["updated_text"].get(key),
+            self.state["annotated_text"].get(key),
+        )
+        if previous_output != (updated_text, annotated_text):
+            self.invalidate_after(key)
+        self.state["updated_text"][key] = updated_text
+        self.state["annotated_text"][key] = annotated_text
+        self._save(("updated_text", key), ("annotated_text", key))
+
+    def invalidate_after(self, key):
+        # outputs downstream of a stage depend on its output. Diagnostics are kept:
+        # they are only reused if their stage gets the same input text again
+        removed = []
+        for downstream in self.order[self.order.index(key) + 1 :]:
+            for state_key in ["updated_text", "updated_text_clean", "annotated_text"]:
+                if self.state[state_key].pop(downstream, None) is not None:
+                    removed.append((state_key, downstream))
+        self._save(*removed)
+
+    def final_text(self):
+        return self.state["updated_text"].get(self.order[-1])
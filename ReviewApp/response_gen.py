@@ -1,14 +1,325 @@
 import json
-from openai import OpenAI
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from backends import OpenAIBackend
+from feedback_schema import (
+    RESPONSE_FORMAT,
+    MalformedResponse,
+    check_improvement,
+    load_response,
+    multi_response_format,
+    parse_improvements,
+    parse_multi_improvements,
+)
+from budget import (
+    estimate_tokens,
+    merge_improvements,
+    output_token_budget,
+    split_into_chunks,
+)
+from scheduler import INTERACTIVE, BATCH
+import metrics
 
+# maximum number of requests an AsyncResponseGenerator keeps in flight
+MAX_CONCURRENCY = 8
+# max_tokens of requests whose output size does not depend on the review
+MAX_TOKENS = 5000
+# maximum number of chunks of a long review analysed concurrently
+MAX_CHUNK_WORKERS = 4
+# version of the prompt layout, part of every cache key: bump it whenever the
+# wording or order of the messages changes so older responses are not reused
+PROMPT_VERSION = 2
 
-class ResponseGenerator:
-    def __init__(self, api_key):
+
+# everything but the review text is static and sent first: the prompt prefix of
+# a component is then byte-identical on every call and is served from the
+# provider's prompt cache (billed at a discount, lower time to first token)
+_GENERATION_INSTRUCTIONS = [
+    {
+        "role": "assistant",
+        "content": "Great. Provide the review document. I will provide constructive feedback using the traits.",
+    },
+    {
+        "role": "user",
+        "content": """For the review document I am about to provide:
+1. Identify all sentences that can be improved under each trait using the typical examples, as truthfully as possible. Avoid forcing classification into traits when it does not apply.
+2. Generate suggested improvements for these sentences using the constructive examples. If these are for sentences enclosed by '<<>>', they already contain changes. Make sure the suggestions retain retains key aspects of the sentences.
+3. Use the description of the trait to generate a comment that highlights why the sentence needs improvement strictly using the template 'The following sentence(s) does not [description of trait] instead it [issue]....'.
+Format output strictly using the following template:
+<Trait:> <Comment highlighting issue> <Sentences that needs improvement:> <Suggested improvement for each sentence:>""",
+    },
+    {
+        "role": "assistant",
+        "content": "Understood. Provide the review document.",
+    },
+]
+
+
+def _generation_messages(review_text, component_input, base_input):
+    review_input = [
+        {"role": "user", "content": f"Here is the review document:\n{review_text}"}
+    ]
+    return base_input + component_input + _GENERATION_INSTRUCTIONS + review_input
+
+
+def _multi_generation_messages(review_text, component_inputs, base_input):
+    # the inputs of all components one after the other, then the instructions
+    # of _generation_messages asking for the improvements of each component
+    messages = list(base_input)
+    for name, component_input in component_inputs.items():
+        messages += component_input + [
+            {
+                "role": "assistant",
+                "content": f"Noted. I will report the feedback for these traits under '{name}'.",
+            }
+        ]
+    instructions = [dict(message) for message in _GENERATION_INSTRUCTIONS]
+    instructions[1]["content"] += (
+        "\nDo this for every component above and report the improvements of each"
+        f" component under its key ({', '.join(component_inputs)})."
+    )
+    review_input = [
+        {"role": "user", "content": f"Here is the review document:\n{review_text}"}
+    ]
+    return messages + instructions + review_input
+
+
+def _conflict_messages(gpt_response, trait_definitions, component):
+    prompt = f"""Below is a response from ChatGPT. Some of the sentences have been
+    classified into multiple traits. Break the tie by reassigning
+    these sentences into one traits. Keep the remaining result intact.
+    
+    Here is relevant information about the traits.
+    {trait_definitions[component]}
+
+    GPT Response:
+    {gpt_response}"""
+
+    return [
+        {"role": "system", "content": "You are expert at decision making."},
+        {"role": "user", "content": prompt},
+    ]
+
+
+def _conflict_token_budget(gpt_response):
+    # the resolved response is at most as long as the response it resolves
+    return output_token_budget(estimate_tokens(json.dumps(gpt_response)) // 2)
+
+
+def _merge_multi_improvements(responses, component_inputs):
+    # merge the responses of the chunks of a review for each component
+    if len(responses) == 1:
+        return responses[0]
+    return {
+        name: merge_improvements(response.get(name, []) for response in responses)
+        for name in component_inputs
+    }
+
+
+class ImprovementStreamParser:
+    """
+    Incremental parser of a streamed cre_improvement_feedback response. Text is
+    fed as it arrives and every entry of the improvements array is returned as
+    soon as its closing brace has been received. Text is scanned only once.
+    close checks that the whole response has been received.
+    """
+
+    def __init__(self):
+        self._text = ""
+        self._pos = 0
+        self._depth = 0
+        self._started = False
+        self._in_string = False
+        self._escape = False
+        # start of the entry being received (depth 3: object > array > entry)
+        self._start = None
+
+    def feed(self, chunk):
+        """
+        Parameters:
+            chunk (str): Next piece of the response content.
+        Returns:
+            list: Improvements completed by this chunk.
+        """
+        text = self._text + chunk
+        completed = []
+        for idx in range(self._pos, len(text)):
+            char = text[idx]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+                self._started = True
+                if self._depth == 3 and char == "{":
+                    self._start = idx
+            elif char in "}]":
+                if self._depth == 3 and self._start is not None:
+                    entry = load_response(text[self._start : idx + 1])
+                    completed.append(check_improvement(entry))
+                    self._start = None
+                self._depth -= 1
+        # only keep the text of the entry still being received
+        if self._start is None:
+            self._text, self._pos = "", 0
+        else:
+            self._text = text[self._start :]
+            self._pos, self._start = len(self._text), 0
+        return completed
+
+    def close(self):
+        """
+        Raises:
+            MalformedResponse: If the response ended before it was complete
+                (e.g., the stream was cut or max_tokens was reached).
+        """
+        if not self._started or self._depth or self._in_string:
+            raise MalformedResponse(
+                "The streamed response ended before it was complete: "
+                f"{self._text[-200:]!r}"
+            )
+
+
+class TokenUsage:
+    """
+    Token counts reported in the usage field of the API responses, summed over
+    all calls of a generator. cached_tokens are prompt tokens served from the
+    provider's prompt cache (see _GENERATION_INSTRUCTIONS). The counts (and
+    their estimated cost) are also added to the process-wide metrics.
+    """
+
+    def __init__(self, model=None):
+        self._lock = threading.Lock()
+        self.model = model
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.completion_tokens = 0
+
+    def add(self, usage):
+        if usage is None:
+            return
+        details = getattr(usage, "prompt_tokens_details", None)
+        prompt_tokens = usage.prompt_tokens or 0
+        cached_tokens = getattr(details, "cached_tokens", None) or 0
+        completion_tokens = usage.completion_tokens or 0
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += prompt_tokens
+            self.cached_tokens += cached_tokens
+            self.completion_tokens += completion_tokens
+        model = str(self.model)
+        metrics.count("llm_prompt_tokens", prompt_tokens, model=model)
+        metrics.count("llm_cached_tokens", cached_tokens, model=model)
+        metrics.count("llm_completion_tokens", completion_tokens, model=model)
+        metrics.count(
+            "llm_cost_usd",
+            metrics.estimate_cost(
+                self.model, prompt_tokens, cached_tokens, completion_tokens
+            ),
+            model=model,
+        )
+
+    def stats(self):
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "prompt_tokens": self.prompt_tokens,
+                "cached_tokens": self.cached_tokens,
+                "completion_tokens": self.completion_tokens,
+                "cached_fraction": (
+                    round(self.cached_tokens / self.prompt_tokens, 3)
+                    if self.prompt_tokens
+                    else 0.0
+                ),
+                "cost_usd": round(
+                    metrics.estimate_cost(
+                        self.model,
+                        self.prompt_tokens,
+                        self.cached_tokens,
+                        self.completion_tokens,
+                    ),
+                    4,
+                ),
+            }
+
+
+class _CachedResponses:
+    # responses are looked up in self.cache (a llm_cache.DiagnosticsCache or
+    # None) under a key covering every input of the call
+    def _cache_get(self, *inputs):
+        # inputs[0] names the call (e.g., "resolve_conflicts")
+        if self.cache is None:
+            metrics.count("llm_lookups", call=inputs[0], result="uncached")
+            return None, None
+        key = self.cache.make_key(*inputs, self.model, RESPONSE_FORMAT, PROMPT_VERSION)
+        response = self.cache.get(key)
+        metrics.count(
+            "llm_lookups",
+            call=inputs[0],
+            result="miss" if response is None else "hit",
+        )
+        return key, response
+
+    def _cache_set(self, key, response):
+        if key is not None:
+            self.cache.set(key, response)
+
+
+class ResponseGenerator(_CachedResponses):
+    def __init__(
+        self,
+        api_key=None,
+        base_url=None,
+        openai_client=None,
+        cache=None,
+        scheduler=None,
+        priority=INTERACTIVE,
+        backend=None,
+    ):
         """
         Initialize the ResponseGenerator with the OpenAI API key.
-        Parameters:api_key (str): OpenAI API key.
+        Parameters:
+            api_key (str): OpenAI API key.
+            base_url (str): Endpoint of the chat completions API. Defaults to
+                OpenAI; point it to a local server for testing.
+            openai_client (OpenAI): Client to use instead of the shared pooled one.
+            cache (DiagnosticsCache): Cache consulted before calling the API.
+            scheduler (RateLimitScheduler): Rate limits and retries of the calls.
+                Defaults to the scheduler shared by all users of the API key.
+            priority (int): scheduler.INTERACTIVE or scheduler.BATCH.
+            backend (ChatBackend): Backend to use instead of the OpenAI API (e.g.,
+                backends.LlamaCppBackend); the arguments above are then ignored.
         """
-        self.openai_client = OpenAI(api_key=api_key)
+        self.backend = backend or OpenAIBackend(
+            api_key=api_key,
+            base_url=base_url,
+            openai_client=openai_client,
+            scheduler=scheduler,
+            priority=priority,
+        )
+        self.model = self.backend.model
+        # rate limits of the OpenAI API (None for other backends)
+        self.scheduler = getattr(self.backend, "scheduler", None)
+        self.cache = cache
+        self.usage = TokenUsage(self.model)
+
+    def _create(self, messages, response_format=None, max_tokens=MAX_TOKENS):
+        # the generated text, following the schema of response_format
+        with metrics.timer("llm_request", model=str(self.model)):
+            completion = self.backend.complete(
+                messages, response_format or RESPONSE_FORMAT, max_tokens
+            )
+        self.usage.add(completion.usage)
+        return completion.content
 
     def generate_response(self, review_text, component_input, base_input):
         """
@@ -17,91 +328,174 @@ class ResponseGenerator:
             review_text (str): Text of the review document.
             component_input (list): Component-specific input prompts.
             base_input (list): Base input prompts for the API.
-            json_format (dict): JSON schema for the API response.
 
         Returns:
             list: Extracted feedback from the API response.
         """
-        response_template_input = [
-            {
-                "role": "assistant",
-                "content": "Great. Provide the review document. I will provide constructive feedback using the traits.",
-            },
-            {
-                "role": "user",
-                "content": f"""Here is the review document:
-                {review_text}
-
-                1. Identify all sentences that can be improved under each trait using the typical examples, as truthfully as possible. Avoid forcing classification into traits when it does not apply.
-                2. Generate suggested improvements for these sentences using the constructive examples. If these are for sentences enclosed by '<<>>', they already contain changes. Make sure the suggestions retain retains key aspects of the sentences. 
-                3. Use the description of the trait to generate a comment that highlights why the sentence needs improvement strictly using the template 'The following sentence(s) does not [description of trait] instead it [issue]....'. 
-                Format output strictly using the following template: 
-                <Trait:> <Comment highlighting issue> <Sentences that needs improvement:> <Suggested improvement for each sentence:>""",
-            },
-        ]
+        key, cached = self._cache_get(
+            "generate_response", review_text, component_input, base_input
+        )
+        if cached is not None:
+            return cached
+        # long reviews are analysed in overlapping chunks, concurrently
+        chunks = split_into_chunks(review_text)
+        if len(chunks) == 1:
+            extracted_info = self._generate(review_text, component_input, base_input)
+        else:
+            with ThreadPoolExecutor(max_workers=MAX_CHUNK_WORKERS) as executor:
+                responses = executor.map(
+                    lambda chunk: self._generate(chunk, component_input, base_input),
+                    chunks,
+                )
+                extracted_info = merge_improvements(responses)
+        self._cache_set(key, extracted_info)
+        return extracted_info
 
-        gpt_input = base_input + component_input + response_template_input
-
-        completion_structured = self.openai_client.chat.completions.create(
-            model="gpt-4o",
-            messages=gpt_input,
-            max_tokens=5000,
-            response_format={
-                "type": "json_schema",
-                "json_schema": {
-                    "name": "cre_improvement_feedback",
-                    "schema": {
-                        "type": "object",
-                        "properties": {
-                            "improvements": {
-                                "type": "array",
-                                "items": {
-                                    "type": "object",
-                                    "properties": {
-                                        "trait": {"type": "string"},
-                                        "comment": {"type": "string"},
-                                        "sentences_needing_improvement": {
-                                            "type": "array",
-                                            "items": {"type": "string"},
-                                        },
-                                        "suggested_improvement": {
-                                            "type": "array",
-                                            "items": {"type": "string"},
-                                        },
-                                    },
-                                    "required": [
-                                        "trait",
-                                        "comment",
-                                        "sentences_needing_improvement",
-                                        "suggested_improvement",
-                                    ],
-                                    "additionalProperties": False,
-                                },
-                            }
-                        },
-                        "required": ["improvements"],
-                        "additionalProperties": False,
-                    },
-                    "strict": True,
-                },
-            },
-        )
-
-        response_structured = completion_structured.choices[0].message.content
-        sdata = json.loads(response_structured)
-
-        extracted_info = [
-            {
-                "trait": entry["trait"],
-                "comment": entry["comment"],
-                "sentences_needing_improvement": entry["sentences_needing_improvement"],
-                "suggested_improvement": entry["suggested_improvement"],
-            }
-            for entry in sdata["improvements"]
+    def _generate(self, review_text, component_input, base_input):
+        gpt_input = _generation_messages(review_text, component_input, base_input)
+        response_structured = self._create(
+            gpt_input, max_tokens=output_token_budget(estimate_tokens(review_text))
+        )
+        return parse_improvements(response_structured)
+
+    def generate_responses(self, review_text, component_inputs, base_input):
+        """
+        Same as generate_response for several components, with one request per
+        component (and chunk of a long review) sent to the backend as a single
+        batch (see ChatBackend.complete_batch).
+        Parameters:
+            review_text (str): Text of the review document.
+            component_inputs (dict): Component-specific input prompts keyed by
+                component name (e.g., "e_component").
+            base_input (list): Base input prompts for the API.
+
+        Returns:
+            dict: Extracted feedback (see generate_response) keyed by component name.
+        """
+        extracted_info, pending = {}, []
+        for name, component_input in component_inputs.items():
+            key, cached = self._cache_get(
+                "generate_response", review_text, component_input, base_input
+            )
+            if cached is not None:
+                extracted_info[name] = cached
+            else:
+                pending.append((name, key))
+        chunks = split_into_chunks(review_text)
+        requests = [
+            (
+                _generation_messages(chunk, component_inputs[name], base_input),
+                RESPONSE_FORMAT,
+                output_token_budget(estimate_tokens(chunk)),
+            )
+            for name, _ in pending
+            for chunk in chunks
         ]
+        with metrics.timer("llm_batch", model=str(self.model)):
+            completions = iter(self.backend.complete_batch(requests))
+        for name, key in pending:
+            responses = []
+            for _ in chunks:
+                completion = next(completions)
+                self.usage.add(completion.usage)
+                responses.append(parse_improvements(completion.content))
+            extracted_info[name] = (
+                responses[0] if len(responses) == 1 else merge_improvements(responses)
+            )
+            self._cache_set(key, extracted_info[name])
+        return {name: extracted_info[name] for name in component_inputs}
 
+    def stream_response(self, review_text, component_input, base_input):
+        """
+        Same as generate_response, but the response is streamed and each
+        improvement is yielded as soon as it has been generated.
+        Parameters:
+            review_text (str): Text of the review document.
+            component_input (list): Component-specific input prompts.
+            base_input (list): Base input prompts for the API.
+
+        Yields:
+            dict: Feedback for one trait (see generate_response).
+        """
+        key, cached = self._cache_get(
+            "generate_response", review_text, component_input, base_input
+        )
+        if cached is not None:
+            yield from cached
+            return
+        if len(split_into_chunks(review_text)) > 1:
+            # the chunks of a long review are merged before anything is shown
+            yield from self.generate_response(review_text, component_input, base_input)
+            return
+        gpt_input = _generation_messages(review_text, component_input, base_input)
+        parser = ImprovementStreamParser()
+        extracted_info = []
+        max_tokens = output_token_budget(estimate_tokens(review_text))
+        # the total includes the time the caller spends on each improvement
+        start = time.perf_counter()
+        for piece in self.backend.stream(gpt_input, RESPONSE_FORMAT, max_tokens):
+            self.usage.add(piece.usage)
+            if piece.content:
+                for improvement in parser.feed(piece.content):
+                    if not extracted_info:
+                        metrics.observe(
+                            "llm_stream_first_improvement",
+                            time.perf_counter() - start,
+                            model=str(self.model),
+                        )
+                    extracted_info.append(improvement)
+                    yield improvement
+        metrics.observe(
+            "llm_stream", time.perf_counter() - start, model=str(self.model)
+        )
+        # a cut response is not cached
+        parser.close()
+        self._cache_set(key, extracted_info)
+
+    def generate_multi_response(self, review_text, component_inputs, base_input):
+        """
+        Generate the feedback of several components in a single request.
+        Parameters:
+            review_text (str): Text of the review document.
+            component_inputs (dict): Component-specific input prompts keyed by
+                component name (e.g., "e_component").
+            base_input (list): Base input prompts for the API.
+
+        Returns:
+            dict: Extracted feedback (see generate_response) keyed by component name.
+        """
+        key, cached = self._cache_get(
+            "generate_multi_response", review_text, component_inputs, base_input
+        )
+        if cached is not None:
+            return cached
+        chunks = split_into_chunks(review_text)
+        with ThreadPoolExecutor(max_workers=MAX_CHUNK_WORKERS) as executor:
+            responses = list(
+                executor.map(
+                    lambda chunk: self._generate_multi(
+                        chunk, component_inputs, base_input
+                    ),
+                    chunks,
+                )
+            )
+        extracted_info = _merge_multi_improvements(responses, component_inputs)
+        self._cache_set(key, extracted_info)
         return extracted_info
 
+    def _generate_multi(self, review_text, component_inputs, base_input):
+        gpt_input = _multi_generation_messages(
+            review_text, component_inputs, base_input
+        )
+        response_structured = self._create(
+            gpt_input,
+            multi_response_format(component_inputs),
+            max_tokens=output_token_budget(
+                estimate_tokens(review_text) * len(component_inputs)
+            ),
+        )
+        return parse_multi_improvements(response_structured, component_inputs)
+
     def resolve_conflicts(self, gpt_response, trait_definitions, component):
         """
         Resolve conflicts in the GPT-generated response by assigning sentences to a single trait.
@@ -111,80 +505,304 @@ class ResponseGenerator:
             trait_definitions: Dictionary containing trait definitions for all components.
         Returns: A refined response with conflicts resolved.
         """
+        key, cached = self._cache_get(
+            "resolve_conflicts", gpt_response, trait_definitions[component]
+        )
+        if cached is not None:
+            return cached
+        gpt_input = _conflict_messages(gpt_response, trait_definitions, component)
+        response_structured = self._create(
+            gpt_input, max_tokens=_conflict_token_budget(gpt_response)
+        )
+        extracted_info = parse_improvements(response_structured)
+        self._cache_set(key, extracted_info)
+        return extracted_info
 
-        prompt = f"""Below is a response from ChatGPT. Some of the sentences have been
-    classified into multiple traits. Break the tie by reassigning
-    these sentences into one traits. Keep the remaining result intact.
-    
-    Here is relevant information about the traits.
-    {trait_definitions[component]}
+    def generate_structured(self, messages, response_format):
+        """
+        Generate a response following an arbitrary JSON schema.
+        Parameters:
+            messages (list): Chat messages sent to the API.
+            response_format (dict): The json_schema response format.
+        Returns:
+            dict: The parsed JSON response.
+        """
+        key, cached = self._cache_get("generate_structured", messages, response_format)
+        if cached is not None:
+            return cached
+        sdata = load_response(self._create(messages, response_format))
+        self._cache_set(key, sdata)
+        return sdata
 
-    GPT Response:
-    {gpt_response}"""
 
-        gpt_input = [
-            {"role": "system", "content": "You are expert at decision making."},
-            {"role": "user", "content": prompt},
-        ]
+class AsyncResponseGenerator(_CachedResponses):
+    def __init__(
+        self,
+        api_key=None,
+        base_url=None,
+        max_concurrency=MAX_CONCURRENCY,
+        openai_client=None,
+        cache=None,
+        scheduler=None,
+        priority=BATCH,
+        backend=None,
+    ):
+        """
+        Asynchronous counterpart of ResponseGenerator for batch jobs. Requests go
+        through the same backends, shared pooled clients and rate-limit
+        scheduler, and at most max_concurrency requests of an instance are in
+        flight at any time. An instance should be used from a single event loop.
+        Parameters:
+            api_key (str): OpenAI API key.
+            base_url (str): Endpoint of the chat completions API. Defaults to
+                OpenAI; point it to a local server for testing.
+            max_concurrency (int): Maximum number of requests in flight.
+            openai_client (AsyncOpenAI): Client to use instead of the shared
+                pooled one of the event loop.
+            cache (DiagnosticsCache): Cache consulted before calling the API.
+            scheduler (RateLimitScheduler): See ResponseGenerator.
+            priority (int): scheduler.INTERACTIVE or scheduler.BATCH.
+            backend (ChatBackend): See ResponseGenerator.
+        """
+        self.backend = backend or OpenAIBackend(
+            api_key=api_key,
+            base_url=base_url,
+            async_openai_client=openai_client,
+            scheduler=scheduler,
+            priority=priority,
+        )
+        self.model = self.backend.model
+        self.scheduler = getattr(self.backend, "scheduler", None)
+        self.cache = cache
+        self.usage = TokenUsage(self.model)
+        self.semaphore = asyncio.Semaphore(max_concurrency)
 
-        completion_structured = self.openai_client.chat.completions.create(
-            model="gpt-4o",
-            messages=gpt_input,
-            max_tokens=5000,
-            response_format={
-                "type": "json_schema",
-                "json_schema": {
-                    "name": "cre_improvement_feedback",
-                    "schema": {
-                        "type": "object",
-                        "properties": {
-                            "improvements": {
-                                "type": "array",
-                                "items": {
-                                    "type": "object",
-                                    "properties": {
-                                        "trait": {"type": "string"},
-                                        "comment": {"type": "string"},
-                                        "sentences_needing_improvement": {
-                                            "type": "array",
-                                            "items": {"type": "string"},
-                                        },
-                                        "suggested_improvement": {
-                                            "type": "array",
-                                            "items": {"type": "string"},
-                                        },
-                                    },
-                                    "required": [
-                                        "trait",
-                                        "comment",
-                                        "sentences_needing_improvement",
-                                        "suggested_improvement",
-                                    ],
-                                    "additionalProperties": False,
-                                },
-                            }
-                        },
-                        "required": ["improvements"],
-                        "additionalProperties": False,
-                    },
-                    "strict": True,
-                },
-            },
-        )
-
-        # Parse the structured response
-        response_structured = completion_structured.choices[0].message.content
-        sdata = json.loads(response_structured)
-
-        # Extract the refined information
-        extracted_info = [
-            {
-                "trait": entry["trait"],
-                "comment": entry["comment"],
-                "sentences_needing_improvement": entry["sentences_needing_improvement"],
-                "suggested_improvement": entry["suggested_improvement"],
-            }
-            for entry in sdata["improvements"]
+    async def _create(self, messages, response_format=None, max_tokens=MAX_TOKENS):
+        async with self.semaphore:
+            with metrics.timer("llm_request", model=str(self.model)):
+                completion = await self.backend.acomplete(
+                    messages, response_format or RESPONSE_FORMAT, max_tokens
+                )
+        self.usage.add(completion.usage)
+        return completion.content
+
+    async def generate_response(self, review_text, component_input, base_input):
+        """
+        Generate a structured response using OpenAI's API (see ResponseGenerator).
+        Parameters:
+            review_text (str): Text of the review document.
+            component_input (list): Component-specific input prompts.
+            base_input (list): Base input prompts for the API.
+
+        Returns:
+            list: Extracted feedback from the API response.
+        """
+        key, cached = self._cache_get(
+            "generate_response", review_text, component_input, base_input
+        )
+        if cached is not None:
+            return cached
+        # long reviews are analysed in overlapping chunks, concurrently
+        responses = await asyncio.gather(
+            *[
+                self._generate(chunk, component_input, base_input)
+                for chunk in split_into_chunks(review_text)
+            ]
+        )
+        extracted_info = (
+            responses[0] if len(responses) == 1 else merge_improvements(responses)
+        )
+        self._cache_set(key, extracted_info)
+        return extracted_info
+
+    async def _generate(self, review_text, component_input, base_input):
+        gpt_input = _generation_messages(review_text, component_input, base_input)
+        response_structured = await self._create(
+            gpt_input, max_tokens=output_token_budget(estimate_tokens(review_text))
+        )
+        return parse_improvements(response_structured)
+
+    async def generate_responses(self, review_text, component_inputs, base_input):
+        """
+        Same as generate_response for several components (see
+        ResponseGenerator.generate_responses): the requests are sent
+        concurrently, or as one batch to a backend that serves batches better.
+        Parameters:
+            review_text (str): Text of the review document.
+            component_inputs (dict): Component-specific input prompts keyed by
+                component name (e.g., "e_component").
+            base_input (list): Base input prompts for the API.
+
+        Returns:
+            dict: Extracted feedback (see generate_response) keyed by component name.
+        """
+        if not self.backend.batched:
+            responses = await asyncio.gather(
+                *[
+                    self.generate_response(review_text, component_input, base_input)
+                    for component_input in component_inputs.values()
+                ]
+            )
+            return dict(zip(component_inputs, responses))
+        extracted_info, pending = {}, []
+        for name, component_input in component_inputs.items():
+            key, cached = self._cache_get(
+                "generate_response", review_text, component_input, base_input
+            )
+            if cached is not None:
+                extracted_info[name] = cached
+            else:
+                pending.append((name, key))
+        chunks = split_into_chunks(review_text)
+        requests = [
+            (
+                _generation_messages(chunk, component_inputs[name], base_input),
+                RESPONSE_FORMAT,
+                output_token_budget(estimate_tokens(chunk)),
+            )
+            for name, _ in pending
+            for chunk in chunks
         ]
+        with metrics.timer("llm_batch", model=str(self.model)):
+            completions = iter(await self.backend.acomplete_batch(requests))
+        for name, key in pending:
+            responses = []
+            for _ in chunks:
+                completion = next(completions)
+                self.usage.add(completion.usage)
+                responses.append(parse_improvements(completion.content))
+            extracted_info[name] = (
+                responses[0] if len(responses) == 1 else merge_improvements(responses)
+            )
+            self._cache_set(key, extracted_info[name])
+        return {name: extracted_info[name] for name in component_inputs}
+
+    async def stream_response(self, review_text, component_input, base_input):
+        """
+        Same as generate_response, but each improvement is yielded as soon as it
+        has been generated (see ResponseGenerator.stream_response).
+        Parameters:
+            review_text (str): Text of the review document.
+            component_input (list): Component-specific input prompts.
+            base_input (list): Base input prompts for the API.
 
+        Yields:
+            dict: Feedback for one trait (see generate_response).
+        """
+        key, cached = self._cache_get(
+            "generate_response", review_text, component_input, base_input
+        )
+        if cached is None and len(split_into_chunks(review_text)) > 1:
+            # the chunks of a long review are merged before anything is shown
+            cached = await self.generate_response(
+                review_text, component_input, base_input
+            )
+        if cached is not None:
+            for improvement in cached:
+                yield improvement
+            return
+        gpt_input = _generation_messages(review_text, component_input, base_input)
+        parser = ImprovementStreamParser()
+        extracted_info = []
+        max_tokens = output_token_budget(estimate_tokens(review_text))
+        start = time.perf_counter()
+        async with self.semaphore:
+            async for piece in self.backend.astream(
+                gpt_input, RESPONSE_FORMAT, max_tokens
+            ):
+                self.usage.add(piece.usage)
+                if piece.content:
+                    for improvement in parser.feed(piece.content):
+                        if not extracted_info:
+                            metrics.observe(
+                                "llm_stream_first_improvement",
+                                time.perf_counter() - start,
+                                model=str(self.model),
+                            )
+                        extracted_info.append(improvement)
+                        yield improvement
+        metrics.observe(
+            "llm_stream", time.perf_counter() - start, model=str(self.model)
+        )
+        # a cut response is not cached
+        parser.close()
+        self._cache_set(key, extracted_info)
+
+    async def generate_multi_response(self, review_text, component_inputs, base_input):
+        """
+        Generate the feedback of several components in a single request (see
+        ResponseGenerator).
+        Parameters:
+            review_text (str): Text of the review document.
+            component_inputs (dict): Component-specific input prompts keyed by
+                component name (e.g., "e_component").
+            base_input (list): Base input prompts for the API.
+
+        Returns:
+            dict: Extracted feedback keyed by component name.
+        """
+        key, cached = self._cache_get(
+            "generate_multi_response", review_text, component_inputs, base_input
+        )
+        if cached is not None:
+            return cached
+        responses = await asyncio.gather(
+            *[
+                self._generate_multi(chunk, component_inputs, base_input)
+                for chunk in split_into_chunks(review_text)
+            ]
+        )
+        extracted_info = _merge_multi_improvements(responses, component_inputs)
+        self._cache_set(key, extracted_info)
         return extracted_info
+
+    async def _generate_multi(self, review_text, component_inputs, base_input):
+        gpt_input = _multi_generation_messages(
+            review_text, component_inputs, base_input
+        )
+        response_structured = await self._create(
+            gpt_input,
+            multi_response_format(component_inputs),
+            max_tokens=output_token_budget(
+                estimate_tokens(review_text) * len(component_inputs)
+            ),
+        )
+        return parse_multi_improvements(response_structured, component_inputs)
+
+    async def resolve_conflicts(self, gpt_response, trait_definitions, component):
+        """
+        Resolve conflicts in the GPT-generated response (see ResponseGenerator).
+        Parameters:
+            gpt_response: The GPT-generated response that contains potential conflicts.
+            component: The specific component of the framework being analyzed.
+            trait_definitions: Dictionary containing trait definitions for all components.
+        Returns: A refined response with conflicts resolved.
+        """
+        key, cached = self._cache_get(
+            "resolve_conflicts", gpt_response, trait_definitions[component]
+        )
+        if cached is not None:
+            return cached
+        gpt_input = _conflict_messages(gpt_response, trait_definitions, component)
+        response_structured = await self._create(
+            gpt_input, max_tokens=_conflict_token_budget(gpt_response)
+        )
+        extracted_info = parse_improvements(response_structured)
+        self._cache_set(key, extracted_info)
+        return extracted_info
+
+    async def generate_structured(self, messages, response_format):
+        """
+        Generate a response following an arbitrary JSON schema.
+        Parameters:
+            messages (list): Chat messages sent to the API.
+            response_format (dict): The json_schema response format.
+        Returns:
+            dict: The parsed JSON response.
+        """
+        key, cached = self._cache_get("generate_structured", messages, response_format)
+        if cached is not None:
+            return cached
+        sdata = load_response(await self._create(messages, response_format))
+        self._cache_set(key, sdata)
+        return sdata
@@ -0,0 +1,314 @@
+import time
+import heapq
+import random
+import asyncio
+import itertools
+import threading
+from openai import (
+    APIConnectionError,
+    APITimeoutError,
+    InternalServerError,
+    RateLimitError,
+)
+
+# rate limits of the API key (requests and tokens per minute), see the limits
+# page of the OpenAI account
+REQUESTS_PER_MINUTE = 500
+TOKENS_PER_MINUTE = 450000
+# retries of a throttled or failed call, with jittered exponential backoff
+MAX_RETRIES = 6
+BASE_DELAY = 1.0
+MAX_DELAY = 60.0
+# seconds a call may take in total: waiting in the queue, retries and the request
+CALL_TIMEOUT = 600.0
+
+# priorities of the queue, lower is served first: a user waiting in the app goes
+# before documents of a batch run
+INTERACTIVE = 0
+BATCH = 1
+
+RETRYABLE_ERRORS = (
+    RateLimitError,
+    APITimeoutError,
+    APIConnectionError,
+    InternalServerError,
+)
+
+# one scheduler per API key for the whole process -- the rate limits apply to
+# the key, whatever session or job sends the requests
+_shared_schedulers = {}
+_shared_schedulers_lock = threading.Lock()
+
+
+def get_shared_scheduler(api_key, **limits):
+    """
+    Return the process-wide RateLimitScheduler of an API key, creating it with
+    the given limits (see RateLimitScheduler) on first use.
+    """
+    with _shared_schedulers_lock:
+        if api_key not in _shared_schedulers:
+            _shared_schedulers[api_key] = RateLimitScheduler(**limits)
+        return _shared_schedulers[api_key]
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+class TokenBucket:
+    # `capacity` units, refilled continuously at `rate` units per second
+
+    def __init__(self, capacity, rate):
+        self.capacity = capacity
+        self.rate = rate
+        self.level = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        # seconds until `amount` units are available (0 if they are now)
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self.level) / self.rate)
+
+    def take(self, amount):
+        self.level -= min(amount, self.capacity)
+
+
+class RateLimitScheduler:
+    """
+    Admission control in front of the chat completions API. Calls wait in a
+    priority queue until the request and token buckets (requests / tokens per
+    minute) allow them; throttled (429) and transient failures are retried with
+    jittered exponential backoff, honouring the retry-after header of the
+    response, and a 429 pauses every queued call. Each call has a deadline
+    covering the wait, the retries and the request itself.
+
+    Thread-safe; async callers use acall.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute=REQUESTS_PER_MINUTE,
+        tokens_per_minute=TOKENS_PER_MINUTE,
+        max_retries=MAX_RETRIES,
+        base_delay=BASE_DELAY,
+        max_delay=MAX_DELAY,
+    ):
+        self.requests = TokenBucket(requests_per_minute, requests_per_minute / 60)
+        self.tokens = TokenBucket(tokens_per_minute, tokens_per_minute / 60)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._cond = threading.Condition()
+        self._queue = []
+        self._counter = itertools.count()
+        # no call is admitted before this time after a 429
+        self._paused_until = 0.0
+        # (event loop, future) of the coroutines waiting in the queue (see acall)
+        self._async_waiters = set()
+        self._metrics = {
+            "requests": 0,
+            "retries": 0,
+            "rate_limited": 0,
+            "failed": 0,
+            "deadline_exceeded": 0,
+            "max_queue_depth": 0,
+            "wait_seconds": 0.0,
+            "max_wait_seconds": 0.0,
+        }
+
+    def call(self, request, tokens, priority=INTERACTIVE, timeout=CALL_TIMEOUT):
+        """
+        Send a request once the rate limits allow it, retrying on failures.
+
+        Args:
+            request (callable): Sends the request; called with the seconds left
+                before the deadline (to be used as the request timeout).
+            tokens (int): Tokens the request counts against the limit (prompt
+                and max_tokens).
+            priority (int): INTERACTIVE or BATCH.
+            timeout (float): Seconds before DeadlineExceeded is raised.
+
+        Returns:
+            The result of request.
+        """
+        deadline = time.monotonic() + timeout
+        for attempt in range(self.max_retries + 1):
+            self._acquire(tokens, priority, deadline)
+            try:
+                return request(self._remaining(deadline))
+            except RETRYABLE_ERRORS as error:
+                delay = self._on_error(error, attempt, deadline)
+            time.sleep(delay)
+
+    async def acall(self, request, tokens, priority=INTERACTIVE, timeout=CALL_TIMEOUT):
+        # same as call for a coroutine function `request`
+        deadline = time.monotonic() + timeout
+        for attempt in range(self.max_retries + 1):
+            await self._aacquire(tokens, priority, deadline)
+            try:
+                return await request(self._remaining(deadline))
+            except RETRYABLE_ERRORS as error:
+                delay = self._on_error(error, attempt, deadline)
+            await asyncio.sleep(delay)
+
+    def stats(self):
+        # queue depth now and since start up, counters and waiting times
+        with self._cond:
+            stats = dict(self._metrics, queue_depth=len(self._queue))
+        stats["mean_wait_seconds"] = (
+            round(stats["wait_seconds"] / stats["requests"], 3)
+            if stats["requests"]
+            else 0.0
+        )
+        return stats
+
+    def _remaining(self, deadline):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            with self._cond:
+                self._metrics["deadline_exceeded"] += 1
+            raise DeadlineExceeded("deadline exceeded before the request was sent")
+        return remaining
+
+    def _enqueue(self, priority):
+        # with self._cond held
+        entry = (priority, next(self._counter))
+        heapq.heappush(self._queue, entry)
+        self._metrics["max_queue_depth"] = max(
+            self._metrics["max_queue_depth"], len(self._queue)
+        )
+        return entry
+
+    def _leave(self, entry):
+        # with self._cond held: a call gives up its place (deadline, cancelled)
+        self._queue.remove(entry)
+        heapq.heapify(self._queue)
+        self._notify()
+
+    def _try_admit(self, entry, tokens, deadline):
+        # with self._cond held: (True, None) once this call is first in the queue
+        # and the buckets allow it, its tokens taken; else (False, seconds to
+        # wait at most before trying again)
+        now = time.monotonic()
+        wait = None
+        if self._queue[0] == entry:
+            wait = max(
+                self._paused_until - now,
+                self.requests.wait_time(1, now),
+                self.tokens.wait_time(tokens, now),
+            )
+            if wait <= 0:
+                self.requests.take(1)
+                self.tokens.take(tokens)
+                heapq.heappop(self._queue)
+                # the next call in line may go now
+                self._notify()
+                return True, None
+        if now >= deadline:
+            self._metrics["deadline_exceeded"] += 1
+            raise DeadlineExceeded("deadline exceeded in the queue")
+        return False, deadline - now if wait is None else min(wait, deadline - now)
+
+    def _notify(self):
+        # with self._cond held: wake the waiting calls, threads and coroutines
+        self._cond.notify_all()
+        for loop, waker in self._async_waiters:
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(_wake, waker)
+
+    def _admitted(self, start):
+        # with self._cond held
+        waited = time.monotonic() - start
+        self._metrics["requests"] += 1
+        self._metrics["wait_seconds"] += waited
+        self._metrics["max_wait_seconds"] = max(
+            self._metrics["max_wait_seconds"], waited
+        )
+
+    def _acquire(self, tokens, priority, deadline):
+        # wait until this call is first in the queue and the buckets allow it
+        start = time.monotonic()
+        with self._cond:
+            entry = self._enqueue(priority)
+            try:
+                while True:
+                    admitted, wait = self._try_admit(entry, tokens, deadline)
+                    if admitted:
+                        break
+                    self._cond.wait(wait)
+            except BaseException:
+                self._leave(entry)
+                raise
+            self._admitted(start)
+
+    async def _aacquire(self, tokens, priority, deadline):
+        # same as _acquire, waiting on the event loop instead of in a thread: a
+        # cancelled call leaves the queue without taking any tokens
+        loop = asyncio.get_running_loop()
+        start = time.monotonic()
+        with self._cond:
+            entry = self._enqueue(priority)
+        try:
+            while True:
+                waker = loop.create_future()
+                with self._cond:
+                    admitted, wait = self._try_admit(entry, tokens, deadline)
+                    if admitted:
+                        self._admitted(start)
+                        return
+                    self._async_waiters.add((loop, waker))
+                try:
+                    await asyncio.wait([waker], timeout=wait)
+                finally:
+                    with self._cond:
+                        self._async_waiters.discard((loop, waker))
+        except BaseException:
+            with self._cond:
+                self._leave(entry)
+            raise
+
+    def _on_error(self, error, attempt, deadline):
+        # seconds to wait before the next attempt, or raise the error
+        rate_limited = isinstance(error, RateLimitError)
+        # an exhausted quota does not recover by waiting
+        if attempt >= self.max_retries or getattr(error, "code", None) == (
+            "insufficient_quota"
+        ):
+            with self._cond:
+                self._metrics["failed"] += 1
+            raise error
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        if time.monotonic() + delay >= deadline:
+            with self._cond:
+                self._metrics["failed"] += 1
+            raise error
+        with self._cond:
+            self._metrics["retries"] += 1
+            if rate_limited:
+                self._metrics["rate_limited"] += 1
+                # the limit is shared: hold back every call, not just this one
+                self._paused_until = max(self._paused_until, time.monotonic() + delay)
+        return delay
+
+
+def _wake(waker):
+    if not waker.done():
+        waker.set_result(None)
+
+
+def _retry_after(error):
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,249 @@
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+
+# components of the EMPATHY framework, in the order used for scores
+COMPONENTS = ["E", "M", "P", "A", "T", "H", "Y"]
+
+# lower bound (0-10 scale, rounded) and reading of each score band
+SCORE_BANDS = [
+    (9, "Highly Constructive"),
+    (7, "Mostly Constructive"),
+    (5, "Moderately Constructive"),
+    (3, "Somewhat Constructive"),
+    (1, "Not Very Constructive"),
+    (0, "Completely Unconstructive"),
+]
+
+## Stage 0 - sentences that already align with each component
+
+
+def gen_stage0_template(review_text):
+    out = [
+        {
+            "role": "system",
+            "content": "You are an expert at providing constructive feedback.",
+        },
+        {
+            "role": "user",
+            "content": f"""
+    The EMPATHY framework is a structured approach to crafting constructive peer reviews. It ensures that feedback is actionable, balanced, and professional while fostering growth and collaboration.
+
+    You are tasked with analyzing a peer review to identify sentences that already align well with the EMPATHY framework. Identify constructive phrases that demonstrate strong adherence to EMPATHY principles.
+
+    For each component, return only the sentences from the review that meet the criteria for constructive feedback.
+
+    ### Criteria for Constructive Sentences:
+    	1.	E (End Goal in Mind) - Sentences that align feedback with the journal's mission, expectations for rigor, and contribution. Feedback should encourage originality over replication and provide clear, actionable guidance tailored to the journal's audience.
+        2.	M (Developmental Mindset) - Sentences that balance critique with constructive suggestions, focus on improvement rather than flaw-finding, and encourage learning and growth without demanding perfection.
+        3.	P (Peruse the Paper Thoroughly) - Sentences that reflect deep engagement with the manuscript, connect different sections meaningfully, and provide a thorough, well-rounded evaluation rather than selective critique.
+        4.	A (Allocate Critique Resources Wisely) - Sentences that prioritize major concerns over minor issues, offer efficient and actionable revision guidance, and balance depth with practicality to help the author focus effectively.
+        5.	T (Tone: Avoid Toxicity, Be Professional) - Sentences that maintain a respectful, professional, and supportive tone, critique the work rather than the author, and avoid sarcasm, harshness, or unnecessary negativity.
+        6.	H (Holistic and Balanced Feedback) - Sentences that acknowledge both strengths and weaknesses, assess the manuscript fairly rather than fixating on flaws, and weigh contributions against limitations constructively.
+        7.	Y (Your Review as a Roadmap) - Sentences that provide structured, logically organized feedback with clear, actionable next steps, making it easy for the author to understand and implement revisions.
+
+    ### Task:  
+    Review the provided text and return only the sentences that demonstrate strong alignment with each EMPATHY component using the guidelines above.
+
+    Review Text:  
+    {review_text}
+
+    Output:  
+    - E: [List of constructive sentences]  
+    - M: [List of constructive sentences]  
+    - P: [List of constructive sentences]  
+    - A: [List of constructive sentences]  
+    - T: [List of constructive sentences]  
+    - H: [List of constructive sentences]  
+    - Y: [List of constructive sentences]  
+    """,
+        },
+    ]
+    return out
+
+
+## Stage 1 - sentences that need improvement under each component
+
+
+def gen_stage1_template(review_text):
+    out = [
+        {
+            "role": "system",
+            "content": "You are an expert at providing constructive feedback.",
+        },
+        {
+            "role": "user",
+            "content": f"""The EMPATHY framework is a structured approach to crafting constructive peer reviews. It focuses on offering actionable, balanced, and professional feedback to improve manuscripts while fostering growth and collaboration.
+
+    You are tasked with identifying phrases in a peer review that align poorly with the EMPATHY framework. For each component, highlight phrases that exhibit the following opportunities for improvement:
+
+    	1.	E (End Goal in Mind) - Identify sentences that fail to align feedback with the journal's mission, expectations for rigor, and emphasis on originality over replication. Look for instances where the review does not tailor feedback to the journal's standards, makes vague or unhelpful critiques, or does not clarify how the manuscript fits the journal's objectives.
+        2.	M (Developmental Mindset) - Identify sentences that focus on criticism without offering constructive suggestions, fail to acknowledge the author's efforts, or reflect an overly perfectionistic, dismissive, or rigid tone. Look for areas where the review does not support the paper's development but instead fixates on flaws without guiding improvement.
+        3.	P (Peruse the Paper Thoroughly) - Highlight sentences that indicate incomplete engagement with the manuscript, suggest the reviewer may not have read or understood the paper in its entirety, or overlook critical connections between sections. Look for instances where feedback is superficial, misinterprets the paper's core contribution, or critiques without considering the author's intended framework.
+        4.	A (Allocate Critique Resources Wisely) - Pinpoint sentences that overemphasize minor issues while neglecting major concerns, fail to prioritize key areas for revision, or impose unnecessary burdens on the author. Identify cases where the reviewer demands unrealistic changes, provides vague critiques without evidence, or disregards the feasibility of revisions within the study's scope.
+        5.	T (Tone: Avoid Toxicity, Be Professional) - Highlight sentences that are overly harsh, sarcastic, or unprofessional, and suggest where feedback could be reframed to focus on the research rather than making personal judgments about the authors. Look for instances where the tone discourages rather than supports the author's improvement.
+        6.	H (Holistic and Balanced Feedback) - Identify sentences that focus solely on weaknesses without acknowledging the manuscript's strengths, present an unfairly negative assessment, or fail to offer a fair evaluation of the paper's contributions. Look for reviews that do not recognize the manuscript's potential or neglect to provide balanced, constructive guidance.
+        7.	Y (Your Review as a Roadmap) - Highlight sentences where feedback lacks clear organization, actionable steps, or logical structure, making it difficult for authors to follow and implement suggestions. Look for reviews that present feedback in an unstructured, overwhelming, or incoherent manner rather than providing a clear path for revision.
+
+    Task:
+    Review the provided text and highlight sentences that align poorly with any of the components above. Return only the problematic phrases grouped by their respective components.
+
+    Review Text:
+    {review_text}
+
+    Output:
+    - E: [Highlighted sentences]
+    - M: [Highlighted sentences]
+    - P: [Highlighted sentences]
+    - A: [Highlighted sentences]
+    - T: [Highlighted sentences]
+    - H: [Highlighted sentences]
+    - Y: [Highlighted sentences]""",
+        },
+    ]
+    return out
+
+
+# structured output for stage 0 and 1: a list of sentences per component
+def sentences_response_format(name):
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": name,
+            "schema": {
+                "type": "object",
+                "properties": {
+                    component: {"type": "array", "items": {"type": "string"}}
+                    for component in COMPONENTS
+                },
+                "required": COMPONENTS,
+                "additionalProperties": False,
+            },
+            "strict": True,
+        },
+    }
+
+
+# number of distinct, non empty sentences listed for each component
+def count_sentences(sentences_by_component):
+    return {
+        component: len(
+            {
+                sent.strip()
+                for sent in sentences_by_component.get(component, [])
+                if sent.strip()
+            }
+        )
+        for component in COMPONENTS
+    }
+
+
+def classify_sentences(llm, review_text):
+    """
+    Run stage 0 and stage 1 on a review. The two calls are independent and are
+    sent concurrently.
+
+    Args:
+        llm (ResponseGenerator): The language model instance.
+        review_text (str): The text of the review.
+
+    Returns:
+        tuple: Constructive sentences (stage 0) and sentences needing
+        improvement (stage 1), each as a dict keyed by component.
+    """
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        constructive = executor.submit(
+            llm.generate_structured,
+            messages=gen_stage0_template(review_text),
+            response_format=sentences_response_format("constructive_sentences"),
+        )
+        needs_improvement = executor.submit(
+            llm.generate_structured,
+            messages=gen_stage1_template(review_text),
+            response_format=sentences_response_format("sentences_needing_improvement"),
+        )
+        return constructive.result(), needs_improvement.result()
+
+
+## Stage 2 - constructiveness score
+
+
+def constructiveness_scores(cs_counts, nis_counts, weights=None):
+    """
+    Compute the constructiveness scores of a batch of reviews in one vectorized
+    operation.
+
+    CS% of a component = # stage 0 / (# stage 0 + # stage 1) * 100 (0 when the
+    component has no sentences), the aggregate empathy score is the (weighted)
+    average of the CS% and the final score is the aggregate on a 10 point scale.
+
+    Args:
+        cs_counts (DataFrame): Number of constructive sentences (stage 0), one row
+            per review and one column per component (E, M, P, A, T, H, Y).
+        nis_counts (DataFrame): Number of sentences needing improvement (stage 1),
+            same layout as cs_counts.
+        weights (dict): Weight of each component in the aggregate. Defaults to
+            equal weights.
+
+    Returns:
+        DataFrame: CS_E ... CS_Y, empathy_score (0-100), final_score (0-10) and
+        its interpretation for each review.
+    """
+    cs_counts = pd.DataFrame(cs_counts)
+    cs = cs_counts[COMPONENTS].to_numpy(dtype=float)
+    nis = pd.DataFrame(nis_counts)[COMPONENTS].to_numpy(dtype=float)
+    total = cs + nis
+    scores = np.divide(cs * 100, total, out=np.zeros_like(cs), where=total > 0)
+
+    if weights is None:
+        component_weights = np.ones(len(COMPONENTS))
+    else:
+        component_weights = np.array(
+            [weights.get(c, 0.0) for c in COMPONENTS], dtype=float
+        )
+    if component_weights.sum() <= 0:
+        raise ValueError("Component weights must sum to a positive number.")
+    empathy_score = scores @ component_weights / component_weights.sum()
+    final_score = empathy_score / 10
+
+    result = pd.DataFrame(
+        scores, columns=[f"CS_{c}" for c in COMPONENTS], index=cs_counts.index
+    )
+    result["empathy_score"] = empathy_score
+    result["final_score"] = final_score
+    result["interpretation"] = interpret_scores(final_score)
+    return result
+
+
+# reading of final scores (0-10) -- see the README for the bands
+def interpret_scores(final_scores):
+    rounded = np.round(np.asarray(final_scores, dtype=float))
+    return np.select(
+        [rounded >= lower for lower, _ in SCORE_BANDS],
+        [label for _, label in SCORE_BANDS],
+        default=SCORE_BANDS[-1][1],
+    )
+
+
+def score_reviews(llm, review_texts, weights=None, max_workers=8):
+    """
+    Run stages 0 - 2 for several reviews: the LLM calls are sent concurrently and
+    the scores of all reviews are computed at once.
+
+    Args:
+        llm (ResponseGenerator): The language model instance.
+        review_texts (list): Texts of the reviews.
+        weights (dict): Weight of each component in the aggregate.
+        max_workers (int): Maximum number of reviews classified concurrently.
+
+    Returns:
+        DataFrame: Scores of each review (see constructiveness_scores), in the
+        order of review_texts.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        classified = list(
+            executor.map(lambda text: classify_sentences(llm, text), review_texts)
+        )
+    cs_counts = [count_sentences(constructive) for constructive, _ in classified]
+    nis_counts = [count_sentences(needs) for _, needs in classified]
+    return constructiveness_scores(cs_counts, nis_counts, weights=weights)
@@ -0,0 +1,160 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+
+# default location of the sessions (relative to where the app is started)
+SESSIONS_PATH = os.path.join(".cache", "sessions.sqlite")
+# sessions not updated for this long are deleted
+SESSION_TTL = 90 * 24 * 60 * 60
+
+
+class SessionStore:
+    def __init__(self, path=SESSIONS_PATH, ttl=SESSION_TTL):
+        """
+        Persistent review sessions: the uploaded document and the state of every
+        stage (diagnostics, texts, decisions), so that a review survives a browser
+        refresh or a restart of the app and can be resumed by its ID.
+
+        The state is stored as one row per entry -- a name of the state and a
+        field in it, e.g., ("diagnostics", "stage3") -- so a change only writes
+        the entries it touched, never the whole state.
+        Parameters:
+            path (str): Location of the SQLite database (":memory:" for no persistence).
+            ttl (float): Seconds after the last update a session is deleted (None
+                for never).
+        """
+        if path != ":memory:" and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.ttl = ttl
+        # a single connection shared by the threads of the app
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        # entries are deleted with their session
+        self._conn.execute("PRAGMA foreign_keys = ON")
+        with self._lock, self._conn:
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS sessions (
+                    id TEXT PRIMARY KEY,
+                    name TEXT,
+                    document BLOB,
+                    created REAL NOT NULL,
+                    updated REAL NOT NULL
+                )"""
+            )
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS entries (
+                    session TEXT NOT NULL REFERENCES sessions (id) ON DELETE CASCADE,
+                    name TEXT NOT NULL,
+                    field TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    PRIMARY KEY (session, name, field)
+                )"""
+            )
+            if self.ttl is not None:
+                self._conn.execute(
+                    "DELETE FROM sessions WHERE updated < ?", (time.time() - self.ttl,)
+                )
+
+    def create(self, name=None, document=None):
+        """
+        Start a session.
+        Parameters:
+            name (str): Name of the reviewed document.
+            document (bytes): The uploaded document, kept to resume the download.
+        Returns:
+            str: The ID of the session.
+        """
+        session_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO sessions VALUES (?, ?, ?, ?, ?)",
+                (session_id, name, document, now, now),
+            )
+        return session_id
+
+    def save(self, session_id, entries):
+        """
+        Write entries of a session, in one transaction.
+        Parameters:
+            session_id (str): ID returned by create.
+            entries (list): (name, field, value) of each entry; value is JSON
+                serializable, None deletes the entry and a field of None with a
+                value of None deletes all entries of the name.
+        """
+        with self._lock, self._conn:
+            for name, field, value in entries:
+                if value is not None:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)",
+                        (session_id, name, field, json.dumps(value)),
+                    )
+                elif field is None:
+                    self._conn.execute(
+                        "DELETE FROM entries WHERE session = ? AND name = ?",
+                        (session_id, name),
+                    )
+                else:
+                    self._conn.execute(
+                        "DELETE FROM entries WHERE session = ? AND name = ? AND field = ?",
+                        (session_id, name, field),
+                    )
+            self._conn.execute(
+                "UPDATE sessions SET updated = ? WHERE id = ?",
+                (time.time(), session_id),
+            )
+
+    def load(self, session_id):
+        """
+        Read the state of a session.
+        Parameters:
+            session_id (str): ID returned by create.
+        Returns:
+            dict: {name: {field: value}} of the entries, or None if there is no
+                such session.
+        """
+        with self._lock:
+            if not self._exists(session_id):
+                return None
+            rows = self._conn.execute(
+                "SELECT name, field, value FROM entries WHERE session = ?",
+                (session_id,),
+            ).fetchall()
+        state = {}
+        for name, field, value in rows:
+            state.setdefault(name, {})[field] = json.loads(value)
+        return state
+
+    def _exists(self, session_id):
+        # with self._lock held
+        row = self._conn.execute(
+            "SELECT 1 FROM sessions WHERE id = ?", (session_id,)
+        ).fetchone()
+        return row is not None
+
+    def exists(self, session_id):
+        with self._lock:
+            return self._exists(session_id)
+
+    def document(self, session_id):
+        # (name, bytes) of the document of a session, (None, None) if there is none
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT name, document FROM sessions WHERE id = ?", (session_id,)
+            ).fetchone()
+        return tuple(row) if row is not None else (None, None)
+
+    def sessions(self, limit=20):
+        # (id, name, updated) of the most recently updated sessions
+        with self._lock:
+            return self._conn.execute(
+                "SELECT id, name, updated FROM sessions ORDER BY updated DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+
+    def delete(self, session_id):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
@@ -0,0 +1,39 @@
+import os
+import sys
+
+import pytest
+
+
+# the app modules are imported as top-level modules, as when the app runs
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class FlaggingLLM:
+    # stands in for ResponseGenerator: flags the given sentences (as the model
+    # returns them) or else the first sentence of every text, each suggestion
+    # replacing "is" by "was"; the analysed texts are recorded
+    def __init__(self, sentences=None):
+        self.sentences = sentences
+        self.texts = []
+
+    def generate_response(self, review_text, component_input, base_input):
+        self.texts.append(review_text)
+        sentences = self.sentences
+        if sentences is None:
+            sentences = [review_text.split(". ")[0].rstrip(".") + "."]
+        return [
+            {
+                "trait": "Be Specific",
+                "comment": "Vague.",
+                "sentences_needing_improvement": list(sentences),
+                "suggested_improvement": [
+                    sentence.replace(" is ", " was ") for sentence in sentences
+                ],
+            }
+        ]
+
+
+@pytest.fixture
+def flagging_llm():
+    # FlaggingLLM(sentences=None)
+    return FlaggingLLM
@@ -0,0 +1,39 @@
+import metrics
+from analysis import diagnose
+
+TRAIT_DEFINITIONS = {"e_component": "1. Be Specific: Offer concrete suggestions."}
+
+
+def unmatched_count():
+    return sum(
+        counter["value"]
+        for counter in metrics.snapshot()["counters"]
+        if counter["name"] == "unmatched_sentences"
+    )
+
+
+def test_sentences_missing_from_the_text_are_counted():
+    before = unmatched_count()
+    diagnostics = diagnose(
+        llm=None,
+        improvements=[
+            {
+                "trait": "Be Specific",
+                "comment": "Vague.",
+                "sentences_needing_improvement": [
+                    "The method is unclear.",
+                    "Completely unrelated words about gardening tools.",
+                ],
+                "suggested_improvement": [
+                    "The method section lacks the sample size.",
+                    "Something else.",
+                ],
+            }
+        ],
+        review_text="The paper is nice. The method is unclear. I like the data.",
+        trait_definitions=TRAIT_DEFINITIONS,
+        component_name="e_component",
+    )
+
+    assert diagnostics["sent_list"] == ["The method is unclear."]
+    assert unmatched_count() - before == 1
@@ -0,0 +1,100 @@
+import pytest
+
+from diagnostics import Diagnostic, deduplicate_and_clean
+from helper import (
+    apply_decisions,
+    rebase_diagnostics,
+    resolve_edit_spans,
+    suggestion_id,
+)
+
+
+def test_decision_ids_survive_rebasing():
+    diagnostics = {
+        "traits_list": ["A", "B", "C"],
+        "comments_list": ["a", "b", "c"],
+        "suggestions_list": ["One was improved.", "Two was improved.", "Three."],
+        "sent_list": ["One is weak.", "Two is weak.", "Three is weak."],
+    }
+    ids = [
+        suggestion_id(sentence, suggestion)
+        for sentence, suggestion in zip(
+            diagnostics["sent_list"], diagnostics["suggestions_list"]
+        )
+    ]
+    # an earlier stage rewrote the first sentence: its suggestion is dropped
+    rebased = rebase_diagnostics(
+        diagnostics, "One was improved. Two is weak. Three is weak."
+    )
+    rebased_ids = [
+        suggestion_id(sentence, suggestion)
+        for sentence, suggestion in zip(
+            rebased["sent_list"], rebased["suggestions_list"]
+        )
+    ]
+    assert rebased["sent_list"] == ["Two is weak.", "Three is weak."]
+    assert rebased_ids == ids[1:]
+    assert len(set(ids)) == len(ids)
+
+
+def test_pairs_differing_only_by_markers_are_repeats():
+    diagnostics = deduplicate_and_clean(
+        [
+            Diagnostic("A", "c", "X is weak.", "<<X is strong.>>"),
+            Diagnostic("B", "c", "X is weak.", "X is strong."),
+        ]
+    )
+    assert diagnostics == [Diagnostic("B", "c", "X is weak.", "X is strong.")]
+
+
+def accept(sentence, suggestion):
+    return {"decision": "accept", "sentence": sentence, "suggestion": suggestion}
+
+
+def test_repeated_sentence_is_rewritten_once_per_accepted_decision():
+    text = "It is good. The data is weak. It is good. The end."
+    updated, annotated = apply_decisions(text, [accept("It is good.", "It is fine.")])
+    assert updated == "It is fine. The data is weak. It is good. The end."
+    assert annotated == "<<It is fine.>> The data is weak. It is good. The end."
+
+    updated, _ = apply_decisions(
+        text,
+        [accept("It is good.", "It is fine."), accept("It is good.", "It works.")],
+    )
+    assert updated == "It is fine. The data is weak. It works. The end."
+
+
+def test_rejected_and_missing_sentences_leave_the_text_unchanged():
+    text = "It is good. The data is weak."
+    decisions = [
+        {"decision": "reject", "sentence": "It is good.", "suggestion": "No."},
+        accept("This sentence is not in the text.", "Nothing to replace."),
+        accept("", "Empty."),
+    ]
+    assert resolve_edit_spans(text, decisions) == []
+    assert apply_decisions(text, decisions) == (text, text)
+
+
+def test_spans_are_sorted_by_position():
+    text = "It is good. The data is weak. The end."
+    spans = resolve_edit_spans(
+        text, [accept("The end.", "Fin."), accept("It is good.", "Fine.")]
+    )
+    assert [(start, end) for start, end, _ in spans] == [(0, 11), (30, 38)]
+    updated, _ = apply_decisions(
+        text, [accept("The end.", "Fin."), accept("It is good.", "Fine.")]
+    )
+    assert updated == "Fine. The data is weak. Fin."
+
+
+def test_overlapping_edits_are_rejected():
+    text = "It is good. The data is weak. The end."
+    decisions = [
+        accept("The data is weak.", "The data is thin."),
+        # a partial sentence of the LLM inside the one above
+        accept("data is weak", "data are thin"),
+    ]
+    with pytest.raises(ValueError, match="overlap"):
+        resolve_edit_spans(text, decisions)
+    with pytest.raises(ValueError):
+        apply_decisions(text, decisions)
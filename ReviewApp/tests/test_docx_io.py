@@ -0,0 +1,102 @@
+import io
+import tracemalloc
+import zipfile
+
+from docx_io import DOCUMENT_XML, _paragraph_texts, read_docx, write_docx
+from helper import apply_decisions
+
+NAMESPACE = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+
+
+def paragraph(text):
+    return f"<w:p><w:r><w:t>{text}</w:t></w:r></w:p>"
+
+
+def table(*cells):
+    return "<w:tbl><w:tr>{}</w:tr></w:tbl>".format(
+        "".join(f"<w:tc>{paragraph(cell)}</w:tc>" for cell in cells)
+    )
+
+
+def make_docx(blocks):
+    # a minimal .docx archive whose body holds the given XML blocks
+    document = (
+        f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        f'<w:document xmlns:w="{NAMESPACE}"><w:body>{"".join(blocks)}'
+        f"<w:sectPr/></w:body></w:document>"
+    )
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        archive.writestr("[Content_Types].xml", "<Types/>")
+        archive.writestr(DOCUMENT_XML, document)
+    buffer.seek(0)
+    return buffer
+
+
+def test_paragraphs_and_tables_are_read_in_order():
+    source = make_docx(
+        [paragraph("First one."), table("In a cell.", "Another cell."), paragraph("")]
+        + [paragraph("Last one.")]
+    )
+    docx_text = read_docx(source)
+    assert docx_text.text == "First one.\n\nIn a cell.\n\nAnother cell.\n\nLast one."
+    assert docx_text.paragraph_ids == [0, 1, 2, 4]
+
+
+def peak_memory(source):
+    tracemalloc.start()
+    for _ in _paragraph_texts(source):
+        pass
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def test_memory_does_not_grow_with_the_document():
+    block = [paragraph("A sentence of the review."), table("A cell.")]
+    small = peak_memory(make_docx(block * 500))
+    large = peak_memory(make_docx(block * 5000))
+    # ten times the paragraphs, about the same memory
+    assert large < 2 * small
+
+
+def test_write_docx_only_changes_the_accepted_sentences():
+    bold = (
+        "<w:p><w:r><w:rPr><w:b/></w:rPr><w:t>The method is unclear.</w:t></w:r>"
+        '<w:r><w:t xml:space="preserve"> I like the data.</w:t></w:r></w:p>'
+    )
+    source = make_docx(
+        [paragraph("The paper is nice."), bold, table("A cell.", "Other cell.")]
+    )
+    docx_text = read_docx(source)
+    updated_text, _ = apply_decisions(
+        docx_text.text,
+        [
+            {
+                "decision": "accept",
+                "sentence": "The method is unclear.",
+                "suggestion": "The method lacks the sample size.",
+            },
+            {
+                "decision": "accept",
+                "sentence": "Other cell.",
+                "suggestion": "A revised cell.",
+            },
+        ],
+    )
+    out = io.BytesIO()
+    write_docx(source, docx_text, updated_text, out)
+
+    out.seek(0)
+    updated = read_docx(out)
+    assert updated.text == updated_text
+    assert updated.paragraph_ids == docx_text.paragraph_ids
+    with zipfile.ZipFile(out) as archive:
+        assert archive.namelist() == ["[Content_Types].xml", DOCUMENT_XML]
+        document = archive.read(DOCUMENT_XML).decode()
+    # unchanged paragraphs are copied, the table and the formatting are kept
+    assert "<w:t>The paper is nice.</w:t>" in document
+    assert "<w:t>A cell.</w:t>" in document
+    assert document.count("<w:tbl>") == 1
+    assert "<w:rPr><w:b></w:b></w:rPr>" in document
+    assert "The method is unclear." not in document
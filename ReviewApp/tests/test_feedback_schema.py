@@ -0,0 +1,103 @@
+import json
+
+import pytest
+
+from feedback_schema import (
+    MalformedResponse,
+    check_improvement,
+    parse_improvements,
+    parse_multi_improvements,
+)
+
+IMPROVEMENT = {
+    "trait": "Be Specific",
+    "comment": "Vague.",
+    "sentences_needing_improvement": ["The discussion is weak."],
+    "suggested_improvement": ["The discussion could add implications."],
+}
+
+
+def test_multi_response_with_every_component():
+    content = json.dumps({"e_component": [IMPROVEMENT], "m_component": []})
+    assert parse_multi_improvements(content, ["e_component", "m_component"]) == {
+        "e_component": [IMPROVEMENT],
+        "m_component": [],
+    }
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        # a component asked for is missing
+        {"e_component": [IMPROVEMENT]},
+        # a component that was not asked for
+        {"e_component": [], "m_component": [], "x_component": []},
+        {"e_component": [], "x_component": []},
+    ],
+)
+def test_multi_response_with_other_components_is_malformed(data):
+    with pytest.raises(MalformedResponse):
+        parse_multi_improvements(json.dumps(data), ["e_component", "m_component"])
+
+
+def test_valid_improvement_is_returned_as_is():
+    assert check_improvement(IMPROVEMENT) is IMPROVEMENT
+    content = json.dumps({"improvements": [IMPROVEMENT]})
+    assert parse_improvements(content) == [IMPROVEMENT]
+
+
+def test_extra_fields_are_dropped_from_a_copy():
+    entry = dict(IMPROVEMENT, confidence=0.9)
+    checked = check_improvement(entry)
+    assert checked == IMPROVEMENT
+    assert checked is not entry
+    # the entry itself is not mutated
+    assert entry["confidence"] == 0.9
+    content = json.dumps({"improvements": [entry, IMPROVEMENT]})
+    assert parse_improvements(content) == [IMPROVEMENT, IMPROVEMENT]
+
+
+@pytest.mark.parametrize(
+    "field, value",
+    [
+        ("trait", 1),
+        ("comment", None),
+        ("comment", ["Vague."]),
+        ("sentences_needing_improvement", "The discussion is weak."),
+        ("suggested_improvement", {"0": "The discussion could add implications."}),
+    ],
+)
+def test_wrong_types_are_malformed(field, value):
+    entry = dict(IMPROVEMENT, **{field: value})
+    with pytest.raises(MalformedResponse, match="must be strings"):
+        check_improvement(entry)
+    with pytest.raises(MalformedResponse, match=r"improvements\[1\]"):
+        parse_improvements(json.dumps({"improvements": [IMPROVEMENT, entry]}))
+
+
+def test_missing_field_is_named():
+    entry = {key: value for key, value in IMPROVEMENT.items() if key != "comment"}
+    with pytest.raises(MalformedResponse, match="no 'comment' field"):
+        check_improvement(entry)
+
+
+@pytest.mark.parametrize("entry", ["Be Specific", 3, None, [IMPROVEMENT]])
+def test_non_object_entries_are_malformed(entry):
+    with pytest.raises(MalformedResponse, match="not an object"):
+        check_improvement(entry)
+    with pytest.raises(MalformedResponse, match="not an object"):
+        parse_improvements(json.dumps({"improvements": [entry]}))
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        "not json",
+        json.dumps([IMPROVEMENT]),
+        json.dumps({"feedback": [IMPROVEMENT]}),
+        json.dumps({"improvements": IMPROVEMENT}),
+    ],
+)
+def test_malformed_responses(content):
+    with pytest.raises(MalformedResponse):
+        parse_improvements(content)
@@ -0,0 +1,77 @@
+from helper import apply_decisions
+from incremental import EXCERPT_SEPARATOR, analyze_stage_incremental
+
+TRAIT_DEFINITIONS = {"e_component": "1. Be Specific: Offer concrete suggestions."}
+
+
+def sentences(count, changed=()):
+    return " ".join(
+        f"Sentence number {idx} is {'changed' if idx in changed else 'here'}."
+        for idx in range(count)
+    )
+
+
+def test_sentence_after_separator_is_located_in_the_text(flagging_llm):
+    previous_text = sentences(30)
+    # two changed regions far apart: two windows joined by the separator, the
+    # second one starting with "Sentence number 11 is here."
+    review_text = sentences(30, changed={5, 13})
+    llm = flagging_llm(["Sentence number 11 is here."])
+
+    diagnostics = analyze_stage_incremental(
+        llm=llm,
+        review_text=review_text,
+        previous_text=previous_text,
+        previous_diagnostics={
+            "traits_list": [],
+            "comments_list": [],
+            "suggestions_list": [],
+            "sent_list": [],
+        },
+        component_input=[],
+        base_input=[],
+        trait_definitions=TRAIT_DEFINITIONS,
+        component_name="e_component",
+    )
+
+    assert EXCERPT_SEPARATOR in llm.texts[0]
+    assert diagnostics["sent_list"] == ["Sentence number 11 is here."]
+    updated, _ = apply_decisions(
+        review_text,
+        [
+            {
+                "decision": "accept",
+                "sentence": diagnostics["sent_list"][0],
+                "suggestion": diagnostics["suggestions_list"][0],
+            }
+        ],
+    )
+    assert "Sentence number 11 was here." in updated
+    assert "Sentence number 11 is here." not in updated
+
+
+def test_kept_and_fresh_suggestions_are_not_repeated(flagging_llm):
+    previous_text = sentences(30)
+    review_text = sentences(30, changed={5})
+    # flagged before, and again in the new response
+    repeated = "Sentence number 25 is here."
+    llm = flagging_llm([repeated])
+
+    diagnostics = analyze_stage_incremental(
+        llm=llm,
+        review_text=review_text,
+        previous_text=previous_text,
+        previous_diagnostics={
+            "traits_list": ["Be Specific"],
+            "comments_list": ["Vague."],
+            "suggestions_list": ["<<Sentence number 25 was here.>>"],
+            "sent_list": [repeated],
+        },
+        component_input=[],
+        base_input=[],
+        trait_definitions=TRAIT_DEFINITIONS,
+        component_name="e_component",
+    )
+
+    assert diagnostics["sent_list"] == [repeated]
+    assert diagnostics["suggestions_list"] == ["Sentence number 25 was here."]
@@ -0,0 +1,134 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from mock_server import make_server
+from backends import get_shared_client
+from response_gen import AsyncResponseGenerator, ResponseGenerator
+from scheduler import RateLimitScheduler
+
+# long enough (over 1024 tokens) for the mock server to report it as cached
+BASE_INPUT = [{"role": "system", "content": "You review documents. " * 250}]
+COMPONENT_INPUT = [{"role": "user", "content": "Focus on specificity."}]
+
+
+@pytest.fixture
+def server():
+    server = make_server(port=0, latency=0.1)
+    in_flight = {"now": 0, "max": 0}
+    lock = threading.Lock()
+
+    class CountingHandler(server.RequestHandlerClass):
+        def do_POST(self):
+            with lock:
+                in_flight["now"] += 1
+                in_flight["max"] = max(in_flight["max"], in_flight["now"])
+            try:
+                super().do_POST()
+            finally:
+                with lock:
+                    in_flight["now"] -= 1
+
+    server.RequestHandlerClass = CountingHandler
+    server.in_flight = in_flight
+    server.base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_concurrent_requests_share_the_pooled_client(server):
+    llm = ResponseGenerator(
+        api_key="mock",
+        openai_client=get_shared_client(api_key="mock", base_url=server.base_url),
+        scheduler=RateLimitScheduler(),
+    )
+    reviews = [f"Review number {i}." for i in range(8)]
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(
+            executor.map(
+                lambda text: llm.generate_response(text, COMPONENT_INPUT, BASE_INPUT),
+                reviews,
+            )
+        )
+
+    assert all(result and "trait" in result[0] for result in results)
+    assert llm.usage.stats()["calls"] == len(reviews)
+    # the requests overlapped instead of queuing on a single connection
+    assert server.in_flight["max"] > 1
+
+
+def test_async_generator_respects_max_concurrency(server):
+    llm = AsyncResponseGenerator(
+        api_key="mock",
+        base_url=server.base_url,
+        max_concurrency=2,
+        scheduler=RateLimitScheduler(),
+    )
+
+    async def run():
+        return await asyncio.gather(
+            *[
+                llm.generate_response(
+                    f"Review number {i}.", COMPONENT_INPUT, BASE_INPUT
+                )
+                for i in range(6)
+            ]
+        )
+
+    results = asyncio.run(run())
+
+    assert len(results) == 6
+    assert 1 < server.in_flight["max"] <= 2
+    # the requests went through the rate-limit scheduler
+    assert llm.scheduler.stats()["requests"] == 6
+    assert llm.usage.stats()["calls"] == 6
+
+
+def test_async_generator_streams_and_batches_components(server):
+    llm = AsyncResponseGenerator(
+        api_key="mock", base_url=server.base_url, scheduler=RateLimitScheduler()
+    )
+
+    async def run():
+        streamed = [
+            improvement
+            async for improvement in llm.stream_response(
+                "A streamed review.", COMPONENT_INPUT, BASE_INPUT
+            )
+        ]
+        grouped = await llm.generate_responses(
+            "A grouped review.",
+            {"e_component": COMPONENT_INPUT, "m_component": COMPONENT_INPUT},
+            BASE_INPUT,
+        )
+        return streamed, grouped
+
+    streamed, grouped = asyncio.run(run())
+
+    assert streamed and "trait" in streamed[0]
+    assert set(grouped) == {"e_component", "m_component"}
+    assert grouped["e_component"] == grouped["m_component"]
+    # the streamed response reports its usage too
+    stats = llm.usage.stats()
+    assert stats["calls"] == 3
+    assert stats["completion_tokens"] > 0
+    assert llm.scheduler.stats()["requests"] == 3
+
+
+def test_repeated_prefix_is_reported_as_cached(server):
+    llm = ResponseGenerator(
+        api_key="mock",
+        openai_client=get_shared_client(api_key="mock", base_url=server.base_url),
+        scheduler=RateLimitScheduler(),
+    )
+    llm.generate_response("First review.", COMPONENT_INPUT, BASE_INPUT)
+    assert llm.usage.stats()["cached_tokens"] == 0
+
+    llm.generate_response("Second review.", COMPONENT_INPUT, BASE_INPUT)
+    stats = llm.usage.stats()
+    assert stats["calls"] == 2
+    assert 0 < stats["cached_tokens"] < stats["prompt_tokens"]
@@ -0,0 +1,137 @@
+import asyncio
+import random
+import threading
+import time
+
+import pytest
+from openai import RateLimitError
+
+from mock_server import make_server
+from backends import get_shared_client
+from response_gen import ResponseGenerator
+from scheduler import DeadlineExceeded, RateLimitScheduler
+
+BASE_INPUT = [{"role": "system", "content": "You review documents."}]
+COMPONENT_INPUT = [{"role": "user", "content": "Focus on specificity."}]
+
+
+def start_server(**options):
+    server = make_server(port=0, **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+@pytest.fixture
+def flaky_server():
+    # half of the requests are throttled, with a short retry-after
+    server, base_url = start_server(error_rate=0.5, retry_after=0.01)
+    yield base_url
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def throttled_server():
+    # every request is throttled
+    server, base_url = start_server(error_rate=1.0, retry_after=0.05)
+    yield base_url
+    server.shutdown()
+    server.server_close()
+
+
+def test_throttled_calls_eventually_succeed(flaky_server):
+    random.seed(0)
+    scheduler = RateLimitScheduler(max_retries=20, base_delay=0.01, max_delay=0.05)
+    llm = ResponseGenerator(
+        api_key="mock",
+        openai_client=get_shared_client(api_key="mock", base_url=flaky_server),
+        scheduler=scheduler,
+    )
+    results = [
+        llm.generate_response(f"Review number {i}.", COMPONENT_INPUT, BASE_INPUT)
+        for i in range(10)
+    ]
+
+    assert all(result and "trait" in result[0] for result in results)
+    stats = scheduler.stats()
+    assert stats["retries"] > 0
+    assert stats["rate_limited"] > 0
+    assert stats["requests"] == 10 + stats["retries"]
+    assert stats["failed"] == 0
+
+
+def test_missed_deadline_raises_instead_of_retrying(throttled_server):
+    scheduler = RateLimitScheduler(max_retries=1000, base_delay=0.01, max_delay=0.05)
+    client = get_shared_client(api_key="mock", base_url=throttled_server)
+    # retries are left to the scheduler, as in OpenAIBackend
+    client = client.with_options(max_retries=0)
+
+    def request(timeout):
+        return client.chat.completions.create(
+            model="gpt-4o", messages=BASE_INPUT, timeout=timeout
+        )
+
+    start = time.monotonic()
+    with pytest.raises((RateLimitError, DeadlineExceeded)):
+        scheduler.call(request, tokens=100, timeout=0.5)
+
+    assert time.monotonic() - start < 2.0
+    stats = scheduler.stats()
+    assert stats["rate_limited"] > 0
+    assert stats["failed"] + stats["deadline_exceeded"] == 1
+
+
+def test_deadline_in_the_queue():
+    # the bucket is empty: the call cannot be admitted before its deadline
+    scheduler = RateLimitScheduler(requests_per_minute=1)
+    scheduler.call(lambda timeout: "first", tokens=1)
+
+    with pytest.raises(DeadlineExceeded):
+        scheduler.call(lambda timeout: "second", tokens=1, timeout=0.1)
+    assert scheduler.stats()["deadline_exceeded"] == 1
+
+
+def test_waiting_async_calls_hold_no_threads():
+    # 100 tokens per second: the two first calls empty the bucket
+    scheduler = RateLimitScheduler(tokens_per_minute=6000)
+
+    async def request(timeout):
+        return "done"
+
+    async def run():
+        await scheduler.acall(request, tokens=3000)
+        await scheduler.acall(request, tokens=3000)
+        threads = threading.active_count()
+        waiting = [
+            asyncio.create_task(scheduler.acall(request, tokens=1)) for _ in range(50)
+        ]
+        await asyncio.sleep(0.05)
+        assert scheduler.stats()["queue_depth"] > 40
+        assert threading.active_count() == threads
+        return await asyncio.gather(*waiting)
+
+    assert asyncio.run(run()) == ["done"] * 50
+    assert scheduler.stats()["requests"] == 52
+
+
+def test_cancelled_async_call_leaves_the_queue():
+    scheduler = RateLimitScheduler(requests_per_minute=1)
+
+    async def request(timeout):
+        return "done"
+
+    async def run():
+        await scheduler.acall(request, tokens=1)
+        waiting = asyncio.create_task(scheduler.acall(request, tokens=1))
+        await asyncio.sleep(0.05)
+        assert scheduler.stats()["queue_depth"] == 1
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+
+    asyncio.run(run())
+    stats = scheduler.stats()
+    assert stats["queue_depth"] == 0
+    assert stats["requests"] == 1
+    # the cancelled call did not take the token that is refilling
+    assert scheduler.requests.level > 0
@@ -0,0 +1,22 @@
+from helper import read_secrets
+
+
+def test_secrets_file_is_parsed_leniently(tmp_path, monkeypatch):
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    path = tmp_path / "secretkey.txt"
+    path.write_text("API_KEY = sk-abc==\n\nno value here\nMETRICS_PORT=9100\n")
+
+    secrets = read_secrets(str(path))
+
+    assert secrets["API_KEY"] == "sk-abc=="
+    assert secrets["METRICS_PORT"] == "9100"
+    assert secrets["no value here"] == ""
+
+
+def test_api_key_falls_back_to_the_environment(tmp_path, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-env")
+    path = tmp_path / "secretkey.txt"
+    path.write_text("LOCAL_MODEL=model.gguf\n")
+
+    assert read_secrets(str(path))["API_KEY"] == "sk-env"
+    assert read_secrets(str(tmp_path / "missing.txt")) == {"API_KEY": "sk-env"}
@@ -0,0 +1,58 @@
+from pipeline import StagePipeline
+from sessions import SessionStore
+
+
+TRAIT_DEFINITIONS = {
+    f"{letter}_component": "1. Be Specific: Offer concrete suggestions."
+    for letter in "empathy"
+}
+
+
+def new_pipeline(store, llm, state=None):
+    return StagePipeline(
+        state={} if state is None else state,
+        llm=llm,
+        base_input=[],
+        trait_definitions=TRAIT_DEFINITIONS,
+        store=store,
+    )
+
+
+def test_session_is_restored_without_llm_calls(flagging_llm):
+    store = SessionStore(":memory:")
+    pipeline = new_pipeline(store, flagging_llm())
+    pipeline.set_document("The discussion is weak. The data are fine.")
+    session_id = pipeline.start_session(name="review.docx", document=b"docx")
+    diagnostics = pipeline.run("stage1")
+    pipeline.choose("stage1_pill", "Run this stage")
+    pipeline.choose("dec_stage1_1", "Accept")
+
+    restored = new_pipeline(store, llm=None)
+    assert restored.restore(session_id)
+    assert restored.has_diagnostics("stage1")
+    assert restored.run("stage1") == diagnostics
+    assert restored.state["choices"] == {
+        "stage1_pill": "Run this stage",
+        "dec_stage1_1": "Accept",
+    }
+    assert store.document(session_id) == ("review.docx", b"docx")
+
+
+def test_new_document_does_not_carry_the_previous_review(flagging_llm):
+    store = SessionStore(":memory:")
+    pipeline = new_pipeline(store, flagging_llm())
+    pipeline.set_document("The discussion is weak. The data are fine.")
+    first = pipeline.start_session()
+    pipeline.run("stage1")
+    pipeline.choose("dec_stage1_1", "Accept")
+
+    pipeline.set_document("The method is unclear. The figures are nice.")
+    second = pipeline.start_session()
+
+    saved = store.load(second)
+    assert "choices" not in saved
+    assert "diagnostics" not in saved
+    assert "analyzed_text" not in saved
+    assert saved["rtext"] == {"": "The method is unclear. The figures are nice."}
+    # the first review is unchanged
+    assert store.load(first)["choices"] == {"dec_stage1_1": "Accept"}
@@ -0,0 +1,120 @@
+import json
+import random
+
+import pytest
+
+from backends import ChatBackend, Completion, Usage
+from feedback_schema import MalformedResponse
+from response_gen import ImprovementStreamParser, ResponseGenerator
+
+IMPROVEMENTS = [
+    {
+        "trait": "Be Specific",
+        "comment": 'The sentence says "it is fine} ]" without saying why.',
+        "sentences_needing_improvement": ["It is fine."],
+        "suggested_improvement": ["It is fine because the data {n=40} is new."],
+    },
+    {
+        "trait": "Be Clear",
+        "comment": 'A backslash \\ and a quote \\" inside a string.',
+        "sentences_needing_improvement": ["See [1] and {2}."],
+        "suggested_improvement": ["See the references [1] and {2} — both."],
+    },
+    {
+        "trait": "Be Kind",
+        "comment": "",
+        "sentences_needing_improvement": [],
+        "suggested_improvement": [],
+    },
+]
+RESPONSE = json.dumps({"improvements": IMPROVEMENTS}, indent=1)
+
+
+def parse(chunks):
+    parser = ImprovementStreamParser()
+    improvements = []
+    for chunk in chunks:
+        improvements += parser.feed(chunk)
+    return parser, improvements
+
+
+def split_at(text, cuts):
+    cuts = [0] + sorted(cuts) + [len(text)]
+    return [text[start:end] for start, end in zip(cuts, cuts[1:])]
+
+
+def test_every_split_gives_the_same_improvements():
+    for size in range(1, 40):
+        chunks = [RESPONSE[i : i + size] for i in range(0, len(RESPONSE), size)]
+        parser, improvements = parse(chunks)
+        assert improvements == IMPROVEMENTS
+        parser.close()
+    rng = random.Random(0)
+    for _ in range(200):
+        cuts = rng.sample(range(1, len(RESPONSE)), rng.randint(1, 30))
+        assert parse(split_at(RESPONSE, cuts))[1] == IMPROVEMENTS
+
+
+def test_improvements_are_returned_once_complete():
+    end_of_first = RESPONSE.index("Be Clear")
+    parser, improvements = parse([RESPONSE[:end_of_first]])
+    assert improvements == IMPROVEMENTS[:1]
+    assert parser.feed(RESPONSE[end_of_first:]) == IMPROVEMENTS[1:]
+
+
+def test_truncated_stream_is_rejected():
+    cut = RESPONSE.index("Be Kind")
+    parser, improvements = parse([RESPONSE[:cut]])
+    # the improvements received in full are still returned
+    assert improvements == IMPROVEMENTS[:2]
+    with pytest.raises(MalformedResponse):
+        parser.close()
+    with pytest.raises(MalformedResponse):
+        ImprovementStreamParser().close()
+
+
+def test_invalid_entry_is_rejected():
+    parser = ImprovementStreamParser()
+    with pytest.raises(MalformedResponse):
+        parser.feed('{"improvements": [{"trait": 1}]}')
+
+
+class StreamingBackend(ChatBackend):
+    # streams a response in small pieces, the usage in a last empty piece
+    model = "streaming"
+
+    def __init__(self, content):
+        self.content = content
+
+    def complete(self, messages, response_format, max_tokens):
+        return Completion(self.content, Usage(100, 40))
+
+    def stream(self, messages, response_format, max_tokens):
+        for start in range(0, len(self.content), 7):
+            yield Completion(self.content[start : start + 7], None)
+        yield Completion("", Usage(100, 40))
+
+
+def test_streamed_usage_is_reported():
+    llm = ResponseGenerator(backend=StreamingBackend(RESPONSE))
+    improvements = list(llm.stream_response("It is fine.", [], []))
+
+    assert improvements == IMPROVEMENTS
+    stats = llm.usage.stats()
+    assert stats["calls"] == 1
+    assert stats["prompt_tokens"] == 100
+    assert stats["completion_tokens"] == 40
+
+
+def test_truncated_stream_is_not_cached(tmp_path):
+    from llm_cache import DiagnosticsCache
+
+    cache = DiagnosticsCache(path=str(tmp_path / "cache.sqlite"))
+    llm = ResponseGenerator(
+        backend=StreamingBackend(RESPONSE[: RESPONSE.index("Be Kind")]), cache=cache
+    )
+    with pytest.raises(MalformedResponse):
+        list(llm.stream_response("It is fine.", [], []))
+
+    llm.backend.content = RESPONSE
+    assert list(llm.stream_response("It is fine.", [], [])) == IMPROVEMENTS
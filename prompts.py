@@ -9,107 +9,8 @@ openai_client = OpenAI(api_key=credentials["openai_api_key"])
 ##
 
 
-def gen_stage0_template(review_text):
-    out = [
-        {
-            "role": "system",
-            "content": "You are an expert at providing constructive feedback.",
-        },
-        {
-            "role": "user",
-            "content": f"""
-    The EMPATHY framework is a structured approach to crafting constructive peer reviews. It ensures that feedback is actionable, balanced, and professional while fostering growth and collaboration.
-
-    You are tasked with analyzing a peer review to identify sentences that already align well with the EMPATHY framework. Identify constructive phrases that demonstrate strong adherence to EMPATHY principles.
-
-    For each component, return only the sentences from the review that meet the criteria for constructive feedback.
-
-    ### Criteria for Constructive Sentences:
-    	1.	E (End Goal in Mind) - Sentences that align feedback with the journal's mission, expectations for rigor, and contribution. Feedback should encourage originality over replication and provide clear, actionable guidance tailored to the journal's audience.
-        2.	M (Developmental Mindset) - Sentences that balance critique with constructive suggestions, focus on improvement rather than flaw-finding, and encourage learning and growth without demanding perfection.
-        3.	P (Peruse the Paper Thoroughly) - Sentences that reflect deep engagement with the manuscript, connect different sections meaningfully, and provide a thorough, well-rounded evaluation rather than selective critique.
-        4.	A (Allocate Critique Resources Wisely) - Sentences that prioritize major concerns over minor issues, offer efficient and actionable revision guidance, and balance depth with practicality to help the author focus effectively.
-        5.	T (Tone: Avoid Toxicity, Be Professional) - Sentences that maintain a respectful, professional, and supportive tone, critique the work rather than the author, and avoid sarcasm, harshness, or unnecessary negativity.
-        6.	H (Holistic and Balanced Feedback) - Sentences that acknowledge both strengths and weaknesses, assess the manuscript fairly rather than fixating on flaws, and weigh contributions against limitations constructively.
-        7.	Y (Your Review as a Roadmap) - Sentences that provide structured, logically organized feedback with clear, actionable next steps, making it easy for the author to understand and implement revisions.
-
-    ### Task:  
-    Review the provided text and return only the sentences that demonstrate strong alignment with each EMPATHY component using the guidelines above.
-
-    Review Text:  
-    {review_text}
-
-    Output:  
-    - E: [List of constructive sentences]  
-    - M: [List of constructive sentences]  
-    - P: [List of constructive sentences]  
-    - A: [List of constructive sentences]  
-    - T: [List of constructive sentences]  
-    - H: [List of constructive sentences]  
-    - Y: [List of constructive sentences]  
-    """,
-        },
-    ]
-    return out
-
-
-def gen_stage1_template(review_text):
-    out = [
-        {
-            "role": "system",
-            "content": "You are an expert at providing constructive feedback.",
-        },
-        {
-            "role": "user",
-            "content": f"""The EMPATHY framework is a structured approach to crafting constructive peer reviews. It focuses on offering actionable, balanced, and professional feedback to improve manuscripts while fostering growth and collaboration.
-
-    You are tasked with identifying phrases in a peer review that align poorly with the EMPATHY framework. For each component, highlight phrases that exhibit the following opportunities for improvement:
-
-    	1.	E (End Goal in Mind) - Identify sentences that fail to align feedback with the journal's mission, expectations for rigor, and emphasis on originality over replication. Look for instances where the review does not tailor feedback to the journal's standards, makes vague or unhelpful critiques, or does not clarify how the manuscript fits the journal's objectives.
-        2.	M (Developmental Mindset) - Identify sentences that focus on criticism without offering constructive suggestions, fail to acknowledge the author's efforts, or reflect an overly perfectionistic, dismissive, or rigid tone. Look for areas where the review does not support the paper's development but instead fixates on flaws without guiding improvement.
-        3.	P (Peruse the Paper Thoroughly) - Highlight sentences that indicate incomplete engagement with the manuscript, suggest the reviewer may not have read or understood the paper in its entirety, or overlook critical connections between sections. Look for instances where feedback is superficial, misinterprets the paper's core contribution, or critiques without considering the author's intended framework.
-        4.	A (Allocate Critique Resources Wisely) - Pinpoint sentences that overemphasize minor issues while neglecting major concerns, fail to prioritize key areas for revision, or impose unnecessary burdens on the author. Identify cases where the reviewer demands unrealistic changes, provides vague critiques without evidence, or disregards the feasibility of revisions within the study's scope.
-        5.	T (Tone: Avoid Toxicity, Be Professional) - Highlight sentences that are overly harsh, sarcastic, or unprofessional, and suggest where feedback could be reframed to focus on the research rather than making personal judgments about the authors. Look for instances where the tone discourages rather than supports the author's improvement.
-        6.	H (Holistic and Balanced Feedback) - Identify sentences that focus solely on weaknesses without acknowledging the manuscript's strengths, present an unfairly negative assessment, or fail to offer a fair evaluation of the paper's contributions. Look for reviews that do not recognize the manuscript's potential or neglect to provide balanced, constructive guidance.
-        7.	Y (Your Review as a Roadmap) - Highlight sentences where feedback lacks clear organization, actionable steps, or logical structure, making it difficult for authors to follow and implement suggestions. Look for reviews that present feedback in an unstructured, overwhelming, or incoherent manner rather than providing a clear path for revision.
-
-    Task:
-    Review the provided text and highlight sentences that align poorly with any of the components above. Return only the problematic phrases grouped by their respective components.
-
-    Review Text:
-    {review_text}
-
-    Output:
-    - E: [Highlighted sentences]
-    - M: [Highlighted sentences]
-    - P: [Highlighted sentences]
-    - A: [Highlighted sentences]
-    - T: [Highlighted sentences]
-    - H: [Highlighted sentences]
-    - Y: [Highlighted sentences]""",
-        },
-    ]
-    return out
-
-
-## Stage 2
-
-cs_counts = {}
-nis_counts = {}
-
-# Calculate Constructiveness Score (CS%) for each component
-constructiveness_scores = {}
-for component in cs_counts.keys():
-    total = cs_counts[component] + nis_counts[component]
-    constructiveness_scores[component] = (
-        (cs_counts[component] / total) * 100 if total > 0 else 0
-    )
-
-# Compute overall EMPATHY Score (average of all component scores)
-empathy_score = sum(constructiveness_scores.values()) / len(constructiveness_scores)
-
-# Convert to 0-10 scale
-final_constructiveness_score = empathy_score / 10
+## Stage 0 - 2 (sentences already constructive, sentences needing improvement
+## and the constructiveness score) are implemented in ReviewApp/scoring.py
 
 ## Stage 3
 